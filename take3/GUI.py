@@ -1,7 +1,5 @@
 import tkinter as tk
-import requests
-import threading
-import time
+from gui_client import ServerClient
 
 class AudioVisualizerGUI:
     def __init__(self, root):
@@ -15,6 +13,7 @@ class AudioVisualizerGUI:
         self.energy_level = tk.StringVar(value="No Sound")
         self.is_beat_drop = tk.StringVar(value="No")
         self.colors = ["#FFFFFF", "#FFFFFF", "#FFFFFF", "#FFFFFF"]
+        self.client = ServerClient(root)  # Requests run on a worker thread, see gui_client.py
 
         # IP Address Input
         tk.Label(root, text="Webserver IP:").grid(row=0, column=0, padx=10, pady=5, sticky="w")
@@ -68,37 +67,52 @@ class AudioVisualizerGUI:
 
     def update_gui(self):
         if hasattr(self, 'server_url'):
-            try:
-                response = requests.get(self.server_url)
-                data = response.json()
-                self.spotify_bpm.set(data['spotify_bpm'])
-                self.volume_level.set(data['volume_level'])
-                self.energy_level.set("High" if data['energy_level'] == 3 else "Medium" if data['energy_level'] == 2 else "Low" if data['energy_level'] == 1 else "No Sound")
-                self.is_beat_drop.set("Yes" if data['is_beat_drop'] else "No")
-                for i, color_picker in enumerate(self.color_pickers):
-                    color_picker.delete(0, tk.END)
-                    color_picker.insert(0, data['colors'][i])
-            except Exception as e:
-                self.status_label.config(text=f"Error: {e}")
+            self.client.get(self.server_url, self.apply_status)  # Replaces a poll that hasn't gone out yet
 
         self.root.after(1000, self.update_gui)
 
+    def apply_status(self, data, error, latency_ms):
+        if error is not None:
+            self.status_label.config(text=f"Error: {error}")
+            return
+        try:
+            self.spotify_bpm.set(data['spotify_bpm'])
+            self.volume_level.set(data['volume_level'])
+            self.energy_level.set("High" if data['energy_level'] == 3 else "Medium" if data['energy_level'] == 2 else "Low" if data['energy_level'] == 1 else "No Sound")
+            self.is_beat_drop.set("Yes" if data['is_beat_drop'] else "No")
+            for i, color_picker in enumerate(self.color_pickers):
+                color_picker.delete(0, tk.END)
+                color_picker.insert(0, data['colors'][i])
+        except (KeyError, IndexError, TypeError) as e:
+            self.status_label.config(text=f"Error: unexpected status {e}")
+            return
+        self.status_label.config(text=f"Connected to server at {self.server_ip.get()} ({latency_ms:.0f} ms)")
+
+    def post_result(self, data, error, latency_ms):
+        if error is not None:
+            self.status_label.config(text=f"Error: {error}")
+        else:
+            self.status_label.config(text=f"Sent ({latency_ms:.0f} ms)")
+
+    def set_color_mode(self, payload):
+        self.client.post(f"http://{self.server_ip.get()}/set-color", payload, self.post_result)
+
     def set_colors(self):
         colors = [picker.get() for picker in self.color_pickers]
         payload = {"mode": "static", "colors": colors}
-        requests.post(f"http://{self.server_ip.get()}/set-color", json=payload)
+        self.set_color_mode(payload)
 
     def set_full_spectrum(self):
-        requests.post(f"http://{self.server_ip.get()}/set-color", json={"mode": "full_spectrum"})
+        self.set_color_mode({"mode": "full_spectrum"})
 
     def set_rave(self):
-        requests.post(f"http://{self.server_ip.get()}/set-color", json={"mode": "rave"})
+        self.set_color_mode({"mode": "rave"})
 
     def set_halloween(self):
-        requests.post(f"http://{self.server_ip.get()}/set-color", json={"mode": "halloween"})
+        self.set_color_mode({"mode": "halloween"})
 
     def set_boiler_room(self):
-        requests.post(f"http://{self.server_ip.get()}/set-color", json={"mode": "boiler_room"})
+        self.set_color_mode({"mode": "boiler_room"})
 
 if __name__ == "__main__":
     root = tk.Tk()
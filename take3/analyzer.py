@@ -0,0 +1,120 @@
+import time
+import numpy as np
+from collections import deque
+from filterbank import BandpassFilterBank, DEFAULT_BANDS
+from spectral import SpectralAnalyzer
+from beat_tracker import BeatTracker
+from fingerprint import FingerprintIndex, StreamingFingerprinter
+from metrics import CALLBACK_BUCKETS
+
+# Layout of the analysis snapshot (see snapshot.py)
+ANALYSIS_FIELDS = [
+    ('timestamp', 'd'),
+    ('volume_level', 'f'),
+    ('is_beat_drop', 'i'),  # 0 = No Beat Drop, 1 = Beat Drop
+    ('energy_level', 'i'),  # -1 = No Sound, 0 = No Energy, 1 = Low Energy, 2 = Normal Energy, 3 = High Energy
+    ('beat_drop_timestamp', 'd'),  # Timestamp of the last detected beat drop
+    ('last_high_energy_time', 'd'),  # Timestamp of the last detected high energy
+    ('band_levels', '%df' % len(DEFAULT_BANDS)),  # Per-band RMS (sub-bass, bass, mids, highs)
+    ('band_energies', '%df' % len(DEFAULT_BANDS)),  # Per-band FFT energy, same bands
+    ('spectral_centroid', 'f'),  # Hz
+    ('spectral_flux', 'f'),
+    ('spectral_rolloff', 'f'),  # Hz
+    ('local_bpm', 'f'),  # Tempo from the on-device beat tracker, 0 until estimated
+    ('beat_phase', 'f'),  # 0.0 on the beat, rising towards 1.0
+    ('beat_count', 'Q'),  # Increments once per detected beat
+    ('fingerprint_track', 'I'),  # 1 + index of the identified track in the fingerprint index, 0 = unknown
+    ('fingerprint_started_at', 'd'),  # When the identified track started
+]
+
+# Layout of the capture statistics snapshot
+AUDIO_STATS_FIELDS = [
+    ('chunks', 'Q'),  # Chunks analysed so far
+    ('input_overflows', 'Q'),  # sounddevice reported input overflow
+    ('ring_overruns', 'Q'),  # Chunks overwritten in the ring before the analyzer read them
+    ('late_callbacks', 'Q'),  # Callbacks that took longer than one chunk period
+    ('max_callback_ms', 'f'),
+    ('chunk_histogram', '%dQ' % (len(CALLBACK_BUCKETS) + 1)),  # Capture + analysis time per chunk (see metrics.py)
+    ('chunk_seconds_sum', 'd'),
+]
+
+
+class AudioAnalyzer:
+    """Turns mono audio chunks into volume, energy and beat drop results.
+
+    All state lives here so the same analysis can run in the audio callback
+    thread or in a separate process reading from a ring buffer.
+    """
+
+    def __init__(self, shared_state, rate, chunk, fingerprint_index=None):
+        self.shared_state = shared_state
+        self.last_volume_levels = deque(maxlen=int(rate / chunk))  # Store volume levels for the last second
+        self.filter_bank = BandpassFilterBank(rate, chunk)  # Keeps filter state between chunks
+        self.spectral = SpectralAnalyzer(rate, chunk)
+        self.beat_tracker = BeatTracker(rate, chunk)
+        # Track identification from the same FFT frames (fingerprint_index is a path, see fingerprint.py)
+        self.fingerprinter = None
+        if fingerprint_index is not None:
+            self.fingerprinter = StreamingFingerprinter(FingerprintIndex.load(fingerprint_index), rate, chunk)
+        self.beat_drop_timestamp = 0.0
+        self.last_high_energy_time = 0.0
+
+    def process(self, audio_data, current_time=None):
+        if current_time is None:
+            current_time = time.time()
+
+        volume = np.mean(np.abs(audio_data)) * 2
+        levels = self.filter_bank.band_energies(audio_data)
+        spectral = self.spectral.process(audio_data)
+        beats = self.beat_tracker.process(spectral.flux, current_time)
+        if self.fingerprinter is not None:
+            match = self.fingerprinter.process(spectral.magnitude, current_time).result  # Published by its worker
+            fingerprint_track = 0 if match is None else match[0] + 1
+            fingerprint_started_at = 0.0 if match is None else match[1]
+        else:
+            fingerprint_track, fingerprint_started_at = 0, 0.0
+
+        self.last_volume_levels.append(volume)
+        avg_last_volume = np.mean(self.last_volume_levels)
+
+        time_since_last_beat_drop = current_time - self.beat_drop_timestamp
+
+        if (volume - avg_last_volume > 0.3) and volume > 0.35 and time_since_last_beat_drop >= 10:
+            is_beat_drop = 1
+            self.beat_drop_timestamp = current_time
+        elif time_since_last_beat_drop <= 1:
+            is_beat_drop = 1
+        else:
+            is_beat_drop = 0
+
+        if volume > 0.30:
+            energy_level = 3
+            self.last_high_energy_time = current_time
+        elif volume > 0.20:
+            energy_level = 2
+        elif volume > 0.10:
+            energy_level = 1
+        elif volume > 0.01:
+            energy_level = 0
+        else:
+            energy_level = -1  # No sound
+
+        # One write per chunk, readers never see a half-updated state
+        self.shared_state.publish(
+            timestamp=current_time,
+            volume_level=volume,
+            is_beat_drop=is_beat_drop,
+            energy_level=energy_level,
+            beat_drop_timestamp=self.beat_drop_timestamp,
+            last_high_energy_time=self.last_high_energy_time,
+            band_levels=levels,
+            band_energies=spectral.band_energies,
+            spectral_centroid=spectral.centroid,
+            spectral_flux=spectral.flux,
+            spectral_rolloff=spectral.rolloff,
+            local_bpm=beats.bpm,
+            beat_phase=beats.beat_phase,
+            beat_count=beats.beat_count,
+            fingerprint_track=fingerprint_track,
+            fingerprint_started_at=fingerprint_started_at,
+        )
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import threading
+import time
+from http import HTTPStatus
+from status_stream import SEND_TIMEOUT, event_stream_headers
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT = 30.0  # Close keep-alive connections idle for this long
+
+
+class Headers(dict):
+    """Request headers with case-insensitive get()."""
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+class Request:
+    def __init__(self, method, path, query, version, headers, body, client=None):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers
+        self.body = body
+        self.client = client  # Peer IP address
+
+    def keep_alive(self):
+        connection = (self.headers.get('Connection') or '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+class EventStream:
+    """Returned by a handler to turn the connection into an SSE stream.
+
+    source needs an `interval` attribute and a poll() method returning bytes
+    or None (see status_stream.StatusEventSource).
+    """
+
+    def __init__(self, source):
+        self.source = source
+
+
+class AsyncHTTPServer:
+    """Small HTTP/1.1 server on a single asyncio event loop.
+
+    handler(request) returns (status, headers, body) or an EventStream. It
+    runs on the event loop, so it must not block. Connections are kept alive
+    between requests, so pollers don't pay a TCP handshake per request.
+    observer(request, status, seconds), if given, is called after each
+    response is written (seconds is None for event streams).
+    """
+
+    def __init__(self, handler, host='0.0.0.0', port=8080, observer=None):
+        self.handler = handler
+        self.observer = observer
+        self.host = host
+        self.port = port
+        self.server = None
+        self.connections = 0
+        self.requests = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                 limit=MAX_HEADER_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else None
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader, client), IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:
+                    await self._write_response(writer, 400, [('Content-type', 'text/plain')], str(e).encode(), False)
+                    break
+                if request is None:
+                    break
+
+                self.requests += 1
+                started = time.perf_counter()
+                keep_alive = request.keep_alive()
+                try:
+                    result = self.handler(request)
+                except Exception as e:
+                    print(f"Error handling {request.method} {request.path}: {e}")
+                    result = (500, [('Content-type', 'text/plain')], b'Internal server error')
+
+                if isinstance(result, EventStream):
+                    if self.observer is not None:
+                        self.observer(request, 200, None)
+                    await self._stream_events(writer, result.source)
+                    break
+
+                status, headers, body = result
+                await self._write_response(writer, status, headers, body, keep_alive)
+                if self.observer is not None:
+                    self.observer(request, status, time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader, client=None):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise ValueError("Request header too large")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None  # Client closed an idle keep-alive connection
+            raise
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise ValueError("Malformed request line")
+
+        headers = Headers()
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        body = await reader.readexactly(length) if length else b''
+
+        path, _, query = target.partition('?')
+        return Request(method, path, query, version, headers, body, client)
+
+    async def _write_response(self, writer, status, headers, body, keep_alive):
+        reason = HTTPStatus(status).phrase
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if status != 304:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _stream_events(self, writer, source):
+        lines = ["HTTP/1.1 200 OK"]
+        lines.extend(f"{name}: {value}" for name, value in event_stream_headers())
+        lines.append("Connection: close")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        loop = asyncio.get_running_loop()
+        next_frame = loop.time()
+        try:
+            await writer.drain()
+            while not writer.is_closing():
+                data = source.poll()
+                if data:
+                    writer.write(data)
+                    # Backpressure: a client that can't take one event in time is dropped
+                    await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+
+                next_frame += source.interval
+                delay = next_frame - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    next_frame = loop.time()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+
+def json_response(payload, status=200):
+    return status, [('Content-type', 'application/json')], json.dumps(payload).encode()
+
+
+def run_in_thread(server):
+    """Start an AsyncHTTPServer on its own event loop in a daemon thread."""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5.0
+    while server.server is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return thread
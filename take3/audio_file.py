@@ -0,0 +1,36 @@
+import numpy as np
+from math import gcd
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+try:
+    import soundfile  # Optional: FLAC/OGG/etc. Plain WAV works without it
+except ImportError:
+    soundfile = None
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.aiff', '.aif') if soundfile else ('.wav',)
+
+
+def load_audio(path, rate):
+    """Read an audio file as mono float32 in -1..1, resampled to rate."""
+    if soundfile is not None:
+        data, file_rate = soundfile.read(path, dtype='float32', always_2d=True)
+    else:
+        file_rate, data = wavfile.read(path)
+        if data.dtype.kind == 'i':
+            data = data / float(np.iinfo(data.dtype).max)
+        elif data.dtype == np.uint8:
+            data = (data - 128.0) / 128.0
+        data = data.reshape(len(data), -1)
+
+    mono = data.mean(axis=1).astype(np.float32)
+    if file_rate != rate:
+        divisor = gcd(int(file_rate), int(rate))
+        mono = resample_poly(mono, rate // divisor, file_rate // divisor).astype(np.float32)
+    return mono
+
+
+def iter_chunks(samples, chunk):
+    """Consecutive full chunks of samples, the way the input stream delivers them."""
+    for start in range(0, len(samples) - chunk + 1, chunk):
+        yield samples[start:start + chunk]
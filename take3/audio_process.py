@@ -0,0 +1,132 @@
+import time
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from analyzer import AudioAnalyzer
+from metrics import Histogram, CALLBACK_BUCKETS
+
+# Ring header slots (uint64), all written by the capture callback only
+WRITE_COUNT = 0
+INPUT_OVERFLOWS = 1
+LATE_CALLBACKS = 2
+MAX_CALLBACK_NS = 3
+HEADER_SLOTS = 8
+
+
+class FrameRing:
+    """Single-producer ring of mono float32 audio chunks in shared memory.
+
+    The capture callback copies each chunk into the next slot and bumps the
+    write counter; the reader keeps its own read counter and can tell from
+    the difference whether chunks were overwritten before it got to them.
+    """
+
+    def __init__(self, chunk, slots=64, name=None, create=True):
+        self.chunk = chunk
+        self.slots = slots
+        header_bytes = HEADER_SLOTS * 8
+        size = header_bytes + slots * chunk * 4
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self._owner = create
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=self._shm.buf)
+        self.frames = np.ndarray((slots, chunk), dtype=np.float32, buffer=self._shm.buf, offset=header_bytes)
+        if create:
+            self.header[:] = 0
+
+    def __getstate__(self):
+        return {'chunk': self.chunk, 'slots': self.slots, 'name': self._shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['chunk'], state['slots'], name=state['name'], create=False)
+
+    def write(self, indata):
+        """Mix indata down to mono into the next slot (called from the audio callback)."""
+        count = int(self.header[WRITE_COUNT])
+        slot = self.frames[count % self.slots]
+        frames = min(len(indata), self.chunk)
+        np.mean(indata[:frames], axis=1, out=slot[:frames])
+        slot[frames:] = 0.0
+        self.header[WRITE_COUNT] = count + 1
+
+    def read(self, index):
+        return self.frames[index % self.slots]
+
+    def write_count(self):
+        return int(self.header[WRITE_COUNT])
+
+    def close(self):
+        del self.header, self.frames
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _capture_and_analyze(shared_state, stats_state, ring, rate, channels, device, stop_event, fingerprint_index=None):
+    """Entry point of the audio process: capture into the ring and analyse from it."""
+    import sounddevice as sd
+
+    period_ns = int(ring.chunk / rate * 1e9)
+    header = ring.header
+
+    def audio_callback(indata, frames, time_info, status):
+        start = time.perf_counter_ns()
+        if status.input_overflow:
+            header[INPUT_OVERFLOWS] += 1
+        ring.write(indata)
+        elapsed = time.perf_counter_ns() - start
+        if elapsed > period_ns:
+            header[LATE_CALLBACKS] += 1
+        if elapsed > header[MAX_CALLBACK_NS]:
+            header[MAX_CALLBACK_NS] = elapsed
+
+    analyzer = AudioAnalyzer(shared_state, rate, ring.chunk, fingerprint_index)
+    read_count = 0
+    ring_overruns = 0
+    chunk_histogram = Histogram(CALLBACK_BUCKETS)  # Analysis time per chunk (the callback only copies)
+    poll_interval = ring.chunk / rate / 4
+
+    with sd.InputStream(samplerate=rate, channels=channels, device=device, blocksize=ring.chunk,
+                        dtype='float32', callback=audio_callback):
+        while not stop_event.is_set():
+            write_count = ring.write_count()
+            if write_count == read_count:
+                time.sleep(poll_interval)
+                continue
+
+            # Skip chunks the callback has already overwritten
+            if write_count - read_count > ring.slots:
+                ring_overruns += write_count - read_count - ring.slots
+                read_count = write_count - ring.slots
+
+            while read_count < write_count:
+                start = time.perf_counter()
+                analyzer.process(ring.read(read_count))
+                chunk_histogram.observe(time.perf_counter() - start)
+                read_count += 1
+
+            stats_state.publish(
+                chunks=read_count,
+                input_overflows=int(header[INPUT_OVERFLOWS]),
+                ring_overruns=ring_overruns,
+                late_callbacks=int(header[LATE_CALLBACKS]),
+                max_callback_ms=int(header[MAX_CALLBACK_NS]) / 1e6,
+                chunk_histogram=chunk_histogram.counts,
+                chunk_seconds_sum=chunk_histogram.sum,
+            )
+
+
+def start_audio_process(shared_state, stats_state, rate, chunk, channels, device, slots=64, fingerprint_index=None):
+    """Run capture plus analysis in its own process.
+
+    Results are published through shared_state/stats_state, so nothing in the
+    main process changes. Returns (process, ring, stop_event).
+    """
+    ring = FrameRing(chunk, slots)
+    stop_event = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=_capture_and_analyze,
+        args=(shared_state, stats_state, ring, rate, channels, device, stop_event, fingerprint_index),
+        daemon=True,
+    )
+    process.start()
+    return process, ring, stop_event
@@ -0,0 +1,172 @@
+import math
+import numpy as np
+
+ONSET_COMPRESSION = 100.0  # log1p(C * onset) before autocorrelation
+HALF_LAG_RATIO = 0.5  # Autocorrelation at half the lag, relative to the pick, that makes it the beat
+REFINE_BEATS = 4  # Tempo is refined from the autocorrelation peak this many beats out
+
+
+class BeatTracker:
+    """Local tempo and beat phase from spectral-flux onsets.
+
+    Every chunk pushes one onset strength value into a rolling window. A few
+    times per second the tempo is re-estimated from the autocorrelation of
+    that window and the beat phase from a comb over it; between estimates
+    beats are predicted from the last anchor, so beat_count ticks with chunk
+    resolution instead of waiting for the next estimate.
+    """
+
+    def __init__(self, rate, chunk, window_seconds=8.0, min_bpm=55.0, max_bpm=190.0,
+                 preferred_bpm=120.0, update_seconds=0.5, smoothing_seconds=0.02):
+        self.frame_rate = rate / chunk
+        self.size = int(window_seconds * self.frame_rate)
+        self.onsets = np.zeros(self.size)
+        self._ordered = np.zeros(self.size)
+        self.count = 0
+
+        self.min_lag = max(1, int(self.frame_rate * 60.0 / max_bpm))
+        self.max_lag = int(math.ceil(self.frame_rate * 60.0 / min_bpm))
+        self._update_frames = max(1, int(update_seconds * self.frame_rate))
+        self._fft_size = 1 << (2 * self.size - 1).bit_length()
+
+        # Gaussian smoothing of the onset envelope, applied in the FFT. A beat period is rarely
+        # a whole number of frames, so without it the autocorrelation peak at the beat splits
+        # over two lags and loses to the (whole-numbered) peak at two beats
+        sigma = max(smoothing_seconds * self.frame_rate, 0.5)
+        cycles = np.fft.rfftfreq(self._fft_size)
+        self._smoothing = np.exp(-(2.0 * np.pi * sigma * cycles) ** 2)
+
+        # Log-Gaussian tempo prior around preferred_bpm to avoid half/double tempo picks
+        lags = np.arange(self.min_lag, self.max_lag + 1)
+        lag_bpm = 60.0 * self.frame_rate / lags
+        self._prior = np.exp(-0.5 * (np.log2(lag_bpm / preferred_bpm) / 0.9) ** 2)
+
+        self.bpm = 0.0
+        self.period = 0.0  # Seconds per beat, 0 until the first estimate
+        self.last_beat = 0.0
+        self.next_beat = 0.0
+        self.beat_phase = 0.0  # 0.0 on the beat, rising towards 1.0
+        self.beat_count = 0
+
+    def reset(self):
+        self.onsets[:] = 0.0
+        self.count = 0
+        self.bpm = 0.0
+        self.period = 0.0
+        self.beat_phase = 0.0
+
+    def process(self, onset_strength, current_time):
+        """Add one chunk's onset strength and advance the beat clock."""
+        self.onsets[self.count % self.size] = onset_strength
+        self.count += 1
+
+        if self.count >= 2 * self.max_lag and self.count % self._update_frames == 0:
+            self._estimate(current_time)
+
+        if self.period > 0.0:
+            while current_time >= self.next_beat:
+                self.beat_count += 1
+                self.last_beat = self.next_beat
+                self.next_beat += self.period
+            self.beat_phase = min(max((current_time - self.last_beat) / self.period, 0.0), 0.999)
+        return self
+
+    def _estimate(self, current_time):
+        n = min(self.count, self.size)
+        start = self.count % self.size if self.count >= self.size else 0
+        env = self._ordered[:n]
+        head = self.size - start if self.count >= self.size else n
+        env[:head] = self.onsets[start:start + head]
+        env[head:] = self.onsets[:n - head]
+
+        env -= env.mean()
+        np.maximum(env, 0.0, out=env)
+        if not env.any():
+            return
+        # Log compression: onsets that straddle two chunks come out weaker, and that
+        # strong/weak pattern would otherwise favour multiples of the beat
+        env /= env.max()
+        np.log1p(ONSET_COMPRESSION * env, out=env)
+
+        # Autocorrelation through the FFT, restricted to the allowed tempo range
+        spectrum = np.fft.rfft(env, self._fft_size)
+        acf = np.fft.irfft(spectrum * spectrum.conj() * self._smoothing, self._fft_size)[:max(n // 2, self.max_lag + 2)]
+        if acf[0] <= 0.0:
+            return
+        scores = acf[self.min_lag:self.max_lag + 1] * self._prior
+        best = int(np.argmax(scores))
+        if scores[best] <= 0.0:
+            return
+        best += self.min_lag
+
+        # Harmonic check: a clear peak at half the lag means the pick was two beats, not one
+        half = int(round(best / 2.0))
+        if half - 1 >= self.min_lag:
+            candidate = half - 1 + int(np.argmax(acf[half - 1:half + 2]))
+            if acf[candidate] >= HALF_LAG_RATIO * acf[best]:
+                best = candidate
+
+        # Sub-frame tempo: parabolic interpolation at the furthest multiple of the lag that
+        # fits (up to REFINE_BEATS beats), which divides the interpolation error by that multiple
+        lag = float(best)
+        for beats in range(REFINE_BEATS, 0, -1):
+            peak = int(round(lag * beats))
+            if peak + 2 < len(acf):
+                peak += int(np.argmax(acf[peak - 1:peak + 2])) - 1
+                a, b, c = acf[peak - 1], acf[peak], acf[peak + 1]
+                denominator = a - 2 * b + c
+                offset = 0.5 * (a - c) / denominator if denominator < 0.0 else 0.0
+                lag = (peak + min(max(offset, -0.5), 0.5)) / beats
+                break
+
+        # Phase: which offset from the newest frame lines up with the most onsets
+        offsets = np.arange(int(math.ceil(lag)))
+        steps = np.arange(0.0, n, lag)
+        positions = np.rint(n - 1 - offsets[:, None] - steps[None, :]).astype(np.intp)
+        valid = positions >= 0
+        phase_scores = np.where(valid, env[np.clip(positions, 0, n - 1)], 0.0).sum(axis=1)
+        offset = int(np.argmax(phase_scores))
+
+        period = lag / self.frame_rate
+        anchor = current_time - offset / self.frame_rate
+        next_beat = anchor + period * math.ceil((current_time - anchor) / period + 1e-9)
+        # Don't count the same beat twice when the anchor moves slightly
+        if self.period > 0.0 and next_beat - self.last_beat < 0.5 * period:
+            next_beat += period
+        if self.period == 0.0:
+            self.last_beat = next_beat - period
+
+        self.period = period
+        self.bpm = 60.0 / period
+        self.next_beat = next_beat
+
+
+# Click tracks across the tempo range through the live path (SpectralAnalyzer flux -> BeatTracker)
+def _click_track_check(tempos=range(60, 185, 5), chunks=(512, 1024, 2048), rate=44100, seconds=20.0,
+                       tolerance=0.02):
+    from spectral import SpectralAnalyzer
+
+    rng = np.random.default_rng(0)
+    noise = 0.01 * rng.standard_normal(int(seconds * rate))
+    click = np.sin(2 * np.pi * 1000.0 * np.arange(400) / rate) * np.exp(-np.arange(400) / 80.0)
+    failures = []
+    for bpm in tempos:
+        signal = noise.copy()
+        for start in (np.arange(0.0, seconds, 60.0 / bpm) * rate).astype(int):
+            end = min(start + len(click), len(signal))
+            signal[start:end] += click[:end - start]
+        for chunk in chunks:
+            spectral = SpectralAnalyzer(rate, chunk)
+            tracker = BeatTracker(rate, chunk)
+            for i in range(len(signal) // chunk):
+                tracker.process(spectral.process(signal[i * chunk:(i + 1) * chunk]).flux, i * chunk / rate)
+            if abs(tracker.bpm - bpm) > tolerance * bpm:
+                failures.append((bpm, chunk, tracker.bpm))
+    for bpm, chunk, estimate in failures:
+        print(f"{bpm} BPM (chunk {chunk}): estimated {estimate:.2f}")
+    print(f"{len(tempos) * len(chunks) - len(failures)}/{len(tempos) * len(chunks)} click tracks within {tolerance:.0%}")
+    return not failures
+
+
+if __name__ == '__main__':
+    print("Beat tracker OK" if _click_track_check() else "Beat tracker FAILED")
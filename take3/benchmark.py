@@ -0,0 +1,300 @@
+"""Headless benchmarks for the analysis, color and /status hot paths.
+
+    python benchmark.py                          # Everything, summary on stdout
+    python benchmark.py --quick -o bench.json    # Shorter runs, results as JSON
+    python benchmark.py --compare old.json       # Flag results that got slower
+
+Uses synthetic audio and in-process servers, so it needs no sound device,
+display or network. Each benchmark mirrors the code path in take3.py:
+the audio_callback body, one render-loop frame of the color pipeline,
+the scalar color helpers and /status through StatusCache on both servers.
+"""
+import argparse
+import json
+import platform
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Array, Value
+import numpy as np
+from analyzer import AudioAnalyzer, ANALYSIS_FIELDS, AUDIO_STATS_FIELDS
+from async_server import AsyncHTTPServer, run_in_thread
+from color_engine import ColorEngine, ColorRenderer, RAVE, hsv_to_rgb, hsv_to_rgb_array, interpolate_color
+from load_test import load_test
+from snapshot import SharedSnapshot
+from status_cache import StatusCache
+
+RATE = 44100
+CHUNK_SIZES = [256, 512, 1024, 2048, 4096]
+CHANNEL_COUNTS = [1, 2, 8]
+STRIP_COUNTS = [4, 16, 64, 256, 1024]
+STATUS_CLIENTS = [1, 10, 50]
+REGRESSION_THRESHOLD = 0.15  # --compare flags timings more than 15% worse
+
+
+def synthetic_audio(seconds, channels, rate=RATE, seed=0):
+    """Kick drum at 128 BPM over noise and a few tones, with a louder second half (a drop)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    signal = 0.05 * rng.standard_normal(len(t))
+    for freq in (220.0, 440.0, 1760.0):
+        signal += 0.03 * np.sin(2 * np.pi * freq * t)
+    beat = 60.0 / 128.0
+    phase = t % beat
+    signal += 0.4 * np.sin(2 * np.pi * 55.0 * phase) * np.exp(-phase * 30.0)
+    signal[len(t) // 2:] *= 2.5
+    return np.repeat(signal[:, None], channels, axis=1).astype(np.float32)
+
+
+def _timings(samples):
+    ms = np.asarray(samples) * 1000.0
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+
+def bench_audio_callback(seconds):
+    """Per-chunk cost of the audio_callback body (downmix, analysis, stats publish)."""
+    results = []
+    for channels in CHANNEL_COUNTS:
+        audio = synthetic_audio(seconds, channels)
+        for chunk in CHUNK_SIZES:
+            state = SharedSnapshot(ANALYSIS_FIELDS)
+            stats_state = SharedSnapshot(AUDIO_STATS_FIELDS)
+            try:
+                analyzer = AudioAnalyzer(state, RATE, chunk)
+                stats = {'chunks': 0}
+                count = len(audio) // chunk
+                samples = np.zeros(count)
+                clock = time.time()
+                for i in range(count):
+                    indata = audio[i * chunk:(i + 1) * chunk]
+                    start = time.perf_counter()
+                    analyzer.process(np.mean(indata, axis=1), current_time=clock + i * chunk / RATE)
+                    stats['chunks'] += 1
+                    stats_state.publish(**stats)
+                    samples[i] = time.perf_counter() - start
+            finally:
+                state.close()
+                stats_state.close()
+            budget = chunk / RATE
+            result = {'chunk': chunk, 'channels': channels, 'chunks': count, 'budget_ms': budget * 1000.0,
+                      'late_chunks': int(np.count_nonzero(samples > budget))}
+            result.update(_timings(samples[8:]))  # Skip warm-up chunks
+            results.append(result)
+    return results
+
+
+def bench_color_frames(frames):
+    """Cost of one render-loop frame of the color pipeline, with a transition starting every 10 frames."""
+    results = []
+    for strips in STRIP_COUNTS:
+        color_state = SharedSnapshot([('colors', '%dI' % strips)])
+        try:
+            color_state.publish(colors=[0xFFFFFF] * strips)
+            renderer = ColorRenderer(ColorEngine(strips), color_state, Value('i', RAVE, lock=False),
+                                     Array('i', [0xFFFFFF] * strips, lock=False), lambda: (128.0, None),
+                                     transition_seconds=0.1)
+            samples = np.zeros(frames)
+            for i in range(frames):
+                start = time.perf_counter()
+                renderer.render(i * 0.01)  # 100 fps clock
+                samples[i] = time.perf_counter() - start
+        finally:
+            color_state.close()
+        result = {'strips': strips, 'frames': frames}
+        result.update(_timings(samples))
+        results.append(result)
+    return results
+
+
+def _rate(function, calls):
+    start = time.perf_counter()
+    function(calls)
+    return calls / (time.perf_counter() - start)
+
+
+def bench_color_helpers(calls):
+    """Calls per second of the scalar helpers, and their vectorised equivalents per element."""
+    hues = np.arange(calls) % 360
+    colors = np.random.default_rng(0).integers(0, 0xFFFFFF, size=(2, calls))
+    hue_list = hues.tolist()
+    color_list = colors.tolist()
+
+    def scalar_hsv(n):
+        for h in hue_list[:n]:
+            hsv_to_rgb(h, 255, 255)
+
+    def scalar_interpolate(n):
+        for a, b in zip(color_list[0][:n], color_list[1][:n]):
+            interpolate_color(a, b, 0.5)
+
+    def vector_hsv(n):
+        hsv_to_rgb_array(hues[:n])
+
+    # Four frames blend at t = 0, 0.25, 0.625 and 0.906: a one-step engine only has t = 0,
+    # which is a copy. Counted per blended color, like the scalar interpolate_color calls
+    engine = ColorEngine(calls, steps=4)
+
+    def vector_interpolate(n):
+        engine.transition(colors[0, :n], colors[1, :n])
+
+    return {
+        'hsv_to_rgb_per_sec': _rate(scalar_hsv, calls),
+        'interpolate_color_per_sec': _rate(scalar_interpolate, calls),
+        'hsv_to_rgb_array_per_sec': _rate(vector_hsv, calls),
+        'transition_colors_per_sec': _rate(vector_interpolate, calls) * engine.steps,
+    }
+
+
+def _sample_status():
+    return {
+        'spotify_bpm': 128.0, 'volume_level': 0.42, 'is_beat_drop': 0, 'energy_level': 2, 'current_mode': 4,
+        'colors': ['#ff0000', '#00ff00', '#0000ff', '#ffffff'],
+        'band_levels': {'sub_bass': 0.1, 'bass': 0.3, 'mids': 0.2, 'highs': 0.05},
+        'local_bpm': 127.9, 'beat_phase': 0.25, 'beat_count': 512,
+        'spectral': {'band_energies': {'sub_bass': 1.0, 'bass': 3.0, 'mids': 2.0, 'highs': 0.5},
+                     'centroid': 1800.0, 'flux': 0.02, 'rolloff': 5200.0},
+        'track': None, 'version': 1024,
+        'audio_stats': {'chunks': 1024, 'input_overflows': 0, 'ring_overruns': 0, 'late_callbacks': 0,
+                        'max_callback_ms': 3.2},
+    }
+
+
+def bench_status(seconds):
+    """/status requests per second through StatusCache on the threaded and asyncio servers."""
+    status = _sample_status()
+    version = [0]
+
+    def get_version():
+        version[0] += 1  # A new snapshot every 50 requests, roughly the analysis rate under load
+        return (version[0] // 50,)
+
+    cache = StatusCache(lambda: status, get_version)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            code, headers, body = cache.response(self.headers)
+            self.send_response(code)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    threaded = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threaded.request_queue_size = 1024
+    threading.Thread(target=threaded.serve_forever, daemon=True).start()
+    async_server = AsyncHTTPServer(lambda request: cache.response(request.headers), '127.0.0.1', 0)
+    run_in_thread(async_server)
+
+    results = []
+    try:
+        for server, port in (('threading', threaded.server_address[1]), ('asyncio', async_server.port)):
+            for clients in STATUS_CLIENTS:
+                result = load_test(f"http://127.0.0.1:{port}/status", clients, seconds)
+                result['server'] = server
+                del result['url']
+                results.append(result)
+    finally:
+        threaded.shutdown()
+    return results
+
+
+def run(quick=False):
+    scale = 0.25 if quick else 1.0
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'timestamp': time.time(),
+        },
+        'audio_callback': bench_audio_callback(20.0 * scale),
+        'color_frames': bench_color_frames(int(2000 * scale)),
+        'color_helpers': bench_color_helpers(int(200000 * scale)),
+        'status': bench_status(2.0 * scale),
+    }
+
+
+def _key(section, result):
+    if section == 'audio_callback':
+        return f"audio_callback chunk={result['chunk']} channels={result['channels']}"
+    if section == 'color_frames':
+        return f"color_frames strips={result['strips']}"
+    return f"status {result['server']} clients={result['clients']}"
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """Human-readable lines for every result that got worse than threshold."""
+    regressions = []
+    for section, metric, higher_is_better in (('audio_callback', 'p99_ms', False),
+                                              ('color_frames', 'p50_ms', False),
+                                              ('status', 'requests_per_sec', True)):
+        previous = {_key(section, result): result for result in old.get(section, [])}
+        for result in new[section]:
+            before = previous.get(_key(section, result))
+            if before is None or not before[metric]:
+                continue
+            change = result[metric] / before[metric] - 1.0
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{_key(section, result)}: {metric} {before[metric]:.3f} -> {result[metric]:.3f}")
+    for name, value in new['color_helpers'].items():
+        before = old.get('color_helpers', {}).get(name)
+        if before and value < before * (1.0 - threshold):
+            regressions.append(f"color_helpers {name}: {before:.0f} -> {value:.0f}")
+    return regressions
+
+
+def print_summary(results):
+    print("audio_callback (per chunk)")
+    for r in results['audio_callback']:
+        print(f"  chunk {r['chunk']:5d} x{r['channels']}: p50 {r['p50_ms']:6.3f} ms  p99 {r['p99_ms']:6.3f} ms  "
+              f"max {r['max_ms']:6.3f} ms  budget {r['budget_ms']:6.2f} ms  late {r['late_chunks']}")
+    print("color frame (per frame)")
+    for r in results['color_frames']:
+        print(f"  {r['strips']:5d} strips: p50 {r['p50_ms']:6.3f} ms  p99 {r['p99_ms']:6.3f} ms  max {r['max_ms']:6.3f} ms")
+    print("color helpers")
+    for name, value in results['color_helpers'].items():
+        print(f"  {name}: {value:,.0f}")
+    print("/status")
+    for r in results['status']:
+        print(f"  {r['server']:>9} {r['clients']:3d} clients: {r['requests_per_sec']:8.0f} req/s  "
+              f"p50 {r['p50_ms']:6.2f} ms  p99 {r['p99_ms']:6.2f} ms  errors {r['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help="Write the results as JSON to this file")
+    parser.add_argument('--quick', action='store_true', help="Shorter runs (noisier numbers)")
+    parser.add_argument('--compare', help="Earlier JSON results to check for regressions")
+    parser.add_argument('--json', action='store_true', help="Print JSON instead of the summary")
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_summary(results)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
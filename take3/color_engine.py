@@ -0,0 +1,214 @@
+import random
+import numpy as np
+from render_scheduler import beat_quantized_start
+
+# Color modes (same numbering as color_mode in take3.py)
+STATIC = 0
+FULL_SPECTRUM = 1
+RAVE = 2
+HALLOWEEN = 3
+BOILER_ROOM = 4
+
+# Names used by /set-color and /commands
+COLOR_MODE_NAMES = {
+    'static': STATIC,
+    'full_spectrum': FULL_SPECTRUM,
+    'rave': RAVE,
+    'halloween': HALLOWEEN,
+    'boiler_room': BOILER_ROOM,
+}
+
+HALLOWEEN_COLORS = np.array([0xFF4500, 0x8A2BE2, 0xFF0000, 0x008000], dtype=np.uint32)  # Orange, Purple, Red, Green
+BOILER_ROOM_COLORS = np.array([0x8B0000, 0x4B0082], dtype=np.uint32)  # Dark Red, Indigo
+
+TRANSITION_STEPS = 100
+
+
+# Scalar versions, used by take3.py and as the reference for the vectorised ones
+def hsv_to_rgb(h, s, v):
+    """Convert HSV to RGB color."""
+    h = float(h)
+    s = float(s) / 255.0
+    v = float(v) / 255.0
+    hi = int(h / 60.0) % 6
+    f = (h / 60.0) - hi
+    p = v * (1.0 - s)
+    q = v * (1.0 - f * s)
+    t = v * (1.0 - (1.0 - f) * s)
+    r, g, b = 0, 0, 0
+    if hi == 0:
+        r, g, b = v, t, p
+    elif hi == 1:
+        r, g, b = q, v, p
+    elif hi == 2:
+        r, g, b = p, v, t
+    elif hi == 3:
+        r, g, b = p, q, v
+    elif hi == 4:
+        r, g, b = t, p, v
+    elif hi == 5:
+        r, g, b = v, p, q
+    return (int(r * 255) << 16) | (int(g * 255) << 8) | int(b * 255)
+
+
+def interpolate_color(color1, color2, t):
+    """Interpolate between two colors with a ratio t (0.0 - 1.0)."""
+    r1, g1, b1 = (color1 >> 16) & 0xFF, (color1 >> 8) & 0xFF, color1 & 0xFF
+    r2, g2, b2 = (color2 >> 16) & 0xFF, (color2 >> 8) & 0xFF, color2 & 0xFF
+    r = int(r1 + (r2 - r1) * t)
+    g = int(g1 + (g2 - g1) * t)
+    b = int(b1 + (b2 - b1) * t)
+    return (r << 16) | (g << 8) | b
+
+
+def hsv_to_rgb_array(h, s=255, v=255):
+    """Vectorised hsv_to_rgb: same formula (hue in degrees, s/v 0-255), returns packed 0xRRGGBB."""
+    h = np.asarray(h, dtype=np.float64)
+    s = np.broadcast_to(np.asarray(s, dtype=np.float64) / 255.0, h.shape)
+    v = np.broadcast_to(np.asarray(v, dtype=np.float64) / 255.0, h.shape)
+    hi = (h // 60.0).astype(np.int64) % 6
+    f = h / 60.0 - np.floor(h / 60.0)
+    p = v * (1.0 - s)
+    q = v * (1.0 - f * s)
+    t = v * (1.0 - (1.0 - f) * s)
+    r = np.choose(hi, [v, q, p, p, t, v])
+    g = np.choose(hi, [t, v, v, q, p, p])
+    b = np.choose(hi, [p, p, t, v, v, q])
+    return pack_rgb(np.stack([r, g, b], axis=-1) * 255)
+
+
+def unpack_rgb(colors):
+    """Packed 0xRRGGBB values -> (..., 3) float array."""
+    colors = np.asarray(colors, dtype=np.uint32)
+    return np.stack([(colors >> 16) & 0xFF, (colors >> 8) & 0xFF, colors & 0xFF], axis=-1).astype(np.float64)
+
+
+def pack_rgb(rgb):
+    """(..., 3) array of 0-255 channel values -> packed 0xRRGGBB uint32."""
+    rgb = np.asarray(rgb).astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+# 256-entry hue LUT at full saturation and value
+HUE_LUT = hsv_to_rgb_array(np.arange(256))
+
+
+def transition_weights(steps=TRANSITION_STEPS):
+    """Blend weight per step, matching the old per-step interpolate_color() loop.
+
+    Step k moved each color k/steps of the way towards its target, so the
+    remaining distance after step k is the running product of (1 - k/steps).
+    """
+    remaining = np.cumprod(1.0 - np.arange(steps) / steps)
+    return 1.0 - remaining
+
+
+class ColorEngine:
+    """Computes target colors and whole transitions for any number of strips at once."""
+
+    def __init__(self, num_strips=4, steps=TRANSITION_STEPS):
+        self.num_strips = num_strips
+        self.steps = steps
+        self.weights = transition_weights(steps)[:, None, None]
+        self.hue = 0
+
+        # The two strip pairings used by the random modes, as boolean masks
+        # ("first color" strips): 1+3 / 2+4, or 1+4 / 2+3 for four strips
+        index = np.arange(num_strips)
+        self.pairings = np.stack([index % 2 == 0, (index + index // 2) % 2 == 0])
+
+        self._frames = np.zeros((steps, num_strips), dtype=np.uint32)
+
+    def _paired(self, color1, color2):
+        mask = self.pairings[random.randrange(2)]
+        return np.where(mask, np.uint32(color1), np.uint32(color2))
+
+    def next_targets(self, mode, current_targets, static_colors=None):
+        """Target color for every strip for the next transition."""
+        if mode == STATIC and static_colors is not None:
+            return np.asarray(static_colors, dtype=np.uint32)
+
+        elif mode == FULL_SPECTRUM:
+            self.hue = (self.hue + 20) % 256
+            return np.full(self.num_strips, HUE_LUT[self.hue], dtype=np.uint32)
+
+        elif mode == RAVE:  # Random jumps across the spectrum
+            return self._paired(HUE_LUT[random.randint(0, 255)], HUE_LUT[random.randint(0, 255)])
+
+        elif mode == HALLOWEEN:
+            return self._paired(random.choice(HALLOWEEN_COLORS), random.choice(HALLOWEEN_COLORS))
+
+        elif mode == BOILER_ROOM:
+            return self._paired(random.choice(BOILER_ROOM_COLORS), random.choice(BOILER_ROOM_COLORS))
+
+        return np.asarray(current_targets, dtype=np.uint32)
+
+    def transition(self, current, target):
+        """All frames of a transition as a (steps, strips) array of packed colors."""
+        start = unpack_rgb(current)
+        delta = unpack_rgb(target) - start
+        self._frames[:] = pack_rgb(start + delta * self.weights)
+        return self._frames
+
+
+class ColorRenderer:
+    """Frame-clocked color output: called once per frame by the RenderScheduler.
+
+    Each transition is a precomputed set of frames from ColorEngine.transition;
+    the frame shown is picked from the elapsed time, so the fade takes the
+    same wall time whatever the frame rate. With quantize=True transitions
+    last beats_per_transition beats and start on the next beat.
+    """
+
+    def __init__(self, engine, color_state, color_mode, static_colors, get_timing,
+                 transition_seconds=1.0, quantize=False, beats_per_transition=2):
+        self.engine = engine
+        self.color_state = color_state
+        self.color_mode = color_mode
+        self.static_colors = static_colors
+        self.get_timing = get_timing  # Returns (bpm, beat_phase or None)
+        self.transition_seconds = transition_seconds
+        self.quantize = quantize
+        self.beats_per_transition = beats_per_transition
+
+        self.current = np.array(color_state.read()['colors'], dtype=np.uint32)
+        self.target = self.current.copy()
+        self.frames = None
+        self.start = 0.0
+        self.duration = transition_seconds
+        self._published = None
+
+    def restart(self):
+        """Start a new transition on the next frame, from the colors currently shown."""
+        if self._published is not None:
+            self.current = self._published.copy()
+        self.frames = None
+
+    def _begin(self, now):
+        self.target = self.engine.next_targets(self.color_mode.value, self.target, self.static_colors[:])
+        self.frames = self.engine.transition(self.current, self.target)
+        self.start = now
+        self.duration = self.transition_seconds
+
+        if self.quantize:
+            bpm, beat_phase = self.get_timing()
+            if bpm > 0:
+                self.duration = 60.0 / bpm * self.beats_per_transition
+                self.start = beat_quantized_start(now, bpm, beat_phase)
+
+    def render(self, now):
+        if self.frames is None or now >= self.start + self.duration:
+            if self.frames is not None:
+                self.current = self.frames[-1].copy()
+            self._begin(now)
+
+        progress = (now - self.start) / self.duration
+        if progress < 0.0:
+            frame = self.current  # Holding until the transition starts on the beat
+        else:
+            frame = self.frames[min(int(progress * len(self.frames)), len(self.frames) - 1)]
+
+        # One atomic write per frame, and none at all while nothing changes
+        if self._published is None or not np.array_equal(frame, self._published):
+            self.color_state.publish(colors=frame.tolist())
+            self._published = frame.copy()
@@ -0,0 +1,186 @@
+import heapq
+import itertools
+import json
+import math
+import re
+import threading
+import time
+from color_engine import COLOR_MODE_NAMES
+
+MAX_BATCH = 256  # Commands per /commands request
+MAX_PENDING = 4096  # Commands waiting in the queue
+MAX_MODE = 13  # 0 = None, 1-3 for scenes, 4-13 for effects
+MAX_SCHEDULE_SECONDS = 24 * 3600.0  # How far 'at' may be from now, and the longest 'delay'
+
+_HEX_COLOR = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+
+class CommandError(ValueError):
+    pass
+
+
+def parse_color(value):
+    if not isinstance(value, str) or not _HEX_COLOR.match(value):
+        raise CommandError(f"Invalid color {value!r}, expected '#RRGGBB'")
+    return int(value[1:], 16)
+
+
+def _number(value):
+    """value as a float if it's a finite number, else None (json.loads accepts NaN and Infinity, and bool is an int)."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return float(value)
+
+
+def _parse_command(command, num_strips):
+    if not isinstance(command, dict):
+        raise CommandError("Command must be an object")
+    kind = command.get('type')
+
+    if kind == 'mode':
+        mode = command.get('mode')
+        if not isinstance(mode, int) or isinstance(mode, bool) or not 0 <= mode <= MAX_MODE:
+            raise CommandError(f"Invalid mode {mode!r}, expected 0-{MAX_MODE}")
+        parsed = {'type': 'mode', 'mode': mode}
+
+    elif kind == 'color':
+        name = command.get('mode')
+        if name not in COLOR_MODE_NAMES:
+            raise CommandError(f"Invalid color mode {name!r}")
+        parsed = {'type': 'color', 'color_mode': COLOR_MODE_NAMES[name]}
+        if name == 'static':
+            colors = command.get('colors')
+            if not isinstance(colors, list) or not 1 <= len(colors) <= num_strips:
+                raise CommandError(f"Static mode needs 1-{num_strips} colors")
+            parsed['colors'] = [parse_color(color) for color in colors]
+
+    elif kind == 'timing':
+        parsed = {'type': 'timing'}
+        if 'transition_seconds' in command:
+            seconds = _number(command['transition_seconds'])
+            if seconds is None or not 0.0 < seconds <= 60.0:
+                raise CommandError("transition_seconds must be between 0 and 60")
+            parsed['transition_seconds'] = seconds
+        if 'beat_quantized' in command:
+            parsed['beat_quantized'] = bool(command['beat_quantized'])
+        if 'beats_per_transition' in command:
+            beats = command['beats_per_transition']
+            if not isinstance(beats, int) or isinstance(beats, bool) or not 1 <= beats <= 64:
+                raise CommandError("beats_per_transition must be between 1 and 64")
+            parsed['beats_per_transition'] = beats
+        if len(parsed) == 1:
+            raise CommandError("Timing command changes nothing")
+
+    else:
+        raise CommandError(f"Unknown command type {kind!r}")
+
+    # Optional scheduling: absolute wall-clock time or a delay from now
+    # (a NaN or infinite due time would sit at the head of the queue forever)
+    if 'at' in command and 'delay' in command:
+        raise CommandError("Use either 'at' or 'delay', not both")
+    if 'at' in command:
+        at = _number(command['at'])
+        if at is None or abs(at - time.time()) > MAX_SCHEDULE_SECONDS:
+            raise CommandError("'at' must be a Unix timestamp in seconds within a day of now")
+        parsed['at'] = at
+    elif 'delay' in command:
+        delay = _number(command['delay'])
+        if delay is None or not 0.0 <= delay <= MAX_SCHEDULE_SECONDS:
+            raise CommandError("'delay' must be between 0 and 86400 seconds")
+        parsed['delay'] = delay
+    return parsed
+
+
+def parse_commands(data, num_strips):
+    """Validate a whole /commands batch up front; raises CommandError naming the bad entry."""
+    commands = data.get('commands') if isinstance(data, dict) else data
+    if not isinstance(commands, list) or not commands:
+        raise CommandError("Expected a non-empty 'commands' list")
+    if len(commands) > MAX_BATCH:
+        raise CommandError(f"At most {MAX_BATCH} commands per batch")
+
+    parsed = []
+    for index, command in enumerate(commands):
+        try:
+            parsed.append(_parse_command(command, num_strips))
+        except CommandError as e:
+            raise CommandError(f"Command {index}: {e}")
+    return parsed
+
+
+class CommandQueue:
+    """Time-ordered queue of validated commands, drained by the render loop.
+
+    Registered with the RenderScheduler ahead of the color renderer, so every
+    command that is due by a frame is applied together before that frame is
+    rendered. Commands with the same due time keep their batch order.
+    """
+
+    def __init__(self, apply):
+        self.apply = apply
+        self._heap = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self.applied = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def submit(self, commands):
+        now_wall = time.time()
+        now = time.monotonic()
+        with self._lock:
+            if len(self._heap) + len(commands) > MAX_PENDING:
+                raise CommandError("Command queue is full")
+            for command in commands:
+                if 'at' in command:
+                    due = now + (command['at'] - now_wall)
+                else:
+                    due = now + command.get('delay', 0.0)
+                heapq.heappush(self._heap, (due, next(self._order), command))
+        return len(commands)
+
+    def render(self, now):
+        if not self._heap or self._heap[0][0] > now:
+            return
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+        for command in due:
+            self.apply(command)
+        self.applied += len(due)
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+
+
+# Bad scheduling values from a JSON body must be rejected, and the queue must keep draining around them
+def _self_check():
+    applied = []
+    queue = CommandQueue(applied.append)
+    queue.submit(parse_commands([{'type': 'mode', 'mode': 1}], 4))
+    bad = ['{"type": "mode", "mode": 2, "delay": NaN}', '{"type": "mode", "mode": 2, "delay": Infinity}',
+           '{"type": "mode", "mode": 2, "delay": -1}', '{"type": "mode", "mode": 2, "delay": true}',
+           '{"type": "mode", "mode": 2, "at": NaN}', '{"type": "mode", "mode": 2, "at": -Infinity}',
+           '{"type": "mode", "mode": 2, "at": 1e300}', '{"type": "mode", "mode": 2, "at": false}',
+           '{"type": "timing", "transition_seconds": NaN}', '{"type": "timing", "beats_per_transition": true}']
+    rejected = 0
+    for body in bad:
+        try:
+            queue.submit(parse_commands([json.loads(body)], 4))
+        except CommandError:
+            rejected += 1
+        else:
+            print(f"Accepted {body}")
+    queue.submit(parse_commands([{'type': 'mode', 'mode': 3, 'delay': 0.0},
+                                 {'type': 'mode', 'mode': 4, 'at': time.time()}], 4))
+    queue.render(time.monotonic() + 0.001)
+    modes = [command['mode'] for command in applied]
+    print(f"Rejected {rejected}/{len(bad)} bad commands, applied modes {modes}, {len(queue)} pending")
+    return rejected == len(bad) and sorted(modes) == [1, 3, 4] and len(queue) == 0
+
+
+if __name__ == '__main__':
+    print("Command queue OK" if _self_check() else "Command queue FAILED")
@@ -0,0 +1,308 @@
+"""Controller discovery over UDP broadcast, and the registry of fixtures it finds.
+
+Messages (little-endian) on DISCOVERY_PORT all start with magic b'GD',
+protocol version (1) and a message type:
+
+    ANNOUNCE  server -> broadcast, every ANNOUNCE_INTERVAL, and in reply to QUERY
+              u16 HTTP port, u16 telemetry port (the port fixtures should listen on)
+    QUERY     controller -> broadcast, "is there a server?" (no payload)
+    HELLO     controller -> server, on discovery and then as a heartbeat
+              u16 port it receives telemetry on, u8 strips, 24s fixture ID
+
+Fixtures that haven't sent a HELLO for FIXTURE_TIMEOUT are dropped. The
+registry's targets feed UdpTelemetrySender, so every fixture gets the same
+packets from one send loop (see udp_telemetry.py).
+
+Run this file directly for a loopback check with simulated controllers.
+"""
+import selectors
+import socket
+import struct
+import threading
+import time
+from udp_telemetry import DEFAULT_PORT, UdpTelemetrySender, decode_packet
+
+DISCOVERY_MAGIC = b'GD'
+DISCOVERY_VERSION = 1
+DISCOVERY_PORT = 7778
+ANNOUNCE = 1
+QUERY = 2
+HELLO = 3
+
+HEADER = struct.Struct('<2sBB')
+ANNOUNCE_MESSAGE = struct.Struct('<2sBBHH')
+QUERY_MESSAGE = HEADER
+HELLO_MESSAGE = struct.Struct('<2sBBHB24s')
+
+ANNOUNCE_INTERVAL = 2.0
+HEARTBEAT_INTERVAL = 2.0  # How often controllers are expected to send HELLO
+FIXTURE_TIMEOUT = 10.0
+
+
+def encode_announce(http_port, telemetry_port):
+    return ANNOUNCE_MESSAGE.pack(DISCOVERY_MAGIC, DISCOVERY_VERSION, ANNOUNCE, http_port, telemetry_port)
+
+
+def encode_query():
+    return QUERY_MESSAGE.pack(DISCOVERY_MAGIC, DISCOVERY_VERSION, QUERY)
+
+
+def encode_hello(fixture_id, port, strips=4):
+    return HELLO_MESSAGE.pack(DISCOVERY_MAGIC, DISCOVERY_VERSION, HELLO, port, strips, fixture_id.encode()[:24])
+
+
+def decode_message(data):
+    """(type, fields dict). Raises ValueError for anything that isn't a discovery message."""
+    if len(data) < HEADER.size:
+        raise ValueError("Short discovery message")
+    magic, version, kind = HEADER.unpack_from(data)
+    if magic != DISCOVERY_MAGIC or version != DISCOVERY_VERSION:
+        raise ValueError("Not a discovery message")
+    if kind == ANNOUNCE and len(data) == ANNOUNCE_MESSAGE.size:
+        _, _, _, http_port, telemetry_port = ANNOUNCE_MESSAGE.unpack(data)
+        return kind, {'http_port': http_port, 'telemetry_port': telemetry_port}
+    if kind == QUERY and len(data) == QUERY_MESSAGE.size:
+        return kind, {}
+    if kind == HELLO and len(data) == HELLO_MESSAGE.size:
+        _, _, _, port, strips, fixture_id = HELLO_MESSAGE.unpack(data)
+        return kind, {'port': port, 'strips': strips, 'fixture_id': fixture_id.rstrip(b'\0').decode(errors='replace')}
+    raise ValueError(f"Bad discovery message type {kind} or length {len(data)}")
+
+
+class Fixture:
+    def __init__(self, fixture_id, address, strips, now):
+        self.fixture_id = fixture_id
+        self.address = address  # (ip, telemetry port)
+        self.strips = strips
+        self.first_seen = now
+        self.last_seen = now
+        self.hellos = 1
+
+    def to_dict(self, now):
+        return {
+            'fixture_id': self.fixture_id,
+            'address': f"{self.address[0]}:{self.address[1]}",
+            'strips': self.strips,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'seconds_since_seen': now - self.last_seen,
+            'hellos': self.hellos,
+        }
+
+
+class FixtureRegistry:
+    """Fixtures by ID with last-seen times.
+
+    targets() is rebuilt only when a fixture joins, moves or expires, so the
+    telemetry loop can call it on every packet.
+    """
+
+    def __init__(self, timeout=FIXTURE_TIMEOUT):
+        self.timeout = timeout
+        self.fixtures = {}
+        self._targets = ()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.fixtures)
+
+    def seen(self, fixture_id, address, strips, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            fixture = self.fixtures.get(fixture_id)
+            if fixture is None:
+                self.fixtures[fixture_id] = Fixture(fixture_id, address, strips, now)
+                print(f"Fixture {fixture_id} joined from {address[0]}:{address[1]}")
+            else:
+                fixture.last_seen = now
+                fixture.hellos += 1
+                fixture.strips = strips
+                if fixture.address == address:
+                    return
+                fixture.address = address  # DHCP gave it a new address
+            self._rebuild()
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [fixture_id for fixture_id, fixture in self.fixtures.items()
+                       if now - fixture.last_seen > self.timeout]
+            for fixture_id in expired:
+                del self.fixtures[fixture_id]
+                print(f"Fixture {fixture_id} timed out")
+            if expired:
+                self._rebuild()
+        return expired
+
+    def _rebuild(self):
+        self._targets = tuple(fixture.address for fixture in self.fixtures.values())
+
+    def targets(self):
+        return self._targets
+
+    def to_dict(self):
+        now = time.time()
+        with self._lock:
+            return {'fixtures': [fixture.to_dict(now) for fixture in self.fixtures.values()]}
+
+
+class DiscoveryService:
+    """Announces the server, answers queries and records HELLOs in a FixtureRegistry."""
+
+    def __init__(self, registry, http_port=8080, telemetry_port=DEFAULT_PORT,
+                 bind=('0.0.0.0', DISCOVERY_PORT), announce_targets=(('255.255.255.255', DISCOVERY_PORT),)):
+        self.registry = registry
+        self.announcement = encode_announce(http_port, telemetry_port)
+        self.announce_targets = list(announce_targets)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.bind(bind)
+        self.address = self.sock.getsockname()
+        self.invalid = 0
+
+    def handle(self, data, sender, now=None):
+        try:
+            kind, fields = decode_message(data)
+        except ValueError:
+            self.invalid += 1
+            return
+        if kind == QUERY:
+            try:
+                self.sock.sendto(self.announcement, sender)
+            except OSError as e:
+                print(f"Discovery reply to {sender[0]}:{sender[1]} failed: {e}")
+        elif kind == HELLO:
+            self.registry.seen(fields['fixture_id'], (sender[0], fields['port']), fields['strips'], now)
+
+    def announce(self):
+        for target in self.announce_targets:
+            try:
+                self.sock.sendto(self.announcement, target)
+            except OSError as e:
+                print(f"Discovery announce to {target} failed: {e}")
+
+    def run(self, stop_event=None):
+        """Serve until stop_event is set or the socket is closed; other socket errors are logged."""
+        next_announce = 0.0
+        self.sock.settimeout(0.5)
+        while stop_event is None or not stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_announce:
+                self.announce()
+                self.registry.expire()
+                next_announce = now + ANNOUNCE_INTERVAL
+            try:
+                data, sender = self.sock.recvfrom(512)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if self.sock.fileno() == -1:  # Closed
+                    break
+                print(f"Discovery receive failed: {e}")
+                time.sleep(0.1)  # Don't spin on an error that repeats
+                continue
+            self.handle(data, sender)
+
+    def close(self):
+        self.sock.close()
+
+
+class SimulatedController:
+    """Loopback stand-in for an ESP32: queries, says HELLO and counts telemetry packets."""
+
+    def __init__(self, fixture_id):
+        self.fixture_id = fixture_id
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.server = None
+        self.packets = 0
+        self.last_sequence = None
+        self.out_of_order = 0
+
+    def query(self, discovery_address):
+        self.sock.sendto(encode_query(), discovery_address)
+
+    def receive(self):
+        data, sender = self.sock.recvfrom(2048)
+        if data[:2] == DISCOVERY_MAGIC:
+            kind, _ = decode_message(data)
+            if kind == ANNOUNCE:  # Found the server: register with it
+                self.server = sender
+                self.hello()
+            return
+        packet = decode_packet(data)
+        if self.last_sequence is not None and packet['sequence'] <= self.last_sequence:
+            self.out_of_order += 1
+        self.last_sequence = packet['sequence']
+        self.packets += 1
+
+    def hello(self):
+        self.sock.sendto(encode_hello(self.fixture_id, self.port), self.server)
+
+
+def _loopback_check(fixtures=60, frames=500, rate=100.0):
+    registry = FixtureRegistry()
+    service = DiscoveryService(registry, bind=('127.0.0.1', 0), announce_targets=[])
+    stop = threading.Event()
+    threading.Thread(target=service.run, args=(stop,), daemon=True).start()
+
+    controllers = [SimulatedController(f"fixture-{i:03d}") for i in range(fixtures)]
+    selector = selectors.DefaultSelector()
+    for controller in controllers:
+        selector.register(controller.sock, selectors.EVENT_READ, controller)
+
+    def pump(seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for key, _ in selector.select(0.01):
+                try:
+                    key.data.receive()
+                except (BlockingIOError, ValueError):
+                    pass
+
+    start = time.perf_counter()
+    for controller in controllers:
+        controller.query(service.address)
+    while len(registry) < fixtures and time.perf_counter() - start < 5.0:
+        pump(0.01)
+    discovered = time.perf_counter() - start
+
+    sender = UdpTelemetrySender([], registry=registry)
+    send_times = []
+    receiver = threading.Thread(target=pump, args=(frames / rate + 1.0,), daemon=True)
+    receiver.start()
+    begin = time.perf_counter()
+    for i in range(frames):
+        t = time.perf_counter()
+        sender.send(timestamp=time.time(), bpm=128.0, volume=0.5, energy_level=2, is_beat_drop=False,
+                    mode=i % 14, colors=[0xFF0000, 0x00FF00, 0x0000FF, 0xFFFFFF])
+        send_times.append(time.perf_counter() - t)
+        time.sleep(max(0.0, begin + (i + 1) / rate - time.perf_counter()))
+    receiver.join()
+
+    received = sum(controller.packets for controller in controllers)
+    expected = fixtures * frames
+    send_times.sort()
+    print(f"Discovered {len(registry)}/{fixtures} fixtures in {discovered * 1000:.0f} ms")
+    print(f"Fan-out: {received}/{expected} packets received ({sender.dropped} dropped on send), "
+          f"{sum(c.out_of_order for c in controllers)} out of order")
+    print(f"Send loop per frame ({fixtures} targets): median {send_times[len(send_times) // 2] * 1e3:.3f} ms, "
+          f"max {send_times[-1] * 1e3:.3f} ms")
+
+    registry.expire(now=time.time() + FIXTURE_TIMEOUT + 1)
+    expired_ok = len(registry) == 0 and registry.targets() == ()
+    print(f"Expiry: {'ok' if expired_ok else 'FAILED'}")
+
+    stop.set()
+    service.close()
+    sender.close()
+    for controller in controllers:
+        controller.sock.close()
+    return len(registry) == 0 and received >= expected * 0.99 and expired_ok
+
+
+if __name__ == '__main__':
+    print("Discovery loopback OK" if _loopback_check() else "Discovery loopback FAILED")
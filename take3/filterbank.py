@@ -0,0 +1,67 @@
+import numpy as np
+from functools import lru_cache
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+# Default analysis bands in Hz (name, lowcut, highcut)
+DEFAULT_BANDS = (
+    ('sub_bass', 20.0, 60.0),
+    ('bass', 60.0, 250.0),
+    ('mids', 250.0, 4000.0),
+    ('highs', 4000.0, 16000.0),
+)
+
+
+@lru_cache(maxsize=64)
+def design_bandpass_sos(lowcut, highcut, fs, order=5):
+    """Design a Butterworth bandpass as second-order sections (cached per band)."""
+    nyquist = 0.5 * fs
+    low = lowcut / nyquist
+    high = min(highcut / nyquist, 0.999)
+    sos = butter(order, [low, high], btype='band', output='sos')
+    return sos
+
+
+class BandpassFilterBank:
+    """Streaming bank of bandpass filters that keeps its state between chunks.
+
+    Coefficients are designed once through design_bandpass_sos and the filter
+    state (zi) is carried from one process() call to the next, so consecutive
+    audio chunks are filtered as one continuous signal.
+    """
+
+    def __init__(self, fs, chunk, bands=DEFAULT_BANDS, order=4):
+        self.fs = fs
+        self.chunk = chunk
+        self.order = order
+        self.names = [name for name, _, _ in bands]
+        self.sos = [design_bandpass_sos(low, high, fs, order) for _, low, high in bands]
+        self.zi = np.zeros((len(bands), self.sos[0].shape[0], 2))
+        self.output = np.zeros((len(bands), chunk))
+        self.energies = np.zeros(len(bands))
+        self._primed = False
+
+    def reset(self):
+        self.zi[:] = 0.0
+        self._primed = False
+
+    def process(self, data):
+        """Filter one chunk through every band and return the (bands, frames) output."""
+        frames = len(data)
+        if frames != self.output.shape[1]:
+            self.output = np.zeros((len(self.sos), frames))
+
+        if not self._primed:
+            # Start from the steady state for the first sample to avoid a click
+            for i, sos in enumerate(self.sos):
+                self.zi[i] = sosfilt_zi(sos) * data[0]
+            self._primed = True
+
+        for i, sos in enumerate(self.sos):
+            self.output[i], self.zi[i] = sosfilt(sos, data, zi=self.zi[i])
+        return self.output
+
+    def band_energies(self, data):
+        """Filter a chunk and return the RMS level of each band."""
+        out = self.process(data)
+        np.sqrt(np.mean(np.square(out), axis=1), out=self.energies)
+        return self.energies
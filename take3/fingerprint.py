@@ -0,0 +1,301 @@
+"""Spectral-peak audio fingerprinting, to identify tracks without Spotify.
+
+    python fingerprint.py index ~/Music -o fingerprints.npz   # Build the index (process pool)
+    python fingerprint.py match some_track.wav               # Check a file against it
+
+Peaks are picked from the same rFFT frames the analyzer computes
+(spectral.py), one per log-spaced band. Each peak is paired with a few
+later peaks and every pair becomes a 24-bit hash of (bin, bin, frame gap).
+A track matches when many query hashes line up at the same frame offset,
+which also gives the position in the track.
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from audio_file import AUDIO_EXTENSIONS, iter_chunks, load_audio
+from spectral import SpectralAnalyzer
+
+FINGERPRINT_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fingerprints.npz')
+RATE = 44100
+CHUNK = 1024
+
+PEAK_BANDS = 8  # Log-spaced bands between PEAK_MIN_HZ and PEAK_MAX_HZ, at most one peak each per frame
+PEAK_MIN_HZ = 100.0
+PEAK_MAX_HZ = 5000.0
+PEAK_PROMINENCE = 3.0  # A band's strongest bin must be this many times the band mean
+FAN_OUT = 4  # Target peaks paired with each anchor peak
+TARGET_FRAMES = 32  # Targets come from the next this many frames (fits the 6-bit gap)
+QUERY_SECONDS = 8.0  # Hashes kept for matching a live stream
+MATCH_SECONDS = 1.0  # How often the live stream is matched against the index
+MIN_SCORE = 12  # Aligned hashes needed to call it a match
+
+
+class PeakPicker:
+    """Constellation peaks of one magnitude frame, without allocating."""
+
+    def __init__(self, rate, chunk):
+        freqs = np.fft.rfftfreq(chunk, 1.0 / rate)
+        edges = np.geomspace(PEAK_MIN_HZ, PEAK_MAX_HZ, PEAK_BANDS + 1)
+        self._starts = np.searchsorted(freqs, edges[:-1]).astype(np.intp)
+        self._stop = int(np.searchsorted(freqs, edges[-1]))
+        self._widths = np.diff(np.append(self._starts, self._stop))
+        self._max = np.zeros(PEAK_BANDS)
+        self._sum = np.zeros(PEAK_BANDS)
+
+    def peaks(self, magnitude):
+        """Bins of the prominent band maxima in this frame."""
+        band = magnitude[:self._stop]
+        np.maximum.reduceat(band, self._starts, out=self._max)
+        np.add.reduceat(band, self._starts, out=self._sum)
+        strong = self._max * self._widths > PEAK_PROMINENCE * self._sum
+        if not strong.any():
+            return []
+        return [int(self._starts[i] + np.argmax(band[self._starts[i]:self._starts[i] + self._widths[i]]))
+                for i in np.flatnonzero(strong)]
+
+
+def _hash(anchor_bin, target_bin, gap):
+    return (anchor_bin << 15) | (target_bin << 6) | gap
+
+
+class Hasher:
+    """Turns a stream of peak lists into (hash, anchor frame) pairs.
+
+    An anchor is hashed once its whole target zone has been seen, so hashes
+    come out TARGET_FRAMES behind the input.
+    """
+
+    def __init__(self):
+        self._peaks = deque()  # (frame, bin), oldest first
+        self.frame = 0
+
+    def add(self, peaks):
+        for peak_bin in peaks:
+            self._peaks.append((self.frame, peak_bin))
+        self.frame += 1
+
+        hashes = []
+        while self._peaks and self._peaks[0][0] <= self.frame - TARGET_FRAMES - 1:
+            anchor_frame, anchor_bin = self._peaks.popleft()
+            paired = 0
+            for target_frame, target_bin in self._peaks:
+                gap = target_frame - anchor_frame
+                if gap == 0:
+                    continue
+                if gap > TARGET_FRAMES or paired == FAN_OUT:
+                    break
+                hashes.append((_hash(anchor_bin, target_bin, gap), anchor_frame))
+                paired += 1
+        return hashes
+
+
+def fingerprint_samples(samples, rate=RATE, chunk=CHUNK):
+    """(hashes, frames) arrays for a whole mono signal, using the live analysis frames."""
+    spectral = SpectralAnalyzer(rate, chunk)
+    picker = PeakPicker(rate, chunk)
+    hasher = Hasher()
+    pairs = []
+    for data in iter_chunks(samples, chunk):
+        pairs.extend(hasher.add(picker.peaks(spectral.process(data).magnitude)))
+    for _ in range(TARGET_FRAMES + 1):  # Flush anchors near the end
+        pairs.extend(hasher.add([]))
+    if not pairs:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+    pairs = np.array(pairs, dtype=np.uint32)
+    return pairs[:, 0], pairs[:, 1]
+
+
+class FingerprintIndex:
+    """Hashes of a music library, sorted for binary-search lookup.
+
+    Stored as one .npz: hashes/tracks/frames as parallel uint32 arrays
+    sorted by hash, plus the track names.
+    """
+
+    def __init__(self, names, hashes, tracks, frames):
+        self.names = list(names)
+        order = np.argsort(hashes, kind='stable')
+        self.hashes = np.asarray(hashes, dtype=np.uint32)[order]
+        self.tracks = np.asarray(tracks, dtype=np.uint32)[order]
+        self.frames = np.asarray(frames, dtype=np.uint32)[order]
+
+    @classmethod
+    def build(cls, fingerprints):
+        """fingerprints is a list of (name, hashes, frames)."""
+        names = [name for name, _, _ in fingerprints]
+        tracks = [np.full(len(hashes), i, dtype=np.uint32) for i, (_, hashes, _) in enumerate(fingerprints)]
+        return cls(names,
+                   np.concatenate([hashes for _, hashes, _ in fingerprints] or [np.zeros(0, np.uint32)]),
+                   np.concatenate(tracks or [np.zeros(0, np.uint32)]),
+                   np.concatenate([frames for _, _, frames in fingerprints] or [np.zeros(0, np.uint32)]))
+
+    @classmethod
+    def load(cls, path=FINGERPRINT_INDEX_FILE):
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.names = [str(name) for name in data['names']]
+            index.hashes = data['hashes']
+            index.tracks = data['tracks']
+            index.frames = data['frames']
+        return index
+
+    @staticmethod
+    def load_names(path=FINGERPRINT_INDEX_FILE):
+        with np.load(path) as data:
+            return [str(name) for name in data['names']]
+
+    def save(self, path=FINGERPRINT_INDEX_FILE):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, names=np.array(self.names), hashes=self.hashes, tracks=self.tracks, frames=self.frames)
+        os.replace(tmp_path, path)
+
+    def match(self, hashes, frames):
+        """(track index, frame offset, score) of the best match, or None.
+
+        The offset is track frame minus query frame for the aligned hashes.
+        """
+        if len(hashes) == 0 or len(self.hashes) == 0:
+            return None
+        lo = np.searchsorted(self.hashes, hashes, side='left')
+        hi = np.searchsorted(self.hashes, hashes, side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            return None
+
+        # Every (query hash, index entry) pair with equal hashes, without a Python loop
+        query = np.repeat(np.arange(len(hashes)), counts)
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        entries = starts + np.arange(total)
+
+        offsets = self.frames[entries].astype(np.int64) - np.asarray(frames, dtype=np.int64)[query]
+        keys = (self.tracks[entries].astype(np.int64) << 32) | (offsets & 0xFFFFFFFF)
+        unique, votes = np.unique(keys, return_counts=True)
+        best = int(np.argmax(votes))
+        track = int(unique[best] >> 32)
+        offset = int(np.int32(np.uint32(unique[best] & 0xFFFFFFFF)))
+        return track, offset, int(votes[best])
+
+
+class StreamingFingerprinter:
+    """Identifies the playing track from the analyzer's FFT frames.
+
+    process() takes one magnitude frame per chunk. Once a second it hands
+    a copy of the last QUERY_SECONDS of hashes to a worker thread, which
+    matches them against the index off the audio path (if the worker is
+    still busy with the previous query, that second is skipped). After a
+    match, result is (track index, wall-clock time the track started,
+    score), replaced as a whole so readers never see a torn match.
+    """
+
+    def __init__(self, index, rate=RATE, chunk=CHUNK):
+        self.index = index
+        self.frame_seconds = chunk / rate
+        self.picker = PeakPicker(rate, chunk)
+        self.hasher = Hasher()
+        self._query = deque()
+        self._query_frames = int(QUERY_SECONDS / self.frame_seconds)
+        self._match_every = max(1, int(MATCH_SECONDS / self.frame_seconds))
+        self.result = None
+        self.skipped = 0  # Queries dropped because the worker was busy
+        self._pending = queue.Queue(maxsize=1)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def process(self, magnitude, current_time):
+        self._query.extend(self.hasher.add(self.picker.peaks(magnitude)))
+        oldest = self.hasher.frame - self._query_frames
+        while self._query and self._query[0][1] < oldest:
+            self._query.popleft()
+
+        if self.hasher.frame % self._match_every == 0 and len(self._query) >= MIN_SCORE:
+            try:
+                self._pending.put_nowait((list(self._query), self.hasher.frame, current_time))
+            except queue.Full:
+                self.skipped += 1
+        return self
+
+    def close(self):
+        self._pending.put(None)
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            job = self._pending.get()
+            if job is None:
+                return
+            self._match(*job)
+
+    def _match(self, query, frame, current_time):
+        pairs = np.array(query, dtype=np.int64)
+        result = self.index.match(pairs[:, 0], pairs[:, 1])
+        if result is None or result[2] < MIN_SCORE:
+            return
+        track, offset, score = result
+        # Stream frame `frame` (at current_time) is frame (frame + offset) of the track
+        self.result = (track, current_time - (frame + offset) * self.frame_seconds, score)
+
+
+def _fingerprint_file(args):
+    path, name = args
+    try:
+        hashes, frames = fingerprint_samples(load_audio(path, RATE))
+    except Exception as e:
+        print(f"Skipping {path}: {e}")
+        return name, None, None
+    return name, hashes, frames
+
+
+def index_directory(directory, workers=None):
+    """Fingerprint every audio file under directory with a process pool."""
+    jobs = []
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if file.lower().endswith(AUDIO_EXTENSIONS):
+                path = os.path.join(root, file)
+                jobs.append((path, os.path.splitext(os.path.relpath(path, directory))[0]))
+
+    fingerprints = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for name, hashes, frames in pool.map(_fingerprint_file, jobs, chunksize=4):
+            if hashes is not None and len(hashes):
+                fingerprints.append((name, hashes, frames))
+    return FingerprintIndex.build(fingerprints)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    index_parser = commands.add_parser('index', help="Fingerprint a music directory")
+    index_parser.add_argument('directory')
+    index_parser.add_argument('-o', '--output', default=FINGERPRINT_INDEX_FILE)
+    index_parser.add_argument('--workers', type=int, default=None)
+    match_parser = commands.add_parser('match', help="Identify an audio file")
+    match_parser.add_argument('file')
+    match_parser.add_argument('-i', '--index', default=FINGERPRINT_INDEX_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        start = time.perf_counter()
+        index = index_directory(args.directory, args.workers)
+        index.save(args.output)
+        print(f"Indexed {len(index.names)} tracks, {len(index.hashes)} hashes "
+              f"in {time.perf_counter() - start:.1f} s -> {args.output}")
+    else:
+        index = FingerprintIndex.load(args.index)
+        hashes, frames = fingerprint_samples(load_audio(args.file, RATE))
+        result = index.match(hashes, frames)
+        if result is None or result[2] < MIN_SCORE:
+            print("No match")
+        else:
+            track, offset, score = result
+            print(f"{index.names[track]} (score {score}, offset {offset * CHUNK / RATE:+.2f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""Path optimisation for galvo frames: resampling, dwell, blanking and segment order.
+
+    python galvo_path.py                        # Benchmark on random strokes
+    python galvo_path.py strokes.txt            # Optimise a mouse_draw.py `voltages` list
+
+Works on laser_frames.FRAME_DTYPE frames. A point's blank flag means
+the move *into* that point has the laser off, and a lit move takes the
+color of the point it ends at. optimize_frame():
+
+1. splits the frame into lit segments (each starts at the point the first
+   lit move leaves from),
+2. orders them, and picks their direction, to minimise blanked travel:
+   greedy nearest endpoint, then 2-opt over the closed loop,
+3. joins them with blanked travel moves and closes the loop,
+4. resamples every move so no step is longer than max_step (lit) or
+   travel_step (blanked). x and y are proportional to mirror angle, so
+   this is also the maximum angular step,
+5. repeats corner points in proportion to the turning angle, and holds
+   the ends of each segment for end_dwell points, so the mirrors settle
+   before the laser switches on or moves on.
+
+Steps 3-5 are a single vectorised pass over all points.
+"""
+import argparse
+import ast
+import json
+import time
+import numpy as np
+from scipy.spatial.distance import cdist
+from laser_frames import FRAME_DTYPE
+
+MAX_STEP = 0.02  # Longest lit move, in frame units (the full DAC range is 2.0)
+TRAVEL_STEP = 0.08  # Longest blanked move; the galvos may move faster with the laser off
+CORNER_ANGLE = np.radians(30.0)  # Smaller direction changes are not treated as corners
+CORNER_DWELL = 6  # Extra points at a 180 degree corner, fewer for gentler ones
+END_DWELL = 3  # Extra points at each segment start (blanked) and end (lit)
+TWO_OPT_PASSES = 50
+MAX_TWO_OPT_SEGMENTS = 500  # Above this only the greedy order is used (each 2-opt pass is count^2)
+
+
+def split_segments(frame):
+    """Index arrays of the lit segments, each starting at the point its first lit move leaves from."""
+    lit = ~frame['blank']
+    lit[0] = False  # The move into the first point is the loop closing, not part of a segment
+    edges = np.diff(lit.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [np.arange(start - 1, end) for start, end in zip(starts, ends)]
+
+
+def travel_length(starts, ends):
+    """Total blanked travel between segments in this order, including the move back to the first."""
+    return float(np.linalg.norm(np.roll(starts, -1, axis=0) - ends, axis=1).sum())
+
+
+def order_segments(starts, ends, passes=TWO_OPT_PASSES):
+    """(order, reversed) for segments with these start and end points, minimising blanked travel.
+
+    The first segment keeps its place and direction so the frame starts
+    where it used to. Any other segment may be drawn backwards.
+    """
+    count = len(starts)
+    order = np.zeros(count, dtype=np.intp)
+    flipped = np.zeros(count, dtype=bool)
+    if count < 2:
+        return order, flipped
+
+    # Greedy: from the current end, go to the nearest start or end of a segment not drawn yet
+    endpoints = np.concatenate([starts, ends])  # Arriving at an end means drawing that segment backwards
+    drawn = np.zeros(2 * count)  # inf once a segment is drawn
+    drawn[[0, count]] = np.inf
+    position = ends[:1]
+    for k in range(1, count):
+        nearest = np.argmin(cdist(position, endpoints)[0] + drawn)
+        segment, backwards = nearest % count, nearest >= count
+        order[k], flipped[k] = segment, backwards
+        drawn[[segment, segment + count]] = np.inf
+        position = endpoints[nearest + count if not backwards else segment][None]
+
+    if count > MAX_TWO_OPT_SEGMENTS:
+        return order, flipped
+
+    # 2-opt: reversing positions i..j also reverses each of those segments, so only the
+    # blanked moves into i and out of j change. Each pass scores every (i, j) at once,
+    # then applies the best improving reversal per i that doesn't touch one already taken
+    s = np.where(flipped[:, None], ends[order], starts[order])
+    e = np.where(flipped[:, None], starts[order], ends[order])
+    invalid = np.tri(count, k=-1, dtype=bool)  # Only j >= i
+    invalid[0] = True  # The first segment stays put
+    for _ in range(passes):
+        after = np.roll(s, -1, axis=0)  # Start of the segment after each position
+        before = np.roll(e, 1, axis=0)  # End of the segment before each position
+        current_in = np.linalg.norm(s - before, axis=1)
+        current_out = np.linalg.norm(after - e, axis=1)
+        delta = cdist(before, e) + cdist(s, after) - current_in[:, None] - current_out[None, :]
+        delta[invalid] = 0.0
+        best = np.argmin(delta, axis=1)
+        gain = delta[np.arange(count), best]
+        candidates = np.flatnonzero(gain < -1e-9)
+        if not len(candidates):
+            break
+        taken = np.zeros(count + 1, dtype=bool)  # Moves into each position (the last wraps to 0)
+        for i in candidates[np.argsort(gain[candidates])]:
+            j = best[i]
+            if taken[i:j + 2].any():
+                continue
+            taken[i:j + 2] = True
+            order[i:j + 1] = order[i:j + 1][::-1]
+            flipped[i:j + 1] = ~flipped[i:j + 1][::-1]
+            s[i:j + 1], e[i:j + 1] = e[i:j + 1][::-1].copy(), s[i:j + 1][::-1].copy()
+    return order, flipped
+
+
+def turning_angles(xy):
+    """Direction change at each point of a closed point list, 0 where a neighbouring move has no length."""
+    dx = np.diff(xy[:, 0], prepend=xy[-1, 0])  # Move into each point
+    dy = np.diff(xy[:, 1], prepend=xy[-1, 1])
+    length = np.hypot(dx, dy)
+    lengths = length * np.append(length[1:], length[0])
+    dot = dx * np.append(dx[1:], dx[0]) + dy * np.append(dy[1:], dy[0])
+    moving = lengths > 0
+    cosine = np.divide(dot, lengths, out=np.ones_like(dot), where=moving)
+    return np.arccos(np.clip(cosine, -1.0, 1.0, out=cosine), out=cosine)
+
+
+def resample(xy, colors, blank, max_step=MAX_STEP, travel_step=TRAVEL_STEP, dwell=None, closed=False):
+    """Split every move into equal steps no longer than max_step (travel_step when blanked), then repeat point i dwell[i] times.
+
+    With closed=True the move into point 0 comes from the last point.
+    """
+    x, y = xy[:, 0].copy(), xy[:, 1].copy()
+    dx = np.diff(x, prepend=x[-1] if closed else x[0])  # Move into each point
+    dy = np.diff(y, prepend=y[-1] if closed else y[0])
+    step = np.where(blank, travel_step, max_step)
+    steps = np.maximum(1, np.ceil(np.hypot(dx, dy) / step)).astype(np.intp)
+    counts = steps if dwell is None else steps + dwell
+    source = np.repeat(np.arange(len(xy)), counts)
+
+    # How far back along its move each output point is: 1 - k / steps for the k-th step, 0 for dwell copies
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    back = np.repeat(1.0 / steps, counts)
+    back *= first - np.arange(len(source)) - 1
+    back += 1.0
+    np.maximum(back, 0.0, out=back)
+
+    # Colors and blank flags copied as whole records, then positions interpolated
+    points = np.empty(len(xy), dtype=FRAME_DTYPE)
+    points['r'], points['g'], points['b'] = colors.T
+    points['blank'] = blank
+    out = points[source]
+    out['x'] = x[source] - back * dx[source]
+    out['y'] = y[source] - back * dy[source]
+    return out
+
+
+def optimize_frame(frame, max_step=MAX_STEP, travel_step=TRAVEL_STEP, corner_angle=CORNER_ANGLE,
+                   corner_dwell=CORNER_DWELL, end_dwell=END_DWELL, passes=TWO_OPT_PASSES):
+    """An optimised, closed copy of a FRAME_DTYPE frame (see the module docstring)."""
+    segments = split_segments(frame)
+    if not segments:
+        return frame[:0].copy()
+    xy = np.column_stack([frame['x'], frame['y']]).astype(np.float64)
+    colors = np.column_stack([frame['r'], frame['g'], frame['b']])
+    starts = xy[[segment[0] for segment in segments]]
+    ends = xy[[segment[-1] for segment in segments]]
+    order, flipped = order_segments(starts, ends, passes)
+
+    # Point indices in drawing order. Backwards, a move keeps its color, which now
+    # belongs to the point it ends at, hence the one-point shift
+    indices, color_indices = [], []
+    for segment, backwards in zip(order, flipped):
+        points = segments[segment]
+        if backwards:
+            indices.append(points[::-1])
+            color_indices.append(np.concatenate([points[-1:], points[:0:-1]]))
+        else:
+            indices.append(points)
+            color_indices.append(points)
+    lengths = np.array([len(points) for points in indices])
+    path = xy[np.concatenate(indices)]
+    path_colors = colors[np.concatenate(color_indices)]
+    blank = np.zeros(len(path), dtype=bool)
+    blank[np.cumsum(lengths) - lengths] = True  # Travel into each segment start
+
+    # Dwell: corners by turning angle, laser-on after a settle at each start, and a hold at each end
+    angles = turning_angles(path)
+    dwell = np.where(angles >= corner_angle, np.rint(corner_dwell * angles / np.pi), 0).astype(np.intp)
+    dwell[blank] = end_dwell
+    dwell[np.cumsum(lengths) - 1] = end_dwell
+    out = resample(path, path_colors, blank, max_step, travel_step, dwell)
+    # Close the loop: blanked travel back to the first point
+    closing = resample(path[[-1, 0]], path_colors[[-1, 0]], np.array([False, True]), max_step, travel_step)[1:]
+    return np.concatenate([out, closing])
+
+
+def frame_from_voltages(voltages, color=(255, 255, 255)):
+    """A FRAME_DTYPE frame from mouse_draw.py's [x, y, laser on] list, scaled into -1..1 keeping the aspect ratio."""
+    points = np.asarray(voltages, dtype=np.float64).reshape(-1, 3)
+    xy = points[:, :2]
+    low, high = xy.min(axis=0), xy.max(axis=0)
+    span = max(float((high - low).max()), 1e-9)
+    xy = (xy - (low + high) / 2.0) * (2.0 / span)
+    frame = np.empty(len(points), dtype=FRAME_DTYPE)
+    frame['x'] = xy[:, 0]
+    frame['y'] = -xy[:, 1]  # Tk's y grows downwards
+    frame['r'], frame['g'], frame['b'] = color
+    frame['blank'] = points[:, 2] == 0
+    return frame
+
+
+def load_voltages(path):
+    """A mouse_draw.py voltages list from a file: JSON, or the Python repr mouse_draw.py prints
+    (True/False, possibly after its 'end' line)."""
+    with open(path) as f:
+        text = f.read()
+    text = text[text.find('['):] if '[' in text else text
+    try:
+        return json.loads(text)
+    except ValueError:
+        return ast.literal_eval(text.strip())
+
+
+def random_strokes(segments=200, points_per_segment=100, seed=0):
+    """A test frame of random wiggly strokes in random order, like a hand drawing."""
+    rng = np.random.default_rng(seed)
+    count = segments * points_per_segment
+    frame = np.empty(count, dtype=FRAME_DTYPE)
+    start = rng.uniform(-0.8, 0.8, size=(segments, 1, 2))
+    walk = np.cumsum(rng.normal(0.0, 0.01, size=(segments, points_per_segment, 2)), axis=1)
+    xy = (start + walk).reshape(-1, 2)
+    frame['x'], frame['y'] = xy[:, 0], xy[:, 1]
+    frame['r'] = np.repeat(rng.integers(0, 256, segments), points_per_segment)
+    frame['g'] = 255
+    frame['b'] = 0
+    frame['blank'] = False
+    frame['blank'][::points_per_segment] = True
+    return frame
+
+
+def describe(frame):
+    xy = np.column_stack([frame['x'], frame['y']]).astype(np.float64)
+    moves = np.linalg.norm(np.diff(xy, axis=0), axis=1)
+    travel = frame['blank'][1:]
+    return {
+        'points': len(frame),
+        'segments': len(split_segments(frame)),
+        'lit_length': float(moves[~travel].sum()),
+        'blanked_travel': float(moves[travel].sum()),
+        'max_lit_step': float(moves[~travel].max(initial=0.0)),
+        'max_travel_step': float(moves[travel].max(initial=0.0)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('voltages', nargs='?', help="File with a mouse_draw.py voltages list, as JSON or as printed (default: random strokes)")
+    parser.add_argument('--segments', type=int, default=200, help="Random strokes in the benchmark frame")
+    parser.add_argument('--points', type=int, default=100, help="Points per random stroke")
+    parser.add_argument('--max-step', type=float, default=MAX_STEP)
+    parser.add_argument('--travel-step', type=float, default=TRAVEL_STEP)
+    parser.add_argument('--repeat', type=int, default=20, help="Runs to time")
+    args = parser.parse_args()
+
+    if args.voltages:
+        frame = frame_from_voltages(load_voltages(args.voltages))
+    else:
+        frame = random_strokes(args.segments, args.points)
+
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        optimized = optimize_frame(frame, args.max_step, args.travel_step)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    print(f"before: {describe(frame)}")
+    print(f"after:  {describe(optimized)}")
+    print(f"optimize_frame: median {times[len(times) // 2] * 1e3:.2f} ms, min {times[0] * 1e3:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
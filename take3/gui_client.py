@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+
+REQUEST_TIMEOUT = (2.0, 3.0)  # Connect, read
+MAX_PENDING = 16  # Distinct requests waiting; the oldest is dropped beyond this
+PUMP_INTERVAL_MS = 30  # How often Tk picks up finished requests
+
+
+class ServerClient:
+    """HTTP client for the Tk consoles that never blocks the Tk thread.
+
+    Requests are queued to one worker thread with a pooled keep-alive
+    session. Queued requests are keyed by (method, URL): a poll or post
+    that is still waiting is replaced by the newer one instead of being
+    sent twice, so a slow server sees at most one pending request per
+    endpoint. Results come back through a queue that pump() drains on the
+    Tk thread every PUMP_INTERVAL_MS (Tk must only be touched from there),
+    and callbacks get (data, error, latency_ms).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.latency_ms = None
+        self.dropped = 0
+        self._pending = OrderedDict()  # (method, url) -> (payload, callback)
+        self._condition = threading.Condition()
+        self._results = queue.SimpleQueue()
+        threading.Thread(target=self._run, daemon=True).start()
+        self.pump()
+
+    def get(self, url, callback):
+        self._submit('GET', url, None, callback)
+
+    def post(self, url, payload, callback=None):
+        self._submit('POST', url, payload, callback)
+
+    def _submit(self, method, url, payload, callback):
+        with self._condition:
+            key = (method, url)
+            self._pending.pop(key, None)
+            self._pending[key] = (payload, callback)
+            while len(self._pending) > MAX_PENDING:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                (method, url), (payload, callback) = self._pending.popitem(last=False)
+
+            start = time.perf_counter()
+            data = error = None
+            try:
+                if method == 'GET':
+                    response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+                else:
+                    response = self.session.post(url, json=payload, timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+                data = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                error = e
+            latency_ms = (time.perf_counter() - start) * 1000.0
+            self._results.put((callback, data, error, latency_ms))
+
+    def pump(self):
+        """Run finished callbacks on the Tk thread; reschedules itself with after()."""
+        while True:
+            try:
+                callback, data, error, latency_ms = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if error is None:
+                self.latency_ms = latency_ms
+            if callback is not None:
+                try:
+                    callback(data, error, latency_ms)
+                except Exception as e:
+                    print(f"Error in request callback: {e}")
+        self.root.after(PUMP_INTERVAL_MS, self.pump)
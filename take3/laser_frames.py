@@ -0,0 +1,174 @@
+"""Laser frames for the galvo controllers, computed on the host.
+
+    python laser_frames.py                      # Time every shape
+    python laser_frames.py heart --points 200 --print
+
+The shapes are the ones effects.ino draws point by point on the ESP32
+(square corners, the parametric heart, the six-beam sweep). Here a frame
+is a closed NumPy point list in FRAME_DTYPE: x and y in -1..1 (the DAC
+range, scale 1 matches the firmware's size), 8-bit r, g, b, and a blank
+flag for moves with the laser off. The last point repeats the first, so
+frames can be looped.
+
+Base geometry per shape and point count is computed once (LRU cache);
+scale, rotation and the beat pulse are applied to all points at once.
+to_dac() converts a frame into the 8-bit values the firmware writes
+with dacWrite/analogWrite, ready to be streamed.
+"""
+import argparse
+import time
+from functools import lru_cache
+import numpy as np
+
+FRAME_DTYPE = np.dtype([('x', 'f4'), ('y', 'f4'), ('r', 'u1'), ('g', 'u1'), ('b', 'u1'), ('blank', '?')])
+DAC_DTYPE = np.dtype([('x', 'u1'), ('y', 'u1'), ('r', 'u1'), ('g', 'u1'), ('b', 'u1')])
+GEOMETRY_CACHE_SIZE = 32  # Point counts kept per shape
+
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+BEAM_COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]
+BEAM_X = [10, 50, 90, 130, 170, 210]  # DAC values, as in effects.ino effect4
+BEAM_SWEEP_RATE = 5.0  # rad/s, the firmware's sin(0.005 * millis())
+HEART_PULSE = 2.0 / 9.0  # effects.ino: scale 9 +- 2 over a beat
+
+
+def _dac_to_unit(value):
+    return value / 127.5 - 1.0
+
+
+def _readonly(*arrays):
+    for array in arrays:
+        array.setflags(write=False)  # Shared by every frame built from the cache
+    return arrays
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def square_geometry(points_per_side=1):
+    """Corners (and optional points along the edges) of the effect1 square, red, closed."""
+    corners = np.array([[-1.0, -1.0], [-1.0, 1.0], [1.0, 1.0], [1.0, -1.0]], dtype=np.float32)
+    t = np.arange(points_per_side, dtype=np.float32)[:, None] / points_per_side
+    edges = corners[:, None, :] + t[None] * (np.roll(corners, -1, axis=0) - corners)[:, None, :]
+    xy = np.concatenate([edges.reshape(-1, 2), corners[:1]])
+    colors = np.tile(np.array(RED, dtype=np.uint8), (len(xy), 1))
+    return _readonly(xy, colors, np.zeros(len(xy), dtype=bool))
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def heart_geometry(points=35):
+    """The effect2 heart, rotated 90 degrees and split into red/green/blue thirds, closed."""
+    t = np.arange(points) / points * 2.0 * np.pi
+    x = 16.0 * np.sin(t) ** 3
+    y = 13.0 * np.cos(t) - 5.0 * np.cos(2 * t) - 2.0 * np.cos(3 * t) - np.cos(4 * t)
+    # Rotated (-y, x) and normalised the way the firmware maps it onto the DAC
+    xy = np.empty((points + 1, 2), dtype=np.float32)
+    xy[:-1, 0] = -y / 27.0
+    xy[:-1, 1] = x / 26.0
+    xy[-1] = xy[0]
+    # Same integer bounds as the firmware: i < numPoints / 3 red, i < 2 * numPoints / 3 green, then blue
+    index = np.arange(points)
+    third = (index >= points // 3).astype(np.intp) + (index >= 2 * points // 3)
+    colors = np.empty((points + 1, 3), dtype=np.uint8)
+    colors[:-1] = np.array([RED, GREEN, BLUE], dtype=np.uint8)[third]
+    colors[-1] = colors[0]
+    return _readonly(xy, colors, np.zeros(points + 1, dtype=bool))
+
+
+@lru_cache(maxsize=GEOMETRY_CACHE_SIZE)
+def beam_geometry(dwell=8):
+    """effect4 beams at y = 0: per beam one blanked move and `dwell` lit points, closed."""
+    per_beam = dwell + 1
+    count = len(BEAM_X) * per_beam
+    xy = np.zeros((count + 1, 2), dtype=np.float32)
+    xy[:-1, 0] = np.repeat(_dac_to_unit(np.array(BEAM_X, dtype=np.float32)), per_beam)
+    xy[-1] = xy[0]
+    colors = np.zeros((count + 1, 3), dtype=np.uint8)
+    colors[:-1] = np.repeat(np.array(BEAM_COLORS, dtype=np.uint8), per_beam, axis=0)
+    blank = np.zeros(count + 1, dtype=bool)
+    blank[::per_beam] = True  # Travel to each beam with the laser off
+    blank[-1] = True
+    return _readonly(xy, colors, blank)
+
+
+# Shape name -> (geometry function, its size parameter, default size)
+SHAPES = {
+    'square': (square_geometry, 'points_per_side', 1),
+    'heart': (heart_geometry, 'points', 35),
+    'beams': (beam_geometry, 'dwell', 8),
+}
+
+
+def render_frame(shape, size=None, scale=1.0, rotation=0.0, pulse=0.0, beat_phase=0.0, now=0.0,
+                 offset=(0.0, 0.0), out=None):
+    """One frame of a shape as a FRAME_DTYPE array.
+
+    scale multiplies the base size and rotation is in radians about the
+    centre. pulse is how much the size swells over the beat (the
+    firmware's heart uses HEART_PULSE), with beat_phase 0..1 from the
+    beat tracker. now (seconds) drives the beam sweep. Pass out (a
+    FRAME_DTYPE array of the right length) to reuse a buffer.
+    """
+    geometry, _, default_size = SHAPES[shape]
+    xy, colors, blank = geometry(default_size if size is None else size)
+    if out is None:
+        out = np.empty(len(xy), dtype=FRAME_DTYPE)
+    elif out.shape != (len(xy),):
+        raise ValueError(f"Output buffer holds {len(out)} points, frame has {len(xy)}")
+
+    size_factor = scale * (1.0 + pulse * np.sin(2.0 * np.pi * beat_phase))
+    cos_r = size_factor * np.cos(rotation)
+    sin_r = size_factor * np.sin(rotation)
+    dx, dy = offset
+    if shape == 'beams':
+        dy += np.sin(BEAM_SWEEP_RATE * now)  # All beams pan up and down together
+    x = xy[:, 0]
+    y = xy[:, 1]
+    out['x'] = cos_r * x - sin_r * y + dx
+    out['y'] = sin_r * x + cos_r * y + dy
+    out['r'] = colors[:, 0]
+    out['g'] = colors[:, 1]
+    out['b'] = colors[:, 2]
+    out['blank'] = blank
+    return out
+
+
+def to_dac(frame, out=None):
+    """8-bit galvo and laser values (DAC_DTYPE), clipped like the firmware's constrain(); blanked points are dark."""
+    if out is None:
+        out = np.empty(len(frame), dtype=DAC_DTYPE)
+    for axis in ('x', 'y'):
+        out[axis] = np.clip(np.rint((frame[axis] + 1.0) * 127.5), 0, 255)
+    lit = ~frame['blank']
+    for channel in ('r', 'g', 'b'):
+        out[channel] = frame[channel] * lit
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('shape', nargs='?', choices=sorted(SHAPES), help="Shape to time (default: all)")
+    parser.add_argument('--points', type=int, help="Size parameter of the shape (points, points per side or beam dwell)")
+    parser.add_argument('--frames', type=int, default=10000, help="Frames to time")
+    parser.add_argument('--print', action='store_true', help="Print the DAC values of one frame")
+    args = parser.parse_args()
+
+    for shape in [args.shape] if args.shape else sorted(SHAPES):
+        _, size_name, default_size = SHAPES[shape]
+        size = args.points or default_size
+        frame = render_frame(shape, size)
+        dac = np.empty(len(frame), dtype=DAC_DTYPE)
+        start = time.perf_counter()
+        for i in range(args.frames):
+            now = i / 100.0
+            render_frame(shape, size, scale=1.0, rotation=0.1 * now, pulse=HEART_PULSE,
+                         beat_phase=now % 1.0, now=now, out=frame)
+            to_dac(frame, out=dac)
+        elapsed = (time.perf_counter() - start) / args.frames
+        print(f"{shape} ({size_name}={size}): {len(frame)} points, {elapsed * 1e6:.1f} us/frame")
+        if args.print:
+            for point in dac:
+                print(*point)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Load test for the /status endpoint: requests/sec and latency percentiles.
+
+    python load_test.py                    # Compare ThreadingHTTPServer vs asyncio server in-process
+    python load_test.py http://host:8080/status [more urls...]
+
+Each client reuses its connection when the server allows keep-alive and
+reconnects when it doesn't, like a browser or ESP polling loop would.
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from async_server import AsyncHTTPServer, json_response, run_in_thread
+
+# Stand-in status payload for the in-process comparison
+SAMPLE_STATUS = {
+    'spotify_bpm': 128.0, 'volume_level': 0.42, 'is_beat_drop': 0, 'energy_level': 2,
+    'current_mode': 4, 'colors': ['#ff0000', '#00ff00', '#0000ff', '#ffffff'],
+}
+
+
+async def _client(host, port, path, deadline, latencies, errors):
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            headers = head.decode('latin-1').lower()
+            length = None
+            for line in headers.split('\r\n'):
+                if line.startswith('content-length:'):
+                    length = int(line.split(':', 1)[1])
+            if length is None:
+                await reader.read()  # HTTP/1.0 style: body runs until close
+            else:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if length is None or 'connection: close' in headers or head.startswith(b'HTTP/1.0'):
+                writer.close()
+                reader = writer = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            errors[0] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _run(url, clients, seconds):
+    parts = urlsplit(url)
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(parts.hostname, parts.port or 80, parts.path or '/', deadline, latencies, errors)
+                           for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return _summary(url, clients, elapsed, latencies, errors[0])
+
+
+def _summary(url, clients, elapsed, latencies, errors):
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000.0 if latencies else 0.0
+
+    return {
+        'url': url,
+        'clients': clients,
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'max_ms': latencies[-1] * 1000.0 if latencies else 0.0,
+    }
+
+
+def load_test(url, clients=50, seconds=5.0):
+    return asyncio.run(_run(url, clients, seconds))
+
+
+# In-process servers that answer /status the same way the two take3 servers do
+class _ThreadedStatusHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(SAMPLE_STATUS).encode())
+
+
+def _compare(clients, seconds):
+    threaded = ThreadingHTTPServer(('127.0.0.1', 0), _ThreadedStatusHandler)
+    threaded.request_queue_size = 1024
+    threading.Thread(target=threaded.serve_forever, daemon=True).start()
+
+    async_server = AsyncHTTPServer(lambda request: json_response(SAMPLE_STATUS), '127.0.0.1', 0)
+    run_in_thread(async_server)
+
+    results = [
+        dict(load_test(f"http://127.0.0.1:{threaded.server_address[1]}/status", clients, seconds), server='threading'),
+        dict(load_test(f"http://127.0.0.1:{async_server.port}/status", clients, seconds), server='asyncio'),
+    ]
+    threaded.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('urls', nargs='*')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+    args = parser.parse_args()
+
+    if args.urls:
+        results = [load_test(url, args.clients, args.seconds) for url in args.urls]
+    else:
+        results = _compare(args.clients, args.seconds)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        label = result.get('server', result['url'])
+        print(f"{label:>10}: {result['requests_per_sec']:8.0f} req/s  p50 {result['p50_ms']:6.2f} ms  "
+              f"p99 {result['p99_ms']:6.2f} ms  max {result['max_ms']:6.2f} ms  "
+              f"({result['requests']} requests, {result['errors']} errors, {result['clients']} clients)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+# Histogram bucket upper bounds, in seconds
+CALLBACK_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+JITTER_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02)
+REQUEST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+MAX_CLIENTS = 256  # Clients whose last poll is kept (oldest forgotten first)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Cumulative fixed-bucket histogram (Prometheus style).
+
+    counts has one slot per bucket plus an overflow slot and is allocated
+    once, so observe() is a bisect and two additions.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def to_dict(self):
+        return {'buckets': dict(zip([str(b) for b in self.bounds] + ['+Inf'], self.counts)),
+                'sum': self.sum, 'count': self.count}
+
+
+class RequestMetrics:
+    """Request latency per route and the last poll time per client address.
+
+    Routes outside the known set are counted as 'other', so a scan of
+    random URLs can't grow the table.
+    """
+
+    def __init__(self, routes):
+        self.latency = {route: Histogram(REQUEST_BUCKETS) for route in list(routes) + ['other']}
+        self.status = {}  # (route, status) -> count
+        self.clients = OrderedDict()  # address -> [last poll (wall clock), requests]
+        self._lock = threading.Lock()
+
+    def observe(self, route, status, seconds, client=None):
+        """seconds is None for long-lived responses (event streams), which only count as a poll."""
+        if route not in self.latency:
+            route = 'other'
+        with self._lock:
+            if seconds is not None:
+                self.latency[route].observe(seconds)
+            key = (route, status)
+            self.status[key] = self.status.get(key, 0) + 1
+            if client is not None:
+                entry = self.clients.get(client)
+                if entry is None:
+                    if len(self.clients) >= MAX_CLIENTS:
+                        self.clients.popitem(last=False)
+                    entry = self.clients[client] = [0.0, 0]
+                else:
+                    self.clients.move_to_end(client)
+                entry[0] = time.time()
+                entry[1] += 1
+
+    def snapshot(self):
+        """Copies taken under the lock: (latency, status, clients).
+
+        latency maps each route with requests to a {'bounds', 'counts', 'sum'}
+        dict, status is {(route, status): count} and clients is a list of
+        (address, last poll, requests), oldest first.
+        """
+        with self._lock:
+            latency = {route: {'bounds': histogram.bounds, 'counts': list(histogram.counts), 'sum': histogram.sum}
+                       for route, histogram in self.latency.items() if histogram.count}
+            clients = [(client, last, requests) for client, (last, requests) in self.clients.items()]
+            return latency, dict(self.status), clients
+
+    def to_dict(self):
+        with self._lock:
+            now = time.time()
+            return {
+                'latency_seconds': {route: histogram.to_dict() for route, histogram in self.latency.items()
+                                    if histogram.count},
+                'responses': [{'route': route, 'status': status, 'count': count}
+                              for (route, status), count in sorted(self.status.items())],
+                'clients': {client: {'last_poll': last, 'seconds_ago': now - last, 'requests': requests}
+                            for client, (last, requests) in self.clients.items()},
+            }
+
+
+def _histogram_lines(name, histogram, labels=''):
+    """Prometheus text lines for a Histogram or a {'bounds', 'counts', 'sum'} dict."""
+    if isinstance(histogram, Histogram):
+        bounds, counts, total = histogram.bounds, histogram.counts, histogram.sum
+    else:
+        bounds, counts, total = histogram['bounds'], histogram['counts'], histogram['sum']
+    prefix = labels + ',' if labels else ''
+    lines = []
+    cumulative = 0
+    for bound, count in zip(list(bounds) + ['+Inf'], counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    suffix = '{%s}' % labels if labels else ''
+    lines.append(f'{name}_sum{suffix} {total}')
+    lines.append(f'{name}_count{suffix} {cumulative}')
+    return lines
+
+
+def prometheus_text(audio_stats, render_stats, jitter_histogram, requests):
+    """Prometheus text exposition of the audio, render and HTTP metrics."""
+    lines = [
+        '# HELP galvo_audio_chunk_seconds Time to capture and analyse one audio chunk.',
+        '# TYPE galvo_audio_chunk_seconds histogram',
+    ]
+    lines += _histogram_lines('galvo_audio_chunk_seconds', {
+        'bounds': CALLBACK_BUCKETS, 'counts': audio_stats['chunk_histogram'], 'sum': audio_stats['chunk_seconds_sum']})
+    for field, help_text in (('chunks', 'Audio chunks analysed.'),
+                             ('input_overflows', 'Input overflows reported by the sound device.'),
+                             ('ring_overruns', 'Chunks overwritten in the ring before analysis.'),
+                             ('late_callbacks', 'Chunks that took longer than their own duration.')):
+        lines += [f'# HELP galvo_audio_{field}_total {help_text}', f'# TYPE galvo_audio_{field}_total counter',
+                  f'galvo_audio_{field}_total {audio_stats[field]}']
+
+    lines += ['# HELP galvo_render_jitter_seconds Lateness of each render frame against its schedule.',
+              '# TYPE galvo_render_jitter_seconds histogram']
+    lines += _histogram_lines('galvo_render_jitter_seconds', jitter_histogram)
+    for field, help_text in (('frames', 'Render frames.'),
+                             ('late_frames', 'Frames more than half a period late.'),
+                             ('skipped_frames', 'Frames skipped to catch up.')):
+        lines += [f'# HELP galvo_render_{field}_total {help_text}', f'# TYPE galvo_render_{field}_total counter',
+                  f'galvo_render_{field}_total {render_stats[field]}']
+
+    latency, status_counts, clients = requests.snapshot()
+    lines += ['# HELP galvo_http_request_seconds Time to handle a request, per route.',
+              '# TYPE galvo_http_request_seconds histogram']
+    for route, histogram in latency.items():
+        lines += _histogram_lines('galvo_http_request_seconds', histogram, f'route="{route}"')
+    lines += ['# HELP galvo_http_responses_total Responses per route and status.',
+              '# TYPE galvo_http_responses_total counter']
+    for (route, status), count in sorted(status_counts.items()):
+        lines.append(f'galvo_http_responses_total{{route="{route}",status="{status}"}} {count}')
+    lines += ['# HELP galvo_client_last_poll_timestamp_seconds Last request from each client.',
+              '# TYPE galvo_client_last_poll_timestamp_seconds gauge']
+    for client, last, _ in clients:
+        lines.append(f'galvo_client_last_poll_timestamp_seconds{{client="{client}"}} {last}')
+    return '\n'.join(lines) + '\n'
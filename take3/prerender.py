@@ -0,0 +1,198 @@
+"""Offline show pre-rendering: analyse an audio file into a timed cue file.
+
+    python prerender.py song.wav -o song.cue --color-mode rave [--track-id SPOTIFY_ID]
+
+The file goes through the live pipeline (AudioAnalyzer chunk by chunk,
+ColorRenderer on the analysis clock) as fast as the CPU allows. Set
+CUE_FILE in take3.py to play the result back through /status, /stream and
+UDP telemetry instead of analysing live input.
+
+Cue file layout (little-endian): an 80-byte header
+    magic 'GLCU', u16 version, u16 strips, u32 rate, u32 chunk, 64s track ID
+followed by one fixed-size record per analysed chunk (see cue_dtype()).
+"""
+import argparse
+import struct
+import time
+from multiprocessing import Array, Value
+import numpy as np
+from analyzer import AudioAnalyzer, ANALYSIS_FIELDS
+from audio_file import iter_chunks, load_audio
+from color_engine import ColorEngine, ColorRenderer, COLOR_MODE_NAMES
+from snapshot import SharedSnapshot
+
+CUE_MAGIC = b'GLCU'
+CUE_VERSION = 1
+HEADER = struct.Struct('<4sHHII64s')
+RATE = 44100
+CHUNK = 1024
+NUM_STRIPS = 4
+
+
+def cue_dtype(num_strips):
+    return np.dtype([
+        ('time', '<f4'),  # Seconds from the start of the track
+        ('volume_level', '<f4'),
+        ('energy_level', 'i1'),
+        ('is_beat_drop', 'u1'),
+        ('beat', 'u1'),  # 1 on the chunk where a beat was detected
+        ('reserved', 'u1'),
+        ('bpm', '<f4'),
+        ('beat_phase', '<f4'),
+        ('colors', '<u4', (num_strips,)),
+    ])
+
+
+class CueTrack:
+    """A cue file, memory-mapped for playback."""
+
+    def __init__(self, records, rate, chunk, track_id=''):
+        self.records = records
+        self.rate = rate
+        self.chunk = chunk
+        self.track_id = track_id
+        self.num_strips = records.dtype['colors'].shape[0]
+        self.times = records['time']
+        self.beat_counts = np.cumsum(records['beat'], dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        return float(self.times[-1]) + self.chunk / self.rate if len(self.records) else 0.0
+
+    @classmethod
+    def load(cls, path, num_strips=None):
+        """Map a cue file. With num_strips, a file rendered for another strip count is rejected."""
+        with open(path, 'rb') as f:
+            magic, version, file_strips, rate, chunk, track_id = HEADER.unpack(f.read(HEADER.size))
+        if magic != CUE_MAGIC or version != CUE_VERSION:
+            raise ValueError(f"{path} is not a version {CUE_VERSION} cue file")
+        if num_strips is not None and file_strips != num_strips:
+            raise ValueError(f"{path} was rendered for {file_strips} strips, expected {num_strips} "
+                             f"(re-render it with --strips {num_strips})")
+        num_strips = file_strips
+        records = np.memmap(path, dtype=cue_dtype(num_strips), mode='r', offset=HEADER.size)
+        return cls(records, rate, chunk, track_id.rstrip(b'\0').decode())
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(CUE_MAGIC, CUE_VERSION, self.num_strips, self.rate, self.chunk,
+                                self.track_id.encode()[:64]))
+            f.write(np.ascontiguousarray(self.records).tobytes())
+
+    def index_at(self, position):
+        """Record shown at a track position, -1 before the first one."""
+        return int(np.searchsorted(self.times, position, side='right')) - 1
+
+
+def prerender(samples, rate=RATE, chunk=CHUNK, color_mode=0, num_strips=NUM_STRIPS, track_id='',
+              transition_seconds=1.0, quantize=False, beats_per_transition=2):
+    """Run the live analysis and color pipeline over a whole signal; returns a CueTrack."""
+    analysis_state = SharedSnapshot(ANALYSIS_FIELDS)
+    color_state = SharedSnapshot([('colors', '%dI' % num_strips)])
+    try:
+        analysis_state.publish(energy_level=-1)
+        color_state.publish(colors=[0xFFFFFF] * num_strips)
+        analyzer = AudioAnalyzer(analysis_state, rate, chunk)
+
+        def timing():
+            analysis = analysis_state.read()
+            return analysis['local_bpm'], analysis['beat_phase'] if analysis['local_bpm'] > 0 else None
+
+        renderer = ColorRenderer(ColorEngine(num_strips), color_state, Value('i', color_mode, lock=False),
+                                 Array('i', [0xFFFFFF] * num_strips, lock=False), timing,
+                                 transition_seconds, quantize, beats_per_transition)
+
+        count = len(samples) // chunk
+        records = np.zeros(count, dtype=cue_dtype(num_strips))
+        beat_count = 0
+        clock = time.time()  # Analysis runs on a simulated clock, the analyzer expects wall-clock timestamps
+        for i, data in enumerate(iter_chunks(samples, chunk)):
+            position = i * chunk / rate
+            analyzer.process(data, current_time=clock + position)
+            renderer.render(position)
+            analysis = analysis_state.read()
+
+            record = records[i]
+            record['time'] = position
+            record['volume_level'] = analysis['volume_level']
+            record['energy_level'] = analysis['energy_level']
+            record['is_beat_drop'] = analysis['is_beat_drop']
+            record['beat'] = analysis['beat_count'] != beat_count
+            record['bpm'] = analysis['local_bpm']
+            record['beat_phase'] = analysis['beat_phase']
+            record['colors'] = color_state.read()['colors']
+            beat_count = analysis['beat_count']
+        return CueTrack(records, rate, chunk, track_id)
+    finally:
+        analysis_state.close()
+        color_state.close()
+
+
+class CuePlayer:
+    """Publishes a CueTrack into the live snapshots in place of the analyzer and color renderer.
+
+    Runs on the render loop; started_at is the wall-clock time the track
+    started and can be moved to resync when Spotify reports the track. Cue
+    mode runs no live analysis, so fingerprint identity can't resync it.
+    """
+
+    def __init__(self, cue, analysis_state, color_state, started_at=None):
+        self.cue = cue
+        self.analysis_state = analysis_state
+        self.color_state = color_state
+        self.started_at = time.time() if started_at is None else started_at
+        self._index = None
+        self._drop_timestamp = 0.0
+
+    def render(self, now):
+        current_time = time.time()
+        index = self.cue.index_at(current_time - self.started_at)
+        if index == self._index:
+            return
+        self._index = index
+        if index < 0 or index >= len(self.cue):
+            self.analysis_state.publish(timestamp=current_time, volume_level=0.0, is_beat_drop=0, energy_level=-1)
+            return
+
+        record = self.cue.records[index]
+        if record['is_beat_drop'] and (index == 0 or not self.cue.records[index - 1]['is_beat_drop']):
+            self._drop_timestamp = self.started_at + float(record['time'])
+        self.analysis_state.publish(
+            timestamp=current_time,
+            volume_level=float(record['volume_level']),
+            is_beat_drop=int(record['is_beat_drop']),
+            energy_level=int(record['energy_level']),
+            beat_drop_timestamp=self._drop_timestamp,
+            local_bpm=float(record['bpm']),
+            beat_phase=float(record['beat_phase']),
+            beat_count=int(self.cue.beat_counts[index]),
+        )
+        self.color_state.publish(colors=record['colors'].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('audio')
+    parser.add_argument('-o', '--output', help="Cue file (default: audio file name with .cue)")
+    parser.add_argument('--color-mode', choices=sorted(COLOR_MODE_NAMES), default='full_spectrum')
+    parser.add_argument('--track-id', default='', help="Spotify track ID to sync playback to (fingerprints can't: cue mode has no live analysis)")
+    parser.add_argument('--strips', type=int, default=NUM_STRIPS)
+    parser.add_argument('--beat-quantized', action='store_true')
+    args = parser.parse_args()
+
+    samples = load_audio(args.audio, RATE)
+    start = time.perf_counter()
+    cue = prerender(samples, color_mode=COLOR_MODE_NAMES[args.color_mode], num_strips=args.strips,
+                    track_id=args.track_id, quantize=args.beat_quantized)
+    elapsed = time.perf_counter() - start
+    output = args.output or args.audio.rsplit('.', 1)[0] + '.cue'
+    cue.save(output)
+    print(f"{len(cue)} cues, {int(cue.beat_counts[-1]) if len(cue) else 0} beats, "
+          f"{cue.duration:.1f} s of audio in {elapsed:.1f} s ({cue.duration / elapsed:.0f}x real time) -> {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import time
+import threading
+import numpy as np
+from metrics import Histogram, JITTER_BUCKETS
+
+RENDER_FPS = 100  # Default output frame rate
+STATS_WINDOW = 1024  # Frames kept for the jitter/frame time statistics
+
+
+class FrameClock:
+    """Monotonic frame clock with drift compensation.
+
+    Frame n is due at start + n * period, so time spent rendering never
+    accumulates into drift the way sleep(period) after each frame does. If
+    the loop falls more than a frame behind, the missed frames are skipped
+    instead of being rendered back to back.
+    """
+
+    def __init__(self, fps=RENDER_FPS):
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.start = time.monotonic()
+        self.frame = 0
+        self.late_frames = 0
+        self.skipped_frames = 0
+
+        # Preallocated rings so recording a frame never allocates
+        self._jitter = np.zeros(STATS_WINDOW)
+        self._frame_time = np.zeros(STATS_WINDOW)
+        self._samples = 0
+        self.jitter_histogram = Histogram(JITTER_BUCKETS)  # Since start, for /metrics
+
+    def wait(self):
+        """Sleep until the next frame is due and return its scheduled time."""
+        self.frame += 1
+        due = self.start + self.frame * self.period
+        now = time.monotonic()
+        if now < due:
+            time.sleep(due - now)
+            now = time.monotonic()
+        elif now - due > self.period:
+            missed = int((now - due) / self.period)
+            self.skipped_frames += missed
+            self.frame += missed
+            due = self.start + self.frame * self.period
+
+        jitter = now - due
+        if jitter > 0.5 * self.period:
+            self.late_frames += 1
+        self._jitter[self._samples % STATS_WINDOW] = jitter
+        self.jitter_histogram.observe(max(jitter, 0.0))
+        return due
+
+    def record_frame_time(self, seconds):
+        self._frame_time[self._samples % STATS_WINDOW] = seconds
+        self._samples += 1
+
+    def stats(self):
+        count = min(self._samples, STATS_WINDOW)
+        jitter = np.abs(self._jitter[:count]) * 1000.0
+        frame_time = self._frame_time[:count] * 1000.0
+        return {
+            'fps': self.fps,
+            'frames': self.frame,
+            'late_frames': self.late_frames,
+            'skipped_frames': self.skipped_frames,
+            'jitter_ms': {
+                'mean': float(jitter.mean()) if count else 0.0,
+                'p99': float(np.percentile(jitter, 99)) if count else 0.0,
+                'max': float(jitter.max()) if count else 0.0,
+            },
+            'frame_time_ms': {
+                'mean': float(frame_time.mean()) if count else 0.0,
+                'p99': float(np.percentile(frame_time, 99)) if count else 0.0,
+                'max': float(frame_time.max()) if count else 0.0,
+            },
+        }
+
+
+class RenderScheduler:
+    """Calls every registered renderer once per frame with the frame's scheduled time."""
+
+    def __init__(self, fps=RENDER_FPS):
+        self.clock = FrameClock(fps)
+        self.renderers = []
+        self._lock = threading.Lock()
+
+    def add(self, renderer):
+        with self._lock:
+            self.renderers.append(renderer)
+
+    def remove(self, renderer):
+        with self._lock:
+            self.renderers.remove(renderer)
+
+    def run(self, stop_event=None):
+        while stop_event is None or not stop_event.is_set():
+            frame_time = self.clock.wait()
+            started = time.monotonic()
+            with self._lock:
+                renderers = list(self.renderers)
+            for renderer in renderers:
+                try:
+                    renderer(frame_time)
+                except Exception as e:
+                    print(f"Renderer error: {e}")
+            self.clock.record_frame_time(time.monotonic() - started)
+
+    def stats(self):
+        stats = self.clock.stats()
+        stats['renderers'] = len(self.renderers)
+        return stats
+
+
+def beat_quantized_start(now, bpm, beat_phase=None):
+    """Time of the next beat, or now if the phase is unknown."""
+    if bpm <= 0 or beat_phase is None:
+        return now
+    return now + (1.0 - beat_phase) * 60.0 / bpm
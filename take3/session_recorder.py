@@ -0,0 +1,265 @@
+"""Session recorder and replay driver for reproducible analysis runs.
+
+    python session_recorder.py info night.glrs
+    python session_recorder.py replay night.glrs [--realtime] [--memory] [--json]
+
+Set RECORD_SESSION in take3.py to record. Every input chunk is written,
+together with the snapshot it produced (volume, energy, beat drop, mode,
+colors), to a memory-mapped file by a writer thread, off the audio path.
+Replaying feeds the recorded audio back through a fresh AudioAnalyzer, at
+the original pace or as fast as possible, and reports per-chunk latency,
+memory and how closely the results match what was recorded.
+
+File layout (little-endian): a 32-byte header
+    magic 'GLRS', u16 version, u16 channels, u32 rate, u32 chunk, u32 strips,
+    u32 reserved, u64 chunk count
+followed by one fixed-size record per chunk (see record_dtype()).
+"""
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+import tracemalloc
+import numpy as np
+from analyzer import AudioAnalyzer, ANALYSIS_FIELDS
+from snapshot import SharedSnapshot
+
+SESSION_MAGIC = b'GLRS'
+SESSION_VERSION = 1
+HEADER = struct.Struct('<4sHHIIIIQ')
+COUNT_OFFSET = HEADER.size - 8
+INITIAL_SECONDS = 600  # File space reserved up front, doubled whenever it fills
+RING_SECONDS = 10.0  # Chunks buffered in memory between the audio callback and the writer thread
+WRITE_INTERVAL = 0.1  # Seconds between writer passes
+DROP_TOLERANCE = 0.5  # Seconds a replayed beat drop may be off and still count as the same drop
+
+
+def record_dtype(chunk, channels, num_strips):
+    return np.dtype([
+        ('timestamp', '<f8'),
+        ('audio', '<f4', (chunk, channels)),
+        ('volume_level', '<f4'),
+        ('energy_level', 'i1'),
+        ('is_beat_drop', 'u1'),
+        ('mode', 'u1'),
+        ('reserved', 'u1'),
+        ('colors', '<u4', (num_strips,)),
+    ])
+
+
+class SessionRecorder:
+    """Appends chunks to a memory-mapped session file.
+
+    record() runs in the audio callback and only copies the chunk into the
+    next slot of a preallocated in-memory ring. A writer thread moves the
+    records into the file and grows it, so file I/O never blocks the
+    callback. If the writer falls a whole ring behind, chunks are dropped
+    (and counted) instead. count is the number of records in the file.
+    """
+
+    def __init__(self, path, rate, chunk, channels, num_strips):
+        self.path = path
+        self.dtype = record_dtype(chunk, channels, num_strips)
+        self.count = 0
+        self.dropped = 0
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(SESSION_MAGIC, SESSION_VERSION, channels, rate, chunk, num_strips, 0, 0))
+        self._header = None
+        self._records = None
+        self._map(int(INITIAL_SECONDS * rate / chunk))
+
+        self._ring = np.zeros(max(2, int(RING_SECONDS * rate / chunk)), dtype=self.dtype)
+        self._received = 0  # Written by record() only, after the slot is filled
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+
+    def _map(self, capacity):
+        if self._records is not None:
+            self._records.flush()
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER.size + capacity * self.dtype.itemsize)
+        self._header = np.memmap(self.path, dtype='<u8', mode='r+', offset=COUNT_OFFSET, shape=(1,))
+        self._records = np.memmap(self.path, dtype=self.dtype, mode='r+', offset=HEADER.size, shape=(capacity,))
+
+    def record(self, audio, analysis, mode, colors, timestamp=None):
+        if self._received - self.count >= len(self._ring):
+            self.dropped += 1  # Writer is a whole ring behind
+            return
+        record = self._ring[self._received % len(self._ring)]
+        record['timestamp'] = analysis['timestamp'] if timestamp is None else timestamp
+        record['audio'] = audio
+        record['volume_level'] = analysis['volume_level']
+        record['energy_level'] = analysis['energy_level']
+        record['is_beat_drop'] = analysis['is_beat_drop']
+        record['mode'] = mode
+        record['colors'] = colors
+        self._received += 1
+
+    def _run(self):
+        while not self._stop.wait(WRITE_INTERVAL):
+            self._write()
+        self._write()
+
+    def _write(self):
+        received = self._received
+        while self.count < received:
+            start = self.count % len(self._ring)
+            batch = min(received - self.count, len(self._ring) - start)
+            if self.count + batch > len(self._records):
+                self._map(max(2 * len(self._records), self.count + batch))
+            self._records[self.count:self.count + batch] = self._ring[start:start + batch]
+            self.count += batch  # Frees the ring slots for record()
+            self._header[0] = self.count  # Readers only trust records below the stored count
+
+    def close(self):
+        self._stop.set()
+        self._writer.join()
+        self._records.flush()
+        self._header.flush()
+        self._records = None
+        self._header = None
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER.size + self.count * self.dtype.itemsize)
+
+
+class Session:
+    """A recorded session, memory-mapped read-only."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, version, channels, rate, chunk, num_strips, _, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != SESSION_MAGIC or version != SESSION_VERSION:
+            raise ValueError(f"{path} is not a version {SESSION_VERSION} session file")
+        self.path = path
+        self.rate = rate
+        self.chunk = chunk
+        self.channels = channels
+        self.num_strips = num_strips
+        self.records = np.memmap(path, dtype=record_dtype(chunk, channels, num_strips), mode='r',
+                                 offset=HEADER.size, shape=(count,))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        return len(self.records) * self.chunk / self.rate
+
+
+def _drop_onsets(flags, timestamps):
+    flags = np.asarray(flags, dtype=bool)
+    starts = flags & ~np.concatenate(([False], flags[:-1]))
+    return np.asarray(timestamps)[starts]
+
+
+def replay(session, realtime=False, trace_memory=False):
+    """Run the recording through a fresh AudioAnalyzer and compare with what was recorded.
+
+    trace_memory measures peak Python allocations with tracemalloc, which
+    slows the analysis down several times, so latencies aren't comparable.
+    """
+    records = session.records
+    count = len(records)
+    period = session.chunk / session.rate
+    latencies = np.zeros(count)
+    energy = np.zeros(count, dtype=np.int8)
+    drops = np.zeros(count, dtype=np.uint8)
+    volume = np.zeros(count, dtype=np.float32)
+
+    state = SharedSnapshot(ANALYSIS_FIELDS)
+    try:
+        analyzer = AudioAnalyzer(state, session.rate, session.chunk)
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        for i in range(count):
+            if realtime:
+                delay = start + i * period - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            record = records[i]
+            begin = time.perf_counter()
+            analyzer.process(np.mean(record['audio'], axis=1), current_time=float(record['timestamp']))
+            latencies[i] = time.perf_counter() - begin
+
+            analysis = state.read()
+            volume[i] = analysis['volume_level']
+            energy[i] = analysis['energy_level']
+            drops[i] = analysis['is_beat_drop']
+        elapsed = time.perf_counter() - start
+        peak_memory = None
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1] / 1024.0
+            tracemalloc.stop()
+    finally:
+        state.close()
+
+    # Drops found in both runs, matched within DROP_TOLERANCE
+    recorded_drops = _drop_onsets(records['is_beat_drop'], records['timestamp'])
+    replayed_drops = _drop_onsets(drops, records['timestamp'])
+    matched = sum(1 for t in recorded_drops if np.any(np.abs(replayed_drops - t) <= DROP_TOLERANCE))
+
+    latency_ms = latencies * 1000.0
+    return {
+        'session': os.path.basename(session.path),
+        'chunks': count,
+        'audio_seconds': session.duration,
+        'elapsed_seconds': elapsed,
+        'speed': session.duration / elapsed if elapsed > 0 else 0.0,
+        'chunk_ms': {
+            'mean': float(latency_ms.mean()) if count else 0.0,
+            'p50': float(np.percentile(latency_ms, 50)) if count else 0.0,
+            'p99': float(np.percentile(latency_ms, 99)) if count else 0.0,
+            'max': float(latency_ms.max()) if count else 0.0,
+            'budget': period * 1000.0,
+        },
+        'late_chunks': int(np.count_nonzero(latencies > period)),
+        'peak_memory_kb': peak_memory,
+        'accuracy': {
+            'volume_mae': float(np.mean(np.abs(volume - records['volume_level']))) if count else 0.0,
+            'energy_level_match': float(np.mean(energy == records['energy_level'])) if count else 1.0,
+            'beat_drop_match': float(np.mean(drops == records['is_beat_drop'])) if count else 1.0,
+            'recorded_drops': len(recorded_drops),
+            'replayed_drops': len(replayed_drops),
+            'matched_drops': matched,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['info', 'replay'])
+    parser.add_argument('session')
+    parser.add_argument('--realtime', action='store_true', help="Replay at the recorded pace instead of max speed")
+    parser.add_argument('--memory', action='store_true', help="Trace peak allocations (slows the replay down)")
+    parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+    args = parser.parse_args()
+
+    session = Session(args.session)
+    if args.command == 'info':
+        records = session.records
+        print(f"{len(session)} chunks, {session.duration:.1f} s at {session.rate} Hz, {session.channels} channels, "
+              f"{len(_drop_onsets(records['is_beat_drop'], records['timestamp']))} beat drops")
+        return
+
+    result = replay(session, args.realtime, args.memory)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    latency = result['chunk_ms']
+    accuracy = result['accuracy']
+    print(f"{result['audio_seconds']:.1f} s replayed in {result['elapsed_seconds']:.2f} s ({result['speed']:.0f}x)")
+    print(f"per chunk: mean {latency['mean']:.3f} ms  p50 {latency['p50']:.3f}  p99 {latency['p99']:.3f}  "
+          f"max {latency['max']:.3f}  (budget {latency['budget']:.1f} ms, {result['late_chunks']} late)")
+    if result['peak_memory_kb'] is not None:
+        print(f"peak memory {result['peak_memory_kb']:.0f} KB")
+    print(f"energy level match {accuracy['energy_level_match']:.1%}, beat drop match {accuracy['beat_drop_match']:.1%}, "
+          f"drops {accuracy['matched_drops']}/{accuracy['recorded_drops']} matched "
+          f"({accuracy['replayed_drops']} replayed), volume MAE {accuracy['volume_mae']:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Header: sequence number (odd while a write is in progress)
+_SEQ = struct.Struct('<Q')
+
+
+class SharedSnapshot:
+    """Versioned, fixed-layout record in shared memory (seqlock).
+
+    There is exactly one writer. It bumps the sequence number to an odd value,
+    writes every field and bumps it back to even. Readers copy the record and
+    retry if the sequence changed underneath them, so they never block the
+    writer and never see a torn mix of old and new fields.
+
+    fields is a list of (name, struct_format) pairs, e.g. ('volume_level', 'f')
+    or ('colors', '4I') for a fixed-size array. The snapshot can be passed to a
+    multiprocessing.Process; the child attaches to the same block by name.
+    """
+
+    def __init__(self, fields, name=None, create=True):
+        self.fields = list(fields)
+        self._struct = struct.Struct('<' + ''.join(fmt for _, fmt in self.fields))
+        self._counts = [_field_count(fmt) for _, fmt in self.fields]
+        size = _SEQ.size + self._struct.size
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self._owner = create
+        self._buf = self._shm.buf
+        if create:
+            self._buf[:size] = bytes(size)
+        self._seq = _SEQ.unpack_from(self._buf, 0)[0]
+        self._values = self._unpack(self._struct.unpack_from(self._buf, _SEQ.size))
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __getstate__(self):
+        return {'fields': self.fields, 'name': self._shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['fields'], name=state['name'], create=False)
+
+    def _unpack(self, flat):
+        values = {}
+        pos = 0
+        for (name, _), count in zip(self.fields, self._counts):
+            if count is None:
+                values[name] = flat[pos]
+                pos += 1
+            else:
+                values[name] = flat[pos:pos + count]
+                pos += count
+        return values
+
+    def _pack(self, values):
+        flat = []
+        for (name, _), count in zip(self.fields, self._counts):
+            if count is None:
+                flat.append(values[name])
+            else:
+                flat.extend(values[name])
+        return flat
+
+    # Writer side
+    def publish(self, **changes):
+        """Write a new version of the record. Fields not given keep their last value."""
+        self._values.update(changes)
+        flat = self._pack(self._values)
+        self._seq += 1
+        _SEQ.pack_into(self._buf, 0, self._seq)
+        self._struct.pack_into(self._buf, _SEQ.size, *flat)
+        self._seq += 1
+        _SEQ.pack_into(self._buf, 0, self._seq)
+
+    # Reader side
+    def read(self):
+        """Return a consistent copy of the record as a dict, plus its 'version'."""
+        buf = self._buf
+        while True:
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            flat = self._struct.unpack_from(buf, _SEQ.size)
+            if _SEQ.unpack_from(buf, 0)[0] == seq:
+                values = self._unpack(flat)
+                values['version'] = seq >> 1
+                return values
+
+    def version(self):
+        """Current version number, cheap enough to poll for changes."""
+        return _SEQ.unpack_from(self._buf, 0)[0] >> 1
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _field_count(fmt):
+    digits = fmt[:-1]
+    return int(digits) if digits else None
@@ -0,0 +1,97 @@
+import numpy as np
+from filterbank import DEFAULT_BANDS
+
+ROLLOFF_FRACTION = 0.85  # Rolloff = frequency below which 85% of the energy sits
+
+
+class SpectralAnalyzer:
+    """Windowed rFFT features for one chunk at a time.
+
+    The window, bin frequencies and band edges are computed once and every
+    intermediate result goes into a preallocated buffer, so process() does
+    not allocate on the audio path.
+
+    A band covers the bins from its start up to the next band's start. With
+    small chunks a narrow band (e.g. sub-bass at 256 samples) may contain no
+    bin at all; its energy is then 0 rather than borrowed from a neighbour.
+    """
+
+    def __init__(self, rate, chunk, bands=DEFAULT_BANDS):
+        self.rate = rate
+        self.chunk = chunk
+        self.window = np.hanning(chunk)
+        self.freqs = np.fft.rfftfreq(chunk, 1.0 / rate)
+        bins = len(self.freqs)
+
+        # Bin index where each band starts, plus the end of the last band
+        # (bands are contiguous, each one runs up to the start of the next)
+        edges = [int(np.searchsorted(self.freqs, low)) for _, low, _ in bands]
+        edges.append(max(edges[-1], int(np.searchsorted(self.freqs, bands[-1][2]))))
+        self._band_starts = np.array(edges[:-1], dtype=np.intp)
+        self._band_stops = np.array(edges[1:], dtype=np.intp)
+        self.band_names = [name for name, _, _ in bands]
+
+        self._windowed = np.zeros(chunk)
+        self._spectrum = np.zeros(bins, dtype=np.complex128)
+        self.magnitude = np.zeros(bins)
+        self._previous = np.zeros(bins)
+        self._power = np.zeros(bins)
+        self._cumulative = np.zeros(bins + 1)  # Leading 0, so band energy = cumulative[stop] - cumulative[start]
+        self._band_scratch = np.zeros(len(bands))
+        self._scratch = np.zeros(bins)
+        self.band_energies = np.zeros(len(bands))
+
+        self.centroid = 0.0
+        self.flux = 0.0
+        self.rolloff = 0.0
+
+        # rfft(out=...) only exists from numpy 2.0
+        try:
+            np.fft.rfft(self._windowed, out=self._spectrum)
+            self._rfft_out = True
+        except TypeError:
+            self._rfft_out = False
+
+    def process(self, data):
+        """Analyse one mono chunk and update the feature attributes."""
+        if len(data) != self.chunk:
+            raise ValueError(f"Expected a chunk of {self.chunk} samples, got {len(data)}")
+
+        np.multiply(data, self.window, out=self._windowed)
+        if self._rfft_out:
+            np.fft.rfft(self._windowed, out=self._spectrum)
+        else:
+            self._spectrum[:] = np.fft.rfft(self._windowed)
+
+        np.abs(self._spectrum, out=self.magnitude)
+        np.square(self.magnitude, out=self._power)
+
+        # Per-band energy from the running sum of power, normalised by chunk length
+        cumulative = self._cumulative
+        np.cumsum(self._power, out=cumulative[1:])
+        np.take(cumulative, self._band_stops, out=self.band_energies)
+        np.take(cumulative, self._band_starts, out=self._band_scratch)
+        self.band_energies -= self._band_scratch
+        self.band_energies /= self.chunk
+
+        total = self.magnitude.sum()
+        if total > 1e-12:
+            np.multiply(self.freqs, self.magnitude, out=self._scratch)
+            self.centroid = float(self._scratch.sum() / total)
+        else:
+            self.centroid = 0.0
+
+        # Spectral flux: positive change in magnitude since the last chunk
+        np.subtract(self.magnitude, self._previous, out=self._scratch)
+        np.maximum(self._scratch, 0.0, out=self._scratch)
+        self.flux = float(self._scratch.sum() / self.chunk)
+        self._previous[:] = self.magnitude
+
+        total_power = cumulative[-1]
+        if total_power > 1e-12:
+            index = np.searchsorted(cumulative[1:], ROLLOFF_FRACTION * total_power)
+            self.rolloff = float(self.freqs[min(index, len(self.freqs) - 1)])
+        else:
+            self.rolloff = 0.0
+
+        return self
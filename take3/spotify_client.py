@@ -0,0 +1,354 @@
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import requests
+
+SPOTIFY_API_BASE = 'https://api.spotify.com/v1'
+SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+POLL_INTERVAL = 1.0  # While a track is playing, so track changes show up within a second
+IDLE_POLL_INTERVAL = 5.0  # Nothing playing
+MAX_BACKOFF = 60.0  # Upper bound for error/rate-limit backoff
+TOKEN_REFRESH_MARGIN = 60.0  # Refresh this many seconds before the token expires
+RESTART_SECONDS = 10.0  # A jump in position this large (replay or seek) starts a new play of the track
+FEATURE_CACHE_SIZE = 2048
+FEATURE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spotify_features.json')
+
+
+class SpotifyTokens:
+    """Access token that refreshes itself before it expires.
+
+    With a refresh token it uses the refresh_token grant (needed for the
+    /me/player endpoints); with only a client ID/secret it falls back to the
+    client_credentials grant; with neither it uses the fixed access token.
+    """
+
+    def __init__(self, session, client_id='', client_secret='', refresh_token='', access_token='',
+                 token_url=SPOTIFY_TOKEN_URL):
+        self.session = session
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.token_url = token_url
+        self.access_token = access_token
+        # A token passed in has an unknown age: replace it right away when we can refresh
+        self.expires_at = float('inf') if access_token and not self.can_refresh() else 0.0
+        self.refreshes = 0
+
+    def can_refresh(self):
+        return bool(self.client_id and self.client_secret)
+
+    def get(self):
+        if self.can_refresh() and time.time() >= self.expires_at - TOKEN_REFRESH_MARGIN:
+            self.refresh()
+        return self.access_token
+
+    def invalidate(self):
+        if self.can_refresh():
+            self.expires_at = 0.0
+
+    def refresh(self):
+        credentials = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+        if self.refresh_token:
+            data = {'grant_type': 'refresh_token', 'refresh_token': self.refresh_token}
+        else:
+            data = {'grant_type': 'client_credentials'}
+        response = self.session.post(self.token_url, data=data, timeout=5,
+                                     headers={'Authorization': f"Basic {credentials}"})
+        response.raise_for_status()
+        token = response.json()
+        self.access_token = token['access_token']
+        self.expires_at = time.time() + float(token.get('expires_in', 3600))
+        self.refresh_token = token.get('refresh_token', self.refresh_token)
+        self.refreshes += 1
+
+
+class FeatureCache:
+    """LRU cache of audio features per track ID, persisted to a JSON file."""
+
+    def __init__(self, path=FEATURE_CACHE_FILE, max_size=FEATURE_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, track_id):
+        features = self._items.get(track_id)
+        if features is not None:
+            self._items.move_to_end(track_id)
+        return features
+
+    def put(self, track_id, features):
+        self._items[track_id] = features
+        self._items.move_to_end(track_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        self._dirty = True
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                for track_id, features in json.load(f):
+                    self._items[track_id] = features
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable Spotify feature cache: {e}")
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(list(self._items.items()), f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+class SpotifyService:
+    """Background Spotify poller with a pooled session and cached audio features.
+
+    Calls on_track(track_id, features) whenever a play starts (a new track,
+    or the same one replayed or seeked in); features is None if
+    they couldn't be fetched. on_idle() is called when playback stops.
+    track_started_at is the wall-clock time the current track started, from
+    the reported progress, and track_duration its length in seconds.
+    """
+
+    def __init__(self, tokens, session, on_track, cache=None, api_base=SPOTIFY_API_BASE, on_idle=None):
+        self.tokens = tokens
+        self.session = session
+        self.on_track = on_track
+        self.on_idle = on_idle
+        self.cache = cache if cache is not None else FeatureCache()
+        self.api_base = api_base
+        self.track_id = None
+        self.features = None
+        self.track_started_at = None
+        self.track_duration = None
+        self.requests = 0
+        self._etag = None
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _get(self, url, headers=None):
+        headers = dict(headers or {})
+        headers['Authorization'] = f"Bearer {self.tokens.get()}"
+        self.requests += 1
+        response = self.session.get(url, headers=headers, timeout=5)
+        if response.status_code == 401 and self.tokens.can_refresh():
+            self.tokens.invalidate()
+            headers['Authorization'] = f"Bearer {self.tokens.get()}"
+            self.requests += 1
+            response = self.session.get(url, headers=headers, timeout=5)
+        return response
+
+    def audio_features(self, track_id):
+        """Features for a track, or None if Spotify has none. Raises on errors worth retrying (429, 5xx, network)."""
+        features = self.cache.get(track_id)
+        if features is not None:
+            return features
+        response = self._get(f"{self.api_base}/audio-features/{track_id}")
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        features = {key: data.get(key) for key in ('tempo', 'energy', 'danceability', 'loudness',
+                                                   'time_signature', 'key', 'mode', 'duration_ms')}
+        self.cache.put(track_id, features)
+        self.cache.save()
+        return features
+
+    def poll_once(self):
+        """One currently-playing check. Returns seconds to wait before the next one."""
+        headers = {'If-None-Match': self._etag} if self._etag else {}
+        response = self._get(f"{self.api_base}/me/player/currently-playing", headers)
+
+        if response.status_code == 429:
+            return min(float(response.headers.get('Retry-After', 5)), MAX_BACKOFF)
+        if response.status_code == 304:
+            return POLL_INTERVAL
+        if response.status_code == 204:
+            self._idle()
+            return IDLE_POLL_INTERVAL
+        response.raise_for_status()
+
+        etag = response.headers.get('ETag')
+        playing = response.json() or {}
+        item = playing.get('item') or {}
+        track_id = item.get('id')
+        if track_id is None or not playing.get('is_playing', True):
+            self._idle()
+            self._etag = etag
+            return IDLE_POLL_INTERVAL
+
+        started_at = time.time() - (playing.get('progress_ms') or 0) / 1000.0
+        if track_id != self.track_id or abs(started_at - self.track_started_at) > RESTART_SECONDS:
+            # Fetched before anything is committed: if this raises, the next poll
+            # (without the ETag) sees the track as new and tries again
+            features = self.audio_features(track_id)
+            self.track_id = track_id
+            self.track_started_at = started_at
+            self.track_duration = (item.get('duration_ms') or 0) / 1000.0 or None
+            self.features = features
+            self._notify(self.on_track, track_id, features)
+        self._etag = etag
+        return POLL_INTERVAL
+
+    def _idle(self):
+        if self.track_id is None:
+            return
+        self.track_id = None
+        self.track_started_at = None
+        self.features = None
+        self._etag = None  # The same track resuming is a new play
+        if self.on_idle is not None:
+            self._notify(self.on_idle)
+
+    def _notify(self, callback, *args):
+        # A failing callback (e.g. the track store's SQLite write) must not stop the poller
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Spotify track callback failed: {e!r}")
+
+    def run(self):
+        backoff = POLL_INTERVAL
+        while not self._stop.is_set():
+            try:
+                delay = self.poll_once()
+                backoff = POLL_INTERVAL
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                print(f"Error polling Spotify: {e}")
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                delay = backoff
+            self._stop.wait(delay)
+
+
+# Local stub of the Spotify endpoints, used to check the client without the real API
+def _stub_check():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import tempfile
+
+    state = {'tokens': 0, 'features': 0, 'track': 'track-a', 'bad_token': None, 'features_down': False,
+             'progress_ms': 0}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, code, payload=None, headers=()):
+            body = json.dumps(payload).encode() if payload is not None else b''
+            self.send_response(code)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            state['tokens'] += 1
+            self._json(200, {'access_token': f"token-{state['tokens']}", 'expires_in': 3600})
+
+        def do_GET(self):
+            if self.headers.get('Authorization') == f"Bearer {state['bad_token']}":
+                return self._json(401, {'error': 'expired'})
+            if self.path.endswith('/currently-playing'):
+                if state['track'] is None:
+                    return self._json(204)
+                etag = f'"{state["track"]}-{state["progress_ms"]}"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self._json(304)
+                return self._json(200, {'item': {'id': state['track'], 'duration_ms': 180000},
+                                        'progress_ms': state['progress_ms']}, [('ETag', etag)])
+            if '/audio-features/' in self.path:
+                if state['features_down']:
+                    return self._json(503, {'error': 'unavailable'})
+                state['features'] += 1
+                return self._json(200, {'tempo': 120.0 + len(self.path) % 7, 'energy': 0.8})
+            self._json(404, {'error': 'not found'})
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    cache_path = os.path.join(tempfile.mkdtemp(), 'features.json')
+    seen = []
+    idle = []
+    session = requests.Session()
+    tokens = SpotifyTokens(session, 'id', 'secret', token_url=f"{base}/api/token")
+    service = SpotifyService(tokens, session, lambda track, features: seen.append((track, features)),
+                             FeatureCache(cache_path), api_base=f"{base}/v1", on_idle=lambda: idle.append(True))
+
+    checks = []
+    service.poll_once()
+    service.poll_once()
+    checks.append(("conditional poll sees no change", seen == [('track-a', seen[0][1])]))
+    state['track'] = 'track-b'
+    service.poll_once()
+    state['track'] = 'track-a'
+    tokens.expires_at = time.time() + TOKEN_REFRESH_MARGIN / 2  # About to expire
+    service.poll_once()
+    checks.append(("features fetched once per track", state['features'] == 2 and len(seen) == 3))
+    checks.append(("token refreshed before expiry", state['tokens'] == 2))
+    state['bad_token'] = tokens.access_token
+    tokens.expires_at = float('inf')
+    state['track'] = 'track-c'
+    service.poll_once()
+    checks.append(("401 triggers a refresh", tokens.access_token != state['bad_token']))
+    state['features_down'] = True
+    state['track'] = 'track-d'
+    try:
+        service.poll_once()
+    except requests.exceptions.HTTPError:
+        pass
+    state['features_down'] = False
+    service.poll_once()
+    checks.append(("features retried after a failure", service.track_id == 'track-d'
+                   and seen[-1] == ('track-d', service.features) and service.features is not None))
+    state['progress_ms'] = 3000  # Polling drift, not a new play
+    service.poll_once()
+    state['progress_ms'] = 60000  # Seek
+    service.poll_once()
+    state['progress_ms'] = 1000  # Same track from the start again
+    service.poll_once()
+    checks.append(("seek and replay of the same track reported", len(seen) == 7 and seen[-1][0] == 'track-d'
+                   and service.track_duration == 180.0))
+    state['track'] = None
+    service.poll_once()
+    service.poll_once()
+    state['track'] = 'track-d'
+    service.poll_once()
+    checks.append(("idle reported once, then a new play", idle == [True] and len(seen) == 8))
+    on_track = service.on_track
+    service.on_track = lambda track, features: 1 / 0
+    state['track'] = 'track-e'
+    service.poll_once()
+    service.on_track = on_track
+    checks.append(("failing callback doesn't raise out of the poll", service.track_id == 'track-e'))
+    reloaded = FeatureCache(cache_path)
+    checks.append(("cache persisted to disk", reloaded.get('track-a') is not None and len(reloaded) == 5))
+    given = SpotifyTokens(session, 'id', 'secret', access_token='given', token_url=f"{base}/api/token")
+    checks.append(("given token replaced when refreshable", given.get() != 'given'))
+
+    server.shutdown()
+    for name, ok in checks:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    return all(ok for _, ok in checks)
+
+
+if __name__ == '__main__':
+    print("Spotify stub check passed" if _stub_check() else "Spotify stub check FAILED")
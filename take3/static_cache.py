@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+
+try:
+    import brotli  # Optional, only used for a precomputed br variant
+except ImportError:
+    brotli = None
+
+STATIC_MAX_AGE = 60  # Seconds browsers may reuse a static file without asking again
+MTIME_CHECK_INTERVAL = 1.0  # At most one stat() per file per interval
+
+
+class StaticEntry:
+    def __init__(self, path, body, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.checked = time.monotonic()
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/'):
+            self.content_type += '; charset=utf-8'
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body)
+        # Each encoding is its own representation, so each gets its own ETag
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        self.etags = {encoding: variant_etag(digest, encoding) for encoding in self.variants}
+
+
+class StaticFileCache:
+    """Keeps static files in memory with precompressed variants.
+
+    Files are reloaded when their mtime changes; the mtime itself is only
+    checked once per MTIME_CHECK_INTERVAL, so a cache hit normally does no
+    disk I/O at all.
+    """
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked < MTIME_CHECK_INTERVAL:
+            return entry
+
+        path = os.path.join(self.base_dir, name)
+        mtime = os.stat(path).st_mtime_ns
+        if entry is not None and entry.mtime == mtime:
+            entry.checked = now
+            return entry
+
+        with self._lock:
+            with open(path, 'rb') as f:
+                entry = StaticEntry(path, f.read(), mtime)
+            self._entries[name] = entry
+        return entry
+
+
+ETAG_SUFFIXES = {'identity': '', 'gzip': '-gz', 'br': '-br'}
+
+
+def variant_etag(tag, encoding):
+    return '"%s%s"' % (tag, ETAG_SUFFIXES[encoding])
+
+
+def parse_qvalues(header):
+    """{coding: q} from an Accept-Encoding style header; malformed q-values count as 0."""
+    qvalues = {}
+    for part in (header or '').split(','):
+        name, *params = part.split(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[name] = q
+    return qvalues
+
+
+def choose_encoding(accept_encoding, variants):
+    """Available encoding with the highest q-value, br then gzip then identity on a tie.
+
+    Codings the header doesn't list get the '*' q-value (0 without one),
+    except identity, which stays acceptable as the last choice; q=0 rules
+    an encoding out.
+    """
+    qvalues = parse_qvalues(accept_encoding)
+    wildcard = qvalues.get('*', 0.0)
+    best, best_q = 'identity', 0.0
+    for encoding in ('br', 'gzip', 'identity'):
+        if encoding == 'identity':
+            q = qvalues.get('identity', qvalues.get('*', 1e-3))  # Unlisted: acceptable, but last
+        elif encoding in variants:
+            q = qvalues.get(encoding, wildcard)
+        else:
+            continue
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check: a list of tags or '*', compared weakly (W/ ignored) as RFC 9110 asks."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def static_response(cache, name, request_headers):
+    """(status, headers, body) for a cached file, honouring If-None-Match."""
+    try:
+        entry = cache.get(name)
+    except OSError:
+        return 404, [('Content-type', 'text/plain')], b'Not found'
+
+    encoding = choose_encoding(request_headers.get('Accept-Encoding'), entry.variants)
+    etag = entry.etags[encoding]
+    headers = [
+        ('ETag', etag),
+        ('Cache-Control', f'public, max-age={STATIC_MAX_AGE}'),
+        ('Vary', 'Accept-Encoding'),
+    ]
+    if etag_matches(request_headers.get('If-None-Match'), etag):
+        return 304, headers, b''
+
+    headers.append(('Content-type', entry.content_type))
+    if encoding != 'identity':
+        headers.append(('Content-Encoding', encoding))
+    return 200, headers, entry.variants[encoding]
+
+
+def serve_static(handler, cache, name):
+    """Send a cached file on a BaseHTTPRequestHandler."""
+    status, headers, body = static_response(cache, name, handler.headers)
+    handler.send_response(status)
+    for header, value in headers:
+        handler.send_header(header, value)
+    if status != 304:  # A 304's Content-Length would describe the representation, not the empty body
+        handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
@@ -0,0 +1,68 @@
+import gzip
+import json
+import threading
+from static_cache import choose_encoding, etag_matches, variant_etag
+
+GZIP_MIN_BYTES = 256  # Smaller payloads aren't worth compressing
+
+
+class CachedPayload:
+    def __init__(self, version, body):
+        self.version = version
+        self.tag = '-'.join(str(part) for part in version)
+        self.variants = {'identity': body}
+        if len(body) >= GZIP_MIN_BYTES:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=1)
+        self.etags = {encoding: variant_etag(self.tag, encoding) for encoding in self.variants}
+
+
+class StatusCache:
+    """/status serialised once per snapshot version and shared by every request.
+
+    get_version() is a cheap tuple that changes whenever anything in the
+    status changes; get_status() builds the dict and only runs when it does.
+    Every request in between gets the same bytes (and gzip variant), with
+    the version in the ETag (one per encoding) so pollers can ask for a 304
+    instead.
+    """
+
+    def __init__(self, get_status, get_version):
+        self.get_status = get_status
+        self.get_version = get_version
+        self._payload = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self):
+        version = self.get_version()
+        payload = self._payload
+        if payload is not None and payload.version == version:
+            return payload
+
+        with self._lock:
+            payload = self._payload
+            if payload is None or payload.version != version:
+                body = json.dumps(self.get_status(), separators=(',', ':')).encode()
+                payload = CachedPayload(version, body)
+                self._payload = payload
+                self.builds += 1
+        return payload
+
+    def response(self, request_headers):
+        """(status, headers, body) for a /status request."""
+        payload = self.get()
+        encoding = choose_encoding(request_headers.get('Accept-Encoding'), payload.variants)
+        etag = payload.etags[encoding]
+        headers = [
+            ('ETag', etag),
+            ('X-Status-Version', payload.tag),
+            ('Cache-Control', 'no-cache'),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if etag_matches(request_headers.get('If-None-Match'), etag):
+            return 304, headers, b''
+
+        headers.append(('Content-type', 'application/json'))
+        if encoding != 'identity':
+            headers.append(('Content-Encoding', encoding))
+        return 200, headers, payload.variants[encoding]
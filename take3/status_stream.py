@@ -0,0 +1,108 @@
+import json
+import time
+from urllib.parse import parse_qs
+
+STREAM_RATE = 30.0  # Default pushes per second for /stream
+MAX_STREAM_RATE = 100.0
+KEEPALIVE_SECONDS = 15.0  # Comment line so proxies and clients don't time out
+SEND_TIMEOUT = 2.0  # A client that can't take one event within this time is dropped
+
+
+def parse_stream_query(query):
+    """Read ?rate=<Hz>&delta=1 from a /stream query string."""
+    params = parse_qs(query)
+    try:
+        rate = float(params.get('rate', [STREAM_RATE])[0])
+    except ValueError:
+        rate = STREAM_RATE
+    rate = min(max(rate, 1.0), MAX_STREAM_RATE)
+    delta = params.get('delta', ['0'])[0] in ('1', 'true', 'yes')
+    return rate, delta
+
+
+def changed_fields(previous, current):
+    """Top-level fields of current that differ from previous."""
+    return {key: value for key, value in current.items() if previous.get(key) != value}
+
+
+def format_event(payload, event_id=None, event='status'):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(payload, separators=(',', ':'))}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class StatusEventSource:
+    """Turns status snapshots into SSE bytes for one client.
+
+    poll() is called once per frame (every `interval` seconds) and returns
+    the bytes to send, or None when there is nothing new. The client always
+    gets the newest snapshot, so a slow client skips intermediate frames
+    instead of queueing them.
+    """
+
+    def __init__(self, get_status, get_version, rate=STREAM_RATE, delta=False):
+        self.get_status = get_status
+        self.get_version = get_version
+        self.interval = 1.0 / rate
+        self.delta = delta
+        self.last_version = None
+        self.last_sent = {}
+        self.last_write = time.monotonic()
+
+    def poll(self):
+        now = time.monotonic()
+        version = self.get_version()
+        if version != self.last_version:
+            status = self.get_status()
+            payload = changed_fields(self.last_sent, status) if self.delta and self.last_sent else status
+            self.last_sent = status
+            self.last_version = version
+            if payload:
+                self.last_write = now
+                return format_event(payload, status.get('version'))
+        elif now - self.last_write >= KEEPALIVE_SECONDS:
+            self.last_write = now
+            return b": keepalive\n\n"
+        return None
+
+
+def event_stream_headers():
+    return [
+        ('Content-type', 'text/event-stream'),
+        ('Cache-Control', 'no-cache'),
+        ('X-Accel-Buffering', 'no'),
+    ]
+
+
+def stream_status(handler, get_status, get_version, rate=STREAM_RATE, delta=False):
+    """Serve Server-Sent Events on a BaseHTTPRequestHandler until the client goes away.
+
+    get_version() must be cheap; get_status() is only called when it changes.
+    A client that stops reading is dropped after SEND_TIMEOUT.
+    """
+    handler.send_response(200)
+    for name, value in event_stream_headers():
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.connection.settimeout(SEND_TIMEOUT)
+
+    source = StatusEventSource(get_status, get_version, rate, delta)
+    next_frame = time.monotonic()
+    try:
+        while True:
+            data = source.poll()
+            if data:
+                handler.wfile.write(data)
+
+            next_frame += source.interval
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.monotonic()  # Fell behind, drop the missed frames
+    except OSError:
+        # Broken pipe, reset or send timeout: the client is gone or too slow
+        pass
@@ -2,15 +2,33 @@ import threading  # Make sure threading is imported
 import numpy as np
 import sounddevice as sd
 import requests
-from scipy.signal import butter, lfilter
+from scipy.signal import sosfilt
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
 import time
-from collections import deque
-from multiprocessing import Value
+from multiprocessing import Value, Array
 import tkinter as tk
-import random
 import os
+from filterbank import design_bandpass_sos, DEFAULT_BANDS
+from snapshot import SharedSnapshot
+from analyzer import AudioAnalyzer, ANALYSIS_FIELDS, AUDIO_STATS_FIELDS
+from audio_process import start_audio_process
+from status_stream import stream_status, parse_stream_query, StatusEventSource
+from udp_telemetry import UdpTelemetrySender, run_udp_telemetry, DEFAULT_PORT
+from discovery import DiscoveryService, FixtureRegistry
+from color_engine import ColorEngine, ColorRenderer, hsv_to_rgb, interpolate_color
+from render_scheduler import RenderScheduler
+from static_cache import StaticFileCache, serve_static, static_response
+from async_server import AsyncHTTPServer, EventStream, json_response
+from status_cache import StatusCache
+from command_queue import CommandQueue, CommandError, parse_commands
+from spotify_client import SpotifyService, SpotifyTokens, RESTART_SECONDS
+from gui_client import ServerClient
+from track_store import TrackStore, TrackMemory, MAX_TRACK_SECONDS
+from fingerprint import FingerprintIndex, FINGERPRINT_INDEX_FILE
+from prerender import CueTrack, CuePlayer
+from session_recorder import SessionRecorder
+from metrics import Histogram, RequestMetrics, CALLBACK_BUCKETS, PROMETHEUS_CONTENT_TYPE, prometheus_text
 
 
 # Audio stream configuration
@@ -18,190 +36,224 @@ CHUNK = 1024  # Chunk size for processing
 RATE = 44100  # Sampling rate in Hz
 DEVICE_INDEX = 0  # Change this to the correct device index for your audio device
 CHANNELS = 2  # Assuming stereo input
+AUDIO_IN_SEPARATE_PROCESS = False  # Run capture + analysis in its own process (see audio_process.py)
 
 # Shared variables
 spotify_bpm = Value('f', 120.0)  # BPM from Spotify
-current_volume_level = Value('f', 0.0)
-current_is_beat_drop = Value('i', 0)  # 0 = No Beat Drop, 1 = Beat Drop
-current_energy_level = Value('i', -1)  # -1 = No Sound, 0 = No Energy, 1 = Low Energy, 2 = Normal Energy, 3 = High Energy
-beat_drop_timestamp = Value('d', 0.0)  # Timestamp of the last detected beat drop
-last_high_energy_time = Value('d', 0.0)  # Timestamp of the last detected high energy
 current_mode = Value('i', 0)  # 0 = None, 1-3 for scenes, 4-13 for effects
-
-# RGB Color values for each strip
-strip_colors = [Value('i', 0xFFFFFF) for _ in range(4)]  # Stored as 0xRRGGBB
+BAND_NAMES = [name for name, _, _ in DEFAULT_BANDS]
+
+# Analysis results, published once per chunk by the analyzer (single writer, see snapshot.py)
+analysis_state = SharedSnapshot(ANALYSIS_FIELDS)
+analysis_state.publish(energy_level=-1)
+audio_stats = SharedSnapshot(AUDIO_STATS_FIELDS)  # Overflow/deadline counters for the capture path
+
+# RGB Color values for each strip, published once per frame by the color thread
+NUM_STRIPS = 4
+color_state = SharedSnapshot([('colors', '%dI' % NUM_STRIPS)])  # Stored as 0xRRGGBB
+color_state.publish(colors=[0xFFFFFF] * NUM_STRIPS)
+static_colors = Array('i', [0xFFFFFF] * NUM_STRIPS)  # Colors requested for static mode
 color_mode = Value('i', 0)  # 0 = static, 1 = full spectrum, 2 = rave, 3 = halloween, 4 = boiler_room
 
+# Frame-clocked output (see render_scheduler.py)
+RENDER_FPS = 100
+TRANSITION_SECONDS = 1.0  # Color transition length when not beat-quantized
+BEAT_QUANTIZED_TRANSITIONS = False  # Start color transitions on the beat and size them in beats
+BEATS_PER_TRANSITION = 2
+render_scheduler = RenderScheduler(RENDER_FPS)
+
+# Tempo, beat grid, energy envelope and drops of every track heard before (see track_store.py)
+track_memory = TrackMemory(TrackStore(), analysis_state)
+
+# Where track identity comes from: 'spotify', or 'fingerprint' to recognise tracks from the audio
+# itself (offline, e.g. from a DJ mixer). Build the index with `python fingerprint.py index <music dir>`
+TRACK_IDENTITY = 'spotify'
+FINGERPRINT_INDEX = FINGERPRINT_INDEX_FILE if TRACK_IDENTITY == 'fingerprint' and os.path.exists(FINGERPRINT_INDEX_FILE) else None
+
+# Serve HTTP from one asyncio event loop with keep-alive instead of a thread per connection
+USE_ASYNC_SERVER = False
+
+# UDP telemetry for laser/LED controllers (see udp_telemetry.py), e.g. [('255.255.255.255', 7777)]
+UDP_TELEMETRY_TARGETS = []
+UDP_TELEMETRY_BROADCAST = False
+
+# Announce the server on the LAN and send telemetry to every controller that answers
+# (see discovery.py), so controllers don't need the server IP configured by hand
+UDP_DISCOVERY = False
+fixture_registry = FixtureRegistry()
+
 # Spotify API credentials
 SPOTIFY_ACCESS_TOKEN = 'your_spotify_access_token'
-SPOTIFY_API_URL = 'https://api.spotify.com/v1/me/player/currently-playing'
+SPOTIFY_CLIENT_ID = ''  # With ID/secret (and a refresh token for /me/player) the token refreshes itself
+SPOTIFY_CLIENT_SECRET = ''
+SPOTIFY_REFRESH_TOKEN = ''
+
+# Play a pre-rendered show (`python prerender.py song.wav`) instead of analysing live input.
+# Playback starts with the server and resyncs when Spotify reports the cue file's track ID
+# (TRACK_IDENTITY = 'spotify'; cue mode runs no live analysis, so fingerprints can't resync it).
+CUE_FILE = None
+
+# Record raw input plus the resulting snapshots for replay (see session_recorder.py), e.g.
+# 'sessions/%Y-%m-%d_%H%M.glrs'. Only with the analysis thread (AUDIO_IN_SEPARATE_PROCESS = False)
+RECORD_SESSION = None
 
 # Bandpass filter for focusing on specific frequency ranges
+# (coefficients are cached, see filterbank.py for the streaming version)
 def butter_bandpass(lowcut, highcut, fs, order=5):
-    nyquist = 0.5 * fs
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    b, a = butter(order, [low, high], btype='band')
-    return b, a
+    return design_bandpass_sos(lowcut, highcut, fs, order)
 
 def bandpass_filter(data, lowcut, highcut, fs, order=5):
-    b, a = butter_bandpass(lowcut, highcut, fs, order=order)
-    y = lfilter(b, a, data)
+    sos = butter_bandpass(lowcut, highcut, fs, order=order)
+    y = sosfilt(sos, data)
     return y
 
-# Real-time audio analysis
-def analyze_audio(shared_volume_level, shared_is_beat_drop, shared_energy_level, beat_drop_timestamp, last_high_energy_time):
-    last_volume_levels = deque(maxlen=int(RATE / CHUNK))  # Store volume levels for the last second
+# Real-time audio analysis, until analysis_stop is set (on shutdown)
+analysis_stop = threading.Event()
+
+def analyze_audio(shared_state, stats_state):
+    analyzer = AudioAnalyzer(shared_state, RATE, CHUNK, FINGERPRINT_INDEX)
+    period = CHUNK / RATE
+    chunk_histogram = Histogram(CALLBACK_BUCKETS)  # Whole callback time, for /metrics
+    stats = {'chunks': 0, 'input_overflows': 0, 'ring_overruns': 0, 'late_callbacks': 0, 'max_callback_ms': 0.0,
+             'chunk_histogram': chunk_histogram.counts, 'chunk_seconds_sum': 0.0}
+    recorder = None
+    if RECORD_SESSION:
+        recorder = SessionRecorder(time.strftime(RECORD_SESSION), RATE, CHUNK, CHANNELS, NUM_STRIPS)
+        print(f"Recording session to {recorder.path}")
 
     def audio_callback(indata, frames, time_info, status):
+        start = time.perf_counter()
         if status:
             print(status)
+            if status.input_overflow:
+                stats['input_overflows'] += 1
 
         audio_data = np.mean(indata, axis=1)
-        volume = np.mean(np.abs(audio_data)) * 2
-
-        last_volume_levels.append(volume)
-        avg_last_volume = np.mean(last_volume_levels)
-
-        current_time = time.time()
-        time_since_last_beat_drop = current_time - beat_drop_timestamp.value
-
-        with shared_is_beat_drop.get_lock():
-            if (volume - avg_last_volume > 0.3) and volume > 0.35 and time_since_last_beat_drop >= 10:
-                shared_is_beat_drop.value = 1
-                with beat_drop_timestamp.get_lock():
-                    beat_drop_timestamp.value = current_time
-            elif time_since_last_beat_drop <= 1:
-                shared_is_beat_drop.value = 1
-            else:
-                shared_is_beat_drop.value = 0
-
-        with last_high_energy_time.get_lock():
-            if volume > 0.30:
-                shared_energy_level.value = 3
-                last_high_energy_time.value = current_time
-            elif volume > 0.20:
-                shared_energy_level.value = 2
-            elif volume > 0.10:
-                shared_energy_level.value = 1
-            elif volume > 0.01:
-                shared_energy_level.value = 0
-            else:
-                shared_energy_level.value = -1  # No sound
-
-        with shared_volume_level.get_lock():
-            shared_volume_level.value = volume
-
-    with sd.InputStream(samplerate=RATE, channels=CHANNELS, device=DEVICE_INDEX, callback=audio_callback):
-        while True:
-            time.sleep(0.5)
+        analyzer.process(audio_data)
+        if recorder is not None:
+            recorder.record(indata, shared_state.read(), current_mode.value, color_state.read()['colors'])
+
+        elapsed = time.perf_counter() - start
+        stats['chunks'] += 1
+        if elapsed > period:
+            stats['late_callbacks'] += 1
+        stats['max_callback_ms'] = max(stats['max_callback_ms'], elapsed * 1000)
+        chunk_histogram.observe(elapsed)
+        stats['chunk_seconds_sum'] = chunk_histogram.sum
+        stats_state.publish(**stats)
+
+    try:
+        with sd.InputStream(samplerate=RATE, channels=CHANNELS, device=DEVICE_INDEX, blocksize=CHUNK, callback=audio_callback):
+            analysis_stop.wait()
+    finally:
+        if recorder is not None:
+            recorder.close()  # Writes what is still buffered and trims the file
 
 # Function to fetch BPM from Spotify
 def fetch_spotify_bpm(shared_spotify_bpm):
-    headers = {
-        "Authorization": f"Bearer {SPOTIFY_ACCESS_TOKEN}"
-    }
-
-    while True:
-        try:
-            response = requests.get(SPOTIFY_API_URL, headers=headers, timeout=5)
-            data = response.json()
-
-            track_id = data['item']['id']
-            track_features_url = f"https://api.spotify.com/v1/audio-features/{track_id}"
-            response = requests.get(track_features_url, headers=headers, timeout=5)
-            track_data = response.json()
-
-            bpm = track_data['tempo']
-            with shared_spotify_bpm.get_lock():
-                shared_spotify_bpm.value = bpm
-
-            print(f"Fetched BPM from Spotify: {bpm}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching BPM from Spotify: {e}")
-        except Exception as e:
-            print(f"General error: {e}")
-
-        time.sleep(20)
+    def on_track(track_id, features):
+        # Replays start from the stored analysis instead of warming up again
+        known = track_memory.on_track(track_id, service.track_started_at, service.track_duration)
+        if known is not None:
+            print(f"Known track {track_id}: {known.tempo:.1f} BPM, {len(known.drops)} drops, {known.plays} plays")
+        if features and features.get('tempo'):
+            bpm = features['tempo']
+        elif known is not None:
+            bpm = known.tempo
+        else:
+            print(f"No audio features for Spotify track {track_id}")
+            return
+        with shared_spotify_bpm.get_lock():
+            shared_spotify_bpm.value = bpm
+        print(f"Fetched BPM from Spotify: {bpm}")
+
+    # One pooled session for token and API calls, features cached per track (see spotify_client.py)
+    session = requests.Session()
+    tokens = SpotifyTokens(session, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_REFRESH_TOKEN, SPOTIFY_ACCESS_TOKEN)
+    service = SpotifyService(tokens, session, on_track, on_idle=track_memory.end_track)
+    service.run()
+
+# Track identity from audio fingerprints (runs on the render loop)
+fingerprint_names = FingerprintIndex.load_names(FINGERPRINT_INDEX) if FINGERPRINT_INDEX else []
+
+def identify_track(now):
+    analysis = analysis_state.read()
+    match = analysis['fingerprint_track']
+    if not match:
+        return
+    track_id = fingerprint_names[match - 1]
+    started_at = analysis['fingerprint_started_at']
+    if track_id == track_memory.track_id and abs(started_at - track_memory.started_at) <= RESTART_SECONDS:
+        return
+    if analysis['timestamp'] - started_at >= MAX_TRACK_SECONDS:
+        return  # A stale match of a play that already ended
+    known = track_memory.on_track(track_id, started_at)
+    print(f"Identified track {track_id}" + (f", {known.tempo:.1f} BPM from earlier plays" if known else ""))
+    if known is not None:
+        with spotify_bpm.get_lock():
+            spotify_bpm.value = known.tempo
+
+# Pre-rendered cues, published in place of the live analyzer and color renderer
+cue_player = CuePlayer(CueTrack.load(CUE_FILE, NUM_STRIPS), analysis_state, color_state) if CUE_FILE else None
+
+def play_cues(now):
+    cue = cue_player.cue
+    started_at = track_memory.started_at  # Read once: end_track() may clear it meanwhile
+    if cue.track_id and track_memory.track_id == cue.track_id and started_at:
+        cue_player.started_at = started_at
+    cue_player.render(now)
+
+# Current tempo and beat phase for beat-quantized output
+def beat_timing():
+    analysis = analysis_state.read()
+    if analysis['local_bpm'] > 0:
+        return analysis['local_bpm'], analysis['beat_phase']
+    predicted = track_memory.prediction()
+    if predicted is not None and predicted['beat_phase'] is not None:
+        return predicted['tempo'], predicted['beat_phase']  # Beat grid from an earlier play
+    return spotify_bpm.value, None
+
+color_renderer = ColorRenderer(
+    ColorEngine(NUM_STRIPS),  # Vectorised palettes and transitions, see color_engine.py
+    color_state, color_mode, static_colors, beat_timing,
+    transition_seconds=TRANSITION_SECONDS,
+    quantize=BEAT_QUANTIZED_TRANSITIONS,
+    beats_per_transition=BEATS_PER_TRANSITION,
+)
+
+# Apply one validated command from the /commands queue (runs on the render loop)
+def apply_command(command):
+    if command['type'] == 'mode':
+        with current_mode.get_lock():
+            current_mode.value = command['mode']
+
+    elif command['type'] == 'color':
+        if 'colors' in command:
+            with static_colors.get_lock():
+                for i, color in enumerate(command['colors']):
+                    static_colors[i] = color
+        with color_mode.get_lock():
+            color_mode.value = command['color_mode']
+        color_renderer.restart()  # Cue takes effect on this frame, not after the current fade
+
+    elif command['type'] == 'timing':
+        if 'transition_seconds' in command:
+            color_renderer.transition_seconds = command['transition_seconds']
+        if 'beat_quantized' in command:
+            color_renderer.quantize = command['beat_quantized']
+        if 'beats_per_transition' in command:
+            color_renderer.beats_per_transition = command['beats_per_transition']
+
+command_queue = CommandQueue(apply_command)
 
 # Function to handle color changes
 def manage_color_modes():
-    current_colors = [strip_colors[i].value for i in range(4)]
-    target_colors = current_colors.copy()
-    hue = 0
-
-    while True:
-        if color_mode.value == 1:  # Full spectrum mode
-            hue = (hue + 20) % 256
-            new_rgb = hsv_to_rgb(hue, 255, 255)
-            target_colors = [new_rgb] * 4
-
-        elif color_mode.value == 2:  # Rave mode with random jumps across the spectrum
-            color1 = hsv_to_rgb(random.randint(0, 255), 255, 255)
-            color2 = hsv_to_rgb(random.randint(0, 255), 255, 255)
-
-            if random.choice([True, False]):
-                target_colors[0] = target_colors[2] = color1  # Strips 1 and 3
-                target_colors[1] = target_colors[3] = color2  # Strips 2 and 4
-            else:
-                target_colors[0] = target_colors[3] = color1  # Strips 1 and 4
-                target_colors[1] = target_colors[2] = color2  # Strips 2 and 3
-
-        elif color_mode.value == 3:  # Halloween mode
-            halloween_colors = [0xFF4500, 0x8A2BE2, 0xFF0000, 0x008000]  # Orange, Purple, Red, Green
-            pairing = random.choice([(0, 2, 1, 3), (0, 3, 1, 2)])  # Randomly choose pairing for the strips
-            for i in range(2):
-                color = halloween_colors[random.randint(0, len(halloween_colors) - 1)]
-                target_colors[pairing[i * 2]] = target_colors[pairing[i * 2 + 1]] = color
-
-        elif color_mode.value == 4:  # Boiler Room mode
-            boiler_colors = [0x8B0000, 0x4B0082]  # Dark Red, Indigo
-            pairing = random.choice([(0, 2, 1, 3), (0, 3, 1, 2)])  # Randomly choose pairing for the strips
-            for i in range(2):
-                color = boiler_colors[random.randint(0, len(boiler_colors) - 1)]
-                target_colors[pairing[i * 2]] = target_colors[pairing[i * 2 + 1]] = color
-
-        # Gradually transition from current to target colors
-        for step in range(100):
-            for i in range(4):
-                current_colors[i] = interpolate_color(current_colors[i], target_colors[i], step / 100.0)
-                with strip_colors[i].get_lock():
-                    strip_colors[i].value = current_colors[i]
-            time.sleep(0.01)
-
-def hsv_to_rgb(h, s, v):
-    """Convert HSV to RGB color."""
-    h = float(h)
-    s = float(s) / 255.0
-    v = float(v) / 255.0
-    hi = int(h / 60.0) % 6
-    f = (h / 60.0) - hi
-    p = v * (1.0 - s)
-    q = v * (1.0 - f * s)
-    t = v * (1.0 - (1.0 - f) * s)
-    r, g, b = 0, 0, 0
-    if hi == 0:
-        r, g, b = v, t, p
-    elif hi == 1:
-        r, g, b = q, v, p
-    elif hi == 2:
-        r, g, b = p, v, t
-    elif hi == 3:
-        r, g, b = p, q, v
-    elif hi == 4:
-        r, g, b = t, p, v
-    elif hi == 5:
-        r, g, b = v, p, q
-    return (int(r * 255) << 16) | (int(g * 255) << 8) | int(b * 255)
-
-def interpolate_color(color1, color2, t):
-    """Interpolate between two colors with a ratio t (0.0 - 1.0)."""
-    r1, g1, b1 = (color1 >> 16) & 0xFF, (color1 >> 8) & 0xFF, color1 & 0xFF
-    r2, g2, b2 = (color2 >> 16) & 0xFF, (color2 >> 8) & 0xFF, color2 & 0xFF
-    r = int(r1 + (r2 - r1) * t)
-    g = int(g1 + (g2 - g1) * t)
-    b = int(b1 + (b2 - b1) * t)
-    return (r << 16) | (g << 8) | b
+    render_scheduler.add(command_queue.render)  # Due commands are applied before the frame renders
+    if FINGERPRINT_INDEX and not cue_player:  # Cue mode publishes no live fingerprints
+        render_scheduler.add(identify_track)
+    render_scheduler.add(track_memory.render)  # Records the playing track at ENVELOPE_RATE
+    render_scheduler.add(play_cues if cue_player else color_renderer.render)
+    render_scheduler.run()
 
 # Tkinter GUI Class
 class AudioVisualizerGUI:
@@ -216,6 +268,7 @@ class AudioVisualizerGUI:
         self.energy_level = tk.StringVar(value="No Sound")
         self.is_beat_drop = tk.StringVar(value="No")
         self.colors = ["#FFFFFF", "#FFFFFF", "#FFFFFF", "#FFFFFF"]
+        self.client = ServerClient(root)
 
         # IP Address Input
         tk.Label(root, text="Webserver IP:").grid(row=0, column=0, padx=10, pady=5, sticky="w")
@@ -247,132 +300,247 @@ class AudioVisualizerGUI:
         self.update_gui()
 
     def update_gui(self):
-        def fetch_data():
-            try:
-                response = requests.get(f"{self.server_ip.get()}/status")
-                data = response.json()
-
-                # Update the GUI from the fetched data
-                self.spotify_bpm.set(data['spotify_bpm'])
-                self.volume_level.set(data['volume_level'])
-                self.energy_level.set(
-                    "High" if data['energy_level'] == 3 else
-                    "Medium" if data['energy_level'] == 2 else
-                    "Low" if data['energy_level'] == 1 else
-                    "No Sound"
-                )
-                self.is_beat_drop.set("Yes" if data['is_beat_drop'] else "No")
-
-                self.status_label.config(text="Connected to server")
-
-            except Exception as e:
-                self.status_label.config(text=f"Error: {e}")
-
-        threading.Thread(target=fetch_data, daemon=True).start()
+        # Polled through one pooled worker instead of a new thread per request (see gui_client.py)
+        self.client.get(f"{self.server_ip.get()}/status", self.apply_status)
         self.root.after(1000, self.update_gui)
 
+    def apply_status(self, data, error, latency_ms):
+        if error is not None:
+            self.status_label.config(text=f"Error: {error}")
+            return
+        try:
+            # Update the GUI from the fetched data
+            self.spotify_bpm.set(data['spotify_bpm'])
+            self.volume_level.set(data['volume_level'])
+            self.energy_level.set(
+                "High" if data['energy_level'] == 3 else
+                "Medium" if data['energy_level'] == 2 else
+                "Low" if data['energy_level'] == 1 else
+                "No Sound"
+            )
+            self.is_beat_drop.set("Yes" if data['is_beat_drop'] else "No")
+        except (KeyError, TypeError) as e:
+            self.status_label.config(text=f"Error: unexpected status {e}")
+            return
+        self.status_label.config(text=f"Connected to server ({latency_ms:.0f} ms)")
+
+# Current analysis, color and mode state as sent by /status and /stream
+def get_status():
+    analysis = analysis_state.read()
+    colors = ['#{:06x}'.format(c) for c in color_state.read()['colors']]
+
+    return {
+        'spotify_bpm': spotify_bpm.value,
+        'volume_level': analysis['volume_level'],
+        'is_beat_drop': analysis['is_beat_drop'],
+        'energy_level': analysis['energy_level'],
+        'current_mode': current_mode.value,
+        'colors': colors,
+        'band_levels': dict(zip(BAND_NAMES, analysis['band_levels'])),
+        'local_bpm': analysis['local_bpm'],
+        'beat_phase': analysis['beat_phase'],
+        'beat_count': analysis['beat_count'],
+        'spectral': {
+            'band_energies': dict(zip(BAND_NAMES, analysis['band_energies'])),
+            'centroid': analysis['spectral_centroid'],
+            'flux': analysis['spectral_flux'],
+            'rolloff': analysis['spectral_rolloff']
+        },
+        'track': track_memory.prediction(analysis['timestamp'] or None),
+        'version': analysis['version'],
+        'audio_stats': audio_stats.read()
+    }
+
+# Cheap change marker for the streaming endpoint
+def status_version():
+    return (analysis_state.version(), color_state.version(), spotify_bpm.value, current_mode.value,
+            track_memory.version)
+
+# Fields for one binary UDP telemetry packet
+def telemetry_fields():
+    analysis = analysis_state.read()
+    bpm = analysis['local_bpm'] or spotify_bpm.value
+    return {
+        'timestamp': analysis['timestamp'],
+        'bpm': bpm,
+        'volume': analysis['volume_level'],
+        'energy_level': analysis['energy_level'],
+        'is_beat_drop': analysis['is_beat_drop'],
+        'mode': current_mode.value,
+        'colors': color_state.read()['colors'],
+    }
+
+# Static files live next to this script and are kept in memory
+static_files = StaticFileCache(os.path.dirname(os.path.abspath(__file__)))
+
+# /status serialised once per snapshot version, not once per request
+status_cache = StatusCache(get_status, status_version)
+
+# Request latency per route and last poll per client, for /metrics
+request_metrics = RequestMetrics(['/', '/status', '/stream', '/render-stats', '/metrics', '/fixtures',
+                                  '/commands', '/set-mode', '/set-color'])
+
+def observe_request(request, status, seconds):
+    request_metrics.observe(request.path, status, seconds, request.client)
+
+# /metrics in Prometheus text format, or JSON with ?format=json
+def metrics_response(query):
+    render_stats = render_scheduler.stats()
+    if 'format=json' in query:
+        render_stats['jitter_histogram'] = render_scheduler.clock.jitter_histogram.to_dict()
+        return json_response({
+            'audio': audio_stats.read(),
+            'render': render_stats,
+            'http': request_metrics.to_dict(),
+        })
+    body = prometheus_text(audio_stats.read(), render_stats, render_scheduler.clock.jitter_histogram, request_metrics)
+    return 200, [('Content-type', PROMETHEUS_CONTENT_TYPE)], body.encode()
+
 # HTTP Server to display the analysis results
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
+    def handle_one_request(self):
+        started = time.perf_counter()
+        self.response_code = None
+        super().handle_one_request()
+        if self.response_code is not None:
+            path = getattr(self, 'path', '').partition('?')[0]  # Unset if the request line was malformed
+            seconds = None if path == '/stream' else time.perf_counter() - started
+            request_metrics.observe(path, self.response_code, seconds, self.client_address[0])
+
+    def send_response(self, code, message=None):
+        self.response_code = code
+        super().send_response(code, message)
+
     def do_GET(self):
-        if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            with open('index.html', 'r') as f:  # Serve the separate HTML file
-                self.wfile.write(f.read().encode('utf-8'))
+        path, _, query = self.path.partition('?')
+        if path == '/':
+            serve_static(self, static_files, 'index.html')  # Serve the separate HTML file
 
-        elif self.path == '/status':
+        elif path == '/status':
+            self.send_result(status_cache.response(self.headers))
+
+        elif path == '/render-stats':  # Frame time and jitter of the render loop
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            with spotify_bpm.get_lock():
-                sp_bpm = spotify_bpm.value
-            with current_volume_level.get_lock():
-                volume_level = current_volume_level.value
-            with current_is_beat_drop.get_lock():
-                is_beat_drop = current_is_beat_drop.value
-            with current_energy_level.get_lock():
-                energy_level = current_energy_level.value
-            with current_mode.get_lock():
-                mode = current_mode.value
-
-            colors = []
-            for i in range(4):
-                with strip_colors[i].get_lock():
-                    colors.append('#{:06x}'.format(strip_colors[i].value))
-
-            response = json.dumps({
-                'spotify_bpm': sp_bpm,
-                'volume_level': volume_level,
-                'is_beat_drop': is_beat_drop,
-                'energy_level': energy_level,
-                'current_mode': mode,
-                'colors': colors
-            })
-            self.wfile.write(response.encode())
+            self.wfile.write(json.dumps(render_scheduler.stats()).encode())
+
+        elif path == '/stream':  # Server-Sent Events, pushes each new snapshot
+            rate, delta = parse_stream_query(query)
+            stream_status(self, get_status, status_version, rate=rate, delta=delta)
+
+        elif path == '/metrics':  # Hot-path instrumentation (see metrics.py)
+            self.send_result(metrics_response(query))
+
+        elif path == '/fixtures':  # Controllers found by discovery, with last-seen times
+            self.send_result(json_response(fixture_registry.to_dict()))
+
+    def send_result(self, result):
+        status, headers, body = result
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if status != 304:  # Same as async_server: a 304 has no Content-Length
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
     def do_POST(self):
         content_length = int(self.headers['Content-Length'])
         post_data = self.rfile.read(content_length)
 
-        try:
-            data = json.loads(post_data)
-            response = {"status": "success"}
-
-            if self.path == '/set-mode':
-                mode = data['mode']
-                with current_mode.get_lock():
-                    current_mode.value = mode
-                print(f"Mode received: {mode}")
-
-            elif self.path == '/set-color':
-                mode = data['mode']
-                if mode == 'static':
-                    colors = data['colors']
-                    for i in range(4):
-                        r = int(colors[i][1:3], 16)
-                        g = int(colors[i][3:5], 16)
-                        b = int(colors[i][5:7], 16)
-                        with strip_colors[i].get_lock():
-                            strip_colors[i].value = (r << 16) | (g << 8) | b
-                    with color_mode.get_lock():
-                        color_mode.value = 0
-                    print(f"Colors received: {colors}")
-                elif mode == 'full_spectrum':
-                    with color_mode.get_lock():
-                        color_mode.value = 1
-                    print("Full spectrum mode activated")
-                elif mode == 'rave':
-                    with color_mode.get_lock():
-                        color_mode.value = 2
-                    print("Rave mode activated")
-                elif mode == 'halloween':
-                    with color_mode.get_lock():
-                        color_mode.value = 3
-                    print("Halloween mode activated")
-                elif mode == 'boiler_room':
-                    with color_mode.get_lock():
-                        color_mode.value = 4
-                    print("Boiler Room mode activated")
-                else:
-                    response = {"status": "error", "message": "Invalid color mode"}
-
-            else:
-                response = {"status": "error", "message": "Invalid endpoint"}
+        code, response = handle_post(self.path, post_data)
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(response).encode())
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+# Apply a /set-mode or /set-color request, returns (HTTP status, response dict)
+def handle_post(path, post_data):
+    try:
+        data = json.loads(post_data)
+    except json.JSONDecodeError:
+        return 400, {"status": "error", "message": "Invalid JSON"}
 
-        except json.JSONDecodeError:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "error", "message": "Invalid JSON"}).encode())
+    response = {"status": "success"}
+
+    if path == '/commands':  # Batch of mode/color/timing cues, optionally scheduled
+        try:
+            queued = command_queue.submit(parse_commands(data, NUM_STRIPS))
+        except CommandError as e:
+            return 400, {"status": "error", "message": str(e)}
+        return 200, {"status": "success", "queued": queued, "pending": len(command_queue)}
+
+    elif path == '/set-mode':
+        mode = data['mode']
+        with current_mode.get_lock():
+            current_mode.value = mode
+        print(f"Mode received: {mode}")
+
+    elif path == '/set-color':
+        mode = data['mode']
+        if mode == 'static':
+            colors = data['colors']
+            with static_colors.get_lock():
+                for i in range(min(len(colors), NUM_STRIPS)):
+                    r = int(colors[i][1:3], 16)
+                    g = int(colors[i][3:5], 16)
+                    b = int(colors[i][5:7], 16)
+                    static_colors[i] = (r << 16) | (g << 8) | b
+            with color_mode.get_lock():
+                color_mode.value = 0
+            print(f"Colors received: {colors}")
+        elif mode == 'full_spectrum':
+            with color_mode.get_lock():
+                color_mode.value = 1
+            print("Full spectrum mode activated")
+        elif mode == 'rave':
+            with color_mode.get_lock():
+                color_mode.value = 2
+            print("Rave mode activated")
+        elif mode == 'halloween':
+            with color_mode.get_lock():
+                color_mode.value = 3
+            print("Halloween mode activated")
+        elif mode == 'boiler_room':
+            with color_mode.get_lock():
+                color_mode.value = 4
+            print("Boiler Room mode activated")
+        else:
+            response = {"status": "error", "message": "Invalid color mode"}
+
+    else:
+        response = {"status": "error", "message": "Invalid endpoint"}
+
+    return 200, response
+
+# Same routes for the asyncio server (see async_server.py)
+def http_app(request):
+    if request.method == 'POST':
+        code, response = handle_post(request.path, request.body)
+        return json_response(response, code)
+
+    if request.path == '/':
+        return static_response(static_files, 'index.html', request.headers)
+    elif request.path == '/status':
+        return status_cache.response(request.headers)
+    elif request.path == '/render-stats':
+        return json_response(render_scheduler.stats())
+    elif request.path == '/stream':
+        rate, delta = parse_stream_query(request.query)
+        return EventStream(StatusEventSource(get_status, status_version, rate, delta))
+    elif request.path == '/metrics':
+        return metrics_response(request.query)
+    elif request.path == '/fixtures':
+        return json_response(fixture_registry.to_dict())
+    return json_response({"status": "error", "message": "Invalid endpoint"}, 404)
 
 # Function to start the HTTP server
 def start_server():
+    if USE_ASYNC_SERVER:
+        print("Server started at http://0.0.0.0:8080 (asyncio, keep-alive)")
+        AsyncHTTPServer(http_app, '0.0.0.0', 8080, observer=observe_request).serve_forever()
+        return
     httpd = ThreadingHTTPServer(('0.0.0.0', 8080), SimpleHTTPRequestHandler)
     print("Server started at http://0.0.0.0:8080")
     httpd.serve_forever()
@@ -389,22 +557,51 @@ if __name__ == '__main__':
     server_thread = threading.Thread(target=start_server)  # Use threading.Thread
     server_thread.start()
 
-    # Start the audio analysis process
-    audio_process = threading.Thread(target=analyze_audio, args=(current_volume_level, current_is_beat_drop, current_energy_level, beat_drop_timestamp, last_high_energy_time))
-    audio_process.start()
-
-    # Start the Spotify BPM fetching process
-    spotify_thread = threading.Thread(target=fetch_spotify_bpm, args=(spotify_bpm,))
-    spotify_thread.start()
+    # Start the audio analysis, either as a thread or in its own process
+    audio_process = audio_ring = audio_stop = None
+    if cue_player:
+        print(f"Playing pre-rendered cues from {CUE_FILE} ({cue_player.cue.duration:.0f} s)")
+    elif AUDIO_IN_SEPARATE_PROCESS:
+        audio_process, audio_ring, audio_stop = start_audio_process(
+            analysis_state, audio_stats, RATE, CHUNK, CHANNELS, DEVICE_INDEX, fingerprint_index=FINGERPRINT_INDEX)
+    else:
+        audio_process = threading.Thread(target=analyze_audio, args=(analysis_state, audio_stats))
+        audio_process.start()
+
+    # Start the Spotify BPM fetching process (track identity comes from fingerprints otherwise)
+    spotify_thread = None
+    if TRACK_IDENTITY == 'spotify':
+        spotify_thread = threading.Thread(target=fetch_spotify_bpm, args=(spotify_bpm,))
+        spotify_thread.start()
 
     # Start color mode management
     color_mode_thread = threading.Thread(target=manage_color_modes)
     color_mode_thread.start()
 
+    # Answer controller discovery; found fixtures join the telemetry fan-out below
+    if UDP_DISCOVERY:
+        discovery_service = DiscoveryService(fixture_registry, http_port=8080, telemetry_port=DEFAULT_PORT)
+        threading.Thread(target=discovery_service.run, daemon=True).start()
+
+    # Stream binary telemetry to UDP controllers, one packet per analysis frame
+    if UDP_TELEMETRY_TARGETS or UDP_DISCOVERY:
+        telemetry_sender = UdpTelemetrySender(UDP_TELEMETRY_TARGETS, broadcast=UDP_TELEMETRY_BROADCAST,
+                                              registry=fixture_registry if UDP_DISCOVERY else None)
+        telemetry_thread = threading.Thread(target=run_udp_telemetry, args=(telemetry_sender, telemetry_fields, analysis_state.version), daemon=True)
+        telemetry_thread.start()
+
     # Start the Tkinter GUI in the main thread
     start_gui()
-
-    audio_process.join()
-    spotify_thread.join()
+    track_memory.end_track()  # Keep the play that was still going when the window closed
+    analysis_stop.set()  # Ends the input stream; the session recorder writes its tail and trims the file
+    if audio_stop is not None:
+        audio_stop.set()
+
+    if audio_process is not None:
+        audio_process.join()
+    if audio_ring is not None:
+        audio_ring.close()  # After the audio process exits: frees and unlinks the shared memory
+    if spotify_thread is not None:
+        spotify_thread.join()
     color_mode_thread.join()
 
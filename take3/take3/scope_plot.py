@@ -0,0 +1,104 @@
+import time
+import numpy as np
+
+SCOPE_FPS = 30  # Redraw rate of the scope view
+MAX_MARKERS = 32  # Beat markers kept on screen
+
+
+class SampleRing:
+    """Preallocated ring of multi-channel samples, readable as one contiguous view.
+
+    Every sample is written twice, at i and i + capacity, so the latest
+    `capacity` samples are always the slice data[i + 1:i + 1 + capacity] in
+    time order. Writing never allocates and reading is a view, not a copy.
+    One writer (e.g. the audio callback), any number of readers.
+    """
+
+    def __init__(self, capacity, channels=1):
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, channels), dtype=np.float32)
+        self.count = 0  # Samples written so far
+
+    def append(self, values):
+        i = self.count % self.capacity
+        self.data[i] = values
+        self.data[i + self.capacity] = values
+        self.count += 1
+
+    def view(self):
+        start = self.count % self.capacity
+        return self.data[start:start + self.capacity]
+
+
+class ScopePlot:
+    """Blitted scope view of a SampleRing on a matplotlib Axes.
+
+    Axes, ticks, title and legend are drawn once and cached as the
+    background (again after a resize); each frame restores the background
+    and redraws only the lines and beat markers. Frame cost is tracked in
+    frame_ms so the GUI can show how much of its budget the plot uses.
+    """
+
+    def __init__(self, canvas, ax, ring, labels, styles=None, ylim=(0.0, 1.0)):
+        self.canvas = canvas
+        self.ax = ax
+        self.ring = ring
+        self.x = np.arange(ring.capacity)
+        ax.set_xlim(0, ring.capacity - 1)
+        ax.set_ylim(*ylim)
+
+        styles = styles or [None] * len(labels)
+        self.lines = []
+        for channel, (label, style) in enumerate(zip(labels, styles)):
+            args = (style,) if style else ()
+            line, = ax.plot(self.x, ring.view()[:, channel], *args, label=label, animated=True)
+            self.lines.append(line)
+        if len(labels) > 1:
+            ax.legend(loc='upper right', fontsize='small')
+
+        # Beat markers as one NaN-separated line: (x, x, nan) per marker, preallocated
+        self._marks = np.zeros(MAX_MARKERS, dtype=np.int64)
+        self._mark_count = 0
+        self._marker_x = np.full(3 * MAX_MARKERS, np.nan)
+        self._marker_y = np.tile([ylim[0], ylim[1], np.nan], MAX_MARKERS)
+        self.markers, = ax.plot(self._marker_x, self._marker_y, 'r--', linewidth=1, animated=True)
+
+        self.background = None
+        self.frame_ms = 0.0
+        canvas.mpl_connect('draw_event', self._on_draw)
+        canvas.draw()
+
+    def mark(self, sample=None):
+        """Put a beat marker at a sample index (default: the latest sample). Safe from the writer thread."""
+        self._marks[self._mark_count % MAX_MARKERS] = self.ring.count if sample is None else sample
+        self._mark_count += 1
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        self.ax.draw_artist(self.markers)
+
+    def update(self):
+        if self.background is None:
+            return
+        start = time.perf_counter()
+        view = self.ring.view()
+        for channel, line in enumerate(self.lines):
+            line.set_ydata(view[:, channel])
+
+        # Marker x = position of its sample within the visible window
+        first = self.ring.count - self.ring.capacity
+        np.subtract(self._marks, first, out=self._marker_x[0::3])
+        self._marker_x[3 * min(self._mark_count, MAX_MARKERS)::3] = np.nan  # Slots not used yet
+        self._marker_x[1::3] = self._marker_x[0::3]
+        self.markers.set_xdata(self._marker_x)
+
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.ax.bbox)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        self.frame_ms = 0.9 * self.frame_ms + 0.1 * elapsed  # Smoothed for display
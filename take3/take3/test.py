@@ -13,6 +13,7 @@ import random
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import socket
+from scope_plot import SampleRing, ScopePlot, SCOPE_FPS, MAX_MARKERS
 
 # Audio stream configuration
 CHUNK = 1024  # Chunk size for processing
@@ -33,6 +34,14 @@ current_mode = Value('i', 0)  # 0 = None, 1-3 for scenes, 4-13 for effects
 strip_colors = [Value('i', 0xFFFFFF) for _ in range(4)]  # Stored as 0xRRGGBB
 color_mode = Value('i', 0)  # 0 = static, 1 = full spectrum, 2 = rave, 3 = halloween, 4 = boiler_room
 
+# Scope history: volume plus per-band levels, one sample per audio chunk. The audio callback only
+# stores each chunk (volume, then the mono samples) in chunk_ring; the GUI computes the band levels
+SCOPE_BANDS = [('sub_bass', 20, 60), ('bass', 60, 250), ('mids', 250, 4000), ('highs', 4000, 16000)]
+SCOPE_SECONDS = 10
+chunk_ring = SampleRing(int(SCOPE_SECONDS * RATE / CHUNK), channels=1 + CHUNK)
+scope_ring = SampleRing(chunk_ring.capacity, channels=1 + len(SCOPE_BANDS))
+scope_beats = deque(maxlen=MAX_MARKERS)  # Chunk indices of detected beat drops, taken by the GUI
+
 # Automatically get the local IP address of the Mac
 def get_local_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -54,6 +63,8 @@ def analyze_audio(shared_volume_level, shared_is_beat_drop, shared_energy_level,
     # Store volume levels for the last second
     last_volume_levels = deque(maxlen=int(RATE / CHUNK))  # Store volume levels for the last second
 
+    chunk_sample = np.zeros(1 + CHUNK, dtype=np.float32)
+
     def audio_callback(indata, frames, time_info, status):
         if status:
             print(f"Audio callback status: {status}")  # Print any status warnings/errors
@@ -71,6 +82,7 @@ def analyze_audio(shared_volume_level, shared_is_beat_drop, shared_energy_level,
                 shared_is_beat_drop.value = 1
                 with beat_drop_timestamp.get_lock():
                     beat_drop_timestamp.value = current_time
+                scope_beats.append(chunk_ring.count)
             elif time_since_last_beat_drop <= 1:
                 shared_is_beat_drop.value = 1
             else:
@@ -92,6 +104,12 @@ def analyze_audio(shared_volume_level, shared_is_beat_drop, shared_energy_level,
         with shared_volume_level.get_lock():
             shared_volume_level.value = audio_data
 
+        # Raw chunk for the scope; its spectrum is computed on the GUI side
+        if len(indata) == CHUNK:
+            chunk_sample[0] = audio_data
+            np.mean(indata, axis=1, out=chunk_sample[1:])
+            chunk_ring.append(chunk_sample)
+
     # Print the selected audio input device info
     try:
         device_info = sd.query_devices(DEVICE_INDEX)
@@ -99,7 +117,8 @@ def analyze_audio(shared_volume_level, shared_is_beat_drop, shared_energy_level,
         print(f"Sample Rate: {RATE}, Channels: {CHANNELS}")
 
         # Start the audio stream with the proper device index
-        with sd.InputStream(samplerate=RATE, channels=CHANNELS, device=DEVICE_INDEX, callback=audio_callback):
+        with sd.InputStream(samplerate=RATE, channels=CHANNELS, device=DEVICE_INDEX, blocksize=CHUNK,
+                            callback=audio_callback):
             print("Audio stream started successfully.")
             while True:
                 time.sleep(0.5)  # Keep the stream alive
@@ -121,7 +140,6 @@ class AudioVisualizerGUI:
         self.is_beat_drop = tk.StringVar(value="No")
         self.colors = ["#FFFFFF", "#FFFFFF", "#FFFFFF", "#FFFFFF"]
 
-        self.volume_data = deque(maxlen=100)  # Data points limit for the graph
 
         # Get available audio devices
         self.devices = sd.query_devices()
@@ -167,14 +185,25 @@ class AudioVisualizerGUI:
         self.fig = Figure(figsize=(5, 3), dpi=100)
         self.ax = self.fig.add_subplot(111)
         self.ax.set_title("Volume Level Over Time")
-        self.ax.set_ylim(0, 1)  # Set y-axis limits based on expected volume level
-        self.line, = self.ax.plot([], [], 'b-')
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=root)
         self.canvas.get_tk_widget().grid(row=7, column=0, columnspan=2, pady=10)
 
+        # Blitted scope: static parts are drawn once, each frame only redraws the lines (see scope_plot.py)
+        self.scope = ScopePlot(self.canvas, self.ax, scope_ring,
+                               ['volume'] + [name for name, _, _ in SCOPE_BANDS],
+                               ['b-', 'k-', 'g-', 'm-', 'c-'])
+        self.plot_label = tk.Label(root, text="")
+        self.plot_label.grid(row=8, column=0, columnspan=2, sticky="w", padx=10)
+
+        # FFT bins of each scope band, computed once
+        freqs = np.fft.rfftfreq(CHUNK, 1.0 / RATE)
+        self.band_slices = [slice(np.searchsorted(freqs, low), np.searchsorted(freqs, high))
+                            for _, low, high in SCOPE_BANDS]
+
         # Start updating the GUI
         self.update_gui()
+        self.update_plot()
 
     def update_gui(self):
         with current_volume_level.get_lock():
@@ -192,17 +221,38 @@ class AudioVisualizerGUI:
             "No Sound"
         )
         self.is_beat_drop.set("Yes" if beat_drop else "No")
-
-        # Update the graph
-        self.volume_data.append(volume)
-        self.line.set_xdata(range(len(self.volume_data)))
-        self.line.set_ydata(self.volume_data)
-        self.ax.set_xlim(0, len(self.volume_data))
-        self.canvas.draw()
+        self.plot_label.config(text=f"Plot: {self.scope.frame_ms:.2f} ms/frame at {SCOPE_FPS} fps "
+                                    f"({self.scope.frame_ms * SCOPE_FPS / 10:.1f}% of one core)")
 
         # Continue updating every second
         self.root.after(1000, self.update_gui)
 
+    def fill_scope(self):
+        """Scope samples for the chunks captured since the last frame: volume and the strongest
+        partial in each band (amplitude, 0-1), from one rfft over all of them."""
+        new = chunk_ring.count - scope_ring.count
+        if new <= 0:
+            return
+        if new > scope_ring.capacity:  # Chunks that already left the window are skipped
+            scope_ring.count += new - scope_ring.capacity
+            new = scope_ring.capacity
+        start = scope_ring.count % chunk_ring.capacity
+        chunks = chunk_ring.data[start:start + new]
+        magnitude = np.abs(np.fft.rfft(chunks[:, 1:], axis=1))
+        samples = np.empty((new, 1 + len(SCOPE_BANDS)), dtype=np.float32)
+        samples[:, 0] = chunks[:, 0]
+        for i, band in enumerate(self.band_slices):
+            samples[:, i + 1] = magnitude[:, band].max(axis=1) * 2.0 / CHUNK
+        for sample in samples:
+            scope_ring.append(sample)
+
+    def update_plot(self):
+        self.fill_scope()
+        while scope_beats:
+            self.scope.mark(scope_beats.popleft())
+        self.scope.update()
+        self.root.after(1000 // SCOPE_FPS, self.update_plot)
+
     def start_server(self):
         threading.Thread(target=start_server, daemon=True).start()
 
@@ -0,0 +1,268 @@
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+TRACK_STORE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'track_analysis.db')
+ENVELOPE_RATE = 10  # Energy envelope samples per second of track
+MIN_RECORD_SECONDS = 30.0  # Shorter recordings (skipped tracks) aren't stored
+MIN_RECORD_BEATS = 16
+MAX_TRACK_SECONDS = 20 * 60.0  # Recording limit when the track length isn't known
+MAX_SAMPLE_GAP = 1.0  # Seconds between snapshots beyond which the gap doesn't count as heard
+MEMORY_CACHE_SIZE = 256  # Decoded tracks kept in memory
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT PRIMARY KEY,
+    tempo REAL NOT NULL,
+    covered REAL NOT NULL,  -- Seconds of the track the recording covers
+    plays INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    beats BLOB NOT NULL,    -- float32 beat positions, seconds from track start
+    energy BLOB NOT NULL,   -- uint8 volume envelope at ENVELOPE_RATE
+    drops BLOB NOT NULL     -- float32 beat drop positions
+) WITHOUT ROWID
+"""
+
+
+class TrackAnalysis:
+    """Tempo, beat grid, energy envelope and drops of one track.
+
+    Positions are seconds from the start of the track, so a stored analysis
+    lines up with any later play once the track's start time is known.
+    """
+
+    def __init__(self, track_id, tempo, beats, energy, drops, covered=None, plays=1):
+        self.track_id = track_id
+        self.tempo = float(tempo)
+        self.beats = np.asarray(beats, dtype=np.float32)
+        self.energy = np.asarray(energy, dtype=np.uint8)
+        self.drops = np.asarray(drops, dtype=np.float32)
+        self.covered = float(covered if covered is not None else len(self.energy) / ENVELOPE_RATE)
+        self.plays = plays
+
+    def beat_phase(self, position):
+        """Phase (0.0 on the beat) at a track position, None outside the beat grid."""
+        i = int(np.searchsorted(self.beats, position, side='right'))
+        if i == 0 or i >= len(self.beats):
+            return None
+        start, end = self.beats[i - 1], self.beats[i]
+        return float((position - start) / (end - start))
+
+    def next_drop(self, position):
+        i = int(np.searchsorted(self.drops, position))
+        return float(self.drops[i]) if i < len(self.drops) else None
+
+    def energy_at(self, position):
+        i = int(position * ENVELOPE_RATE)
+        return float(self.energy[i]) / 255.0 if 0 <= i < len(self.energy) else None
+
+
+class TrackStore:
+    """SQLite store of TrackAnalysis records keyed by track ID.
+
+    Arrays are stored as raw little-endian blobs (a 4 minute track is about
+    4 KB), looked up by primary key, and decoded records stay in memory so
+    repeat lookups are a dict hit. Safe to share between threads.
+    """
+
+    def __init__(self, path=TRACK_STORE_FILE):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, track_id):
+        analysis = self._cache.get(track_id)
+        if analysis is not None:
+            return analysis
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tempo, covered, plays, beats, energy, drops FROM tracks WHERE track_id = ?",
+                (track_id,)).fetchone()
+        if row is None:
+            return None
+        tempo, covered, plays, beats, energy, drops = row
+        analysis = TrackAnalysis(track_id, tempo,
+                                 np.frombuffer(beats, dtype='<f4'),
+                                 np.frombuffer(energy, dtype=np.uint8),
+                                 np.frombuffer(drops, dtype='<f4'),
+                                 covered, plays)
+        self._remember(analysis)
+        return analysis
+
+    def put(self, analysis):
+        """Store a new recording; keeps the old one if it covered more of the track."""
+        previous = self.get(analysis.track_id)
+        if previous is not None:
+            plays = previous.plays + 1
+            if previous.covered > analysis.covered:
+                analysis = previous
+            analysis.plays = plays
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (analysis.track_id, analysis.tempo, analysis.covered, analysis.plays, time.time(),
+                 analysis.beats.astype('<f4').tobytes(),
+                 analysis.energy.tobytes(),
+                 analysis.drops.astype('<f4').tobytes()))
+            self._db.commit()
+        self._remember(analysis)
+        return analysis
+
+    def _remember(self, analysis):
+        if len(self._cache) >= MEMORY_CACHE_SIZE and analysis.track_id not in self._cache:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[analysis.track_id] = analysis
+
+
+class TrackRecorder:
+    """Builds a TrackAnalysis from the analysis snapshots of one play.
+
+    Nothing past the track's duration is recorded (done turns True), and
+    heard only adds up the time between snapshots close together, so a
+    recording that outlives the track or skips through it can't claim more
+    than it has.
+    """
+
+    def __init__(self, track_id, started_at, duration=None):
+        self.track_id = track_id
+        self.started_at = started_at
+        self.duration = duration or MAX_TRACK_SECONDS
+        self.done = False
+        self.beats = []
+        self.drops = []
+        self.energy = []
+        self.heard = 0.0  # Seconds of the track covered by snapshots
+        self._position = None
+        self._beat_count = None
+        self._drop_timestamp = None
+
+    def add(self, analysis):
+        position = analysis['timestamp'] - self.started_at
+        if position < 0:
+            return
+        if position >= self.duration:
+            self.done = True
+            return
+        if self._position is not None and 0.0 < position - self._position <= MAX_SAMPLE_GAP:
+            self.heard += position - self._position
+        self._position = position
+
+        # Beats: one per beat_count step, placed back on the beat using the phase
+        if self._beat_count is not None and analysis['beat_count'] != self._beat_count and analysis['local_bpm'] > 0:
+            self.beats.append(position - analysis['beat_phase'] * 60.0 / analysis['local_bpm'])
+        self._beat_count = analysis['beat_count']
+
+        if self._drop_timestamp is not None and analysis['beat_drop_timestamp'] != self._drop_timestamp:
+            self.drops.append(analysis['beat_drop_timestamp'] - self.started_at)
+        self._drop_timestamp = analysis['beat_drop_timestamp']
+
+        # Envelope: loudest volume within each 1/ENVELOPE_RATE slot, gaps filled with silence
+        slot = int(position * ENVELOPE_RATE)
+        if slot >= len(self.energy):
+            self.energy.extend([0] * (slot + 1 - len(self.energy)))
+        level = min(int(analysis['volume_level'] * 255), 255)
+        self.energy[slot] = max(self.energy[slot], level)
+
+    def finish(self):
+        """TrackAnalysis for this play, or None if too little of it was heard."""
+        covered = min(self.heard, self.duration)
+        if covered < MIN_RECORD_SECONDS or len(self.beats) < MIN_RECORD_BEATS:
+            return None
+        beats = np.array(sorted(self.beats), dtype=np.float32)
+        tempo = 60.0 / float(np.median(np.diff(beats)))
+        return TrackAnalysis(self.track_id, tempo, beats, self.energy, self.drops, covered)
+
+
+class TrackMemory:
+    """Records the playing track and predicts beats/drops for tracks heard before.
+
+    on_track() is called when a play starts (a new track, or the same one
+    again), end_track() when playback stops or the server shuts down, and
+    each stores the finished recording. render() runs on the render loop,
+    samples the analysis snapshot and ends the play once it passes the
+    track's duration.
+    """
+
+    def __init__(self, store, analysis_state):
+        self.store = store
+        self.analysis_state = analysis_state
+        self.track_id = None
+        self.started_at = None
+        self.known = None  # TrackAnalysis from earlier plays of the current track
+        self.version = 0
+        self._recorder = None
+        self._last_sample = 0.0
+        self._lock = threading.Lock()
+
+    def on_track(self, track_id, started_at, duration=None):
+        with self._lock:
+            recorder, self._recorder = self._recorder, TrackRecorder(track_id, started_at, duration)
+            self.track_id = track_id
+            self.started_at = started_at
+            known = self.known = self.store.get(track_id)
+            self.version += 1
+        self._store(recorder)
+        return known
+
+    def end_track(self):
+        """Store the current play and stop recording (idle, end of track, shutdown)."""
+        with self._lock:
+            recorder, self._recorder = self._recorder, None
+            if recorder is None:
+                return
+            self.track_id = None
+            self.started_at = None
+            self.known = None
+            self.version += 1
+        self._store(recorder)
+
+    def _store(self, recorder):
+        if recorder is not None:
+            analysis = recorder.finish()
+            if analysis is not None:
+                self.store.put(analysis)
+
+    def render(self, now):
+        if self._recorder is None or now - self._last_sample < 1.0 / ENVELOPE_RATE:
+            return
+        self._last_sample = now
+        with self._lock:
+            recorder = self._recorder
+            if recorder is not None:
+                recorder.add(self.analysis_state.read())
+        if recorder is not None and recorder.done:
+            self.end_track()
+
+    def prediction(self, current_time=None):
+        """Stored tempo, beat phase, next drop and energy at the current position, or None."""
+        with self._lock:  # end_track() clears both, possibly from another thread
+            known, started_at = self.known, self.started_at
+        if known is None or started_at is None:
+            return None
+        if current_time is None:
+            current_time = time.time()
+        position = current_time - started_at
+        next_drop = known.next_drop(position)
+        return {
+            'track_id': known.track_id,
+            'plays': known.plays,
+            'tempo': known.tempo,
+            'position': position,
+            'beat_phase': known.beat_phase(position),
+            'next_drop_in': next_drop - position if next_drop is not None else None,
+            'energy': known.energy_at(position),
+        }
@@ -0,0 +1,154 @@
+"""Fixed-layout binary status packets over UDP for microcontroller clients.
+
+Packet layout (little-endian, 44 bytes):
+
+    offset  size  field
+    0       2     magic b'GL'
+    2       1     protocol version (1)
+    3       1     flags, bit 0 = beat drop
+    4       4     sequence number (uint32, wraps)
+    8       8     timestamp in microseconds since the epoch (uint64)
+    16      4     bpm (float32)
+    20      4     volume level (float32)
+    24      1     energy level (int8, -1 = no sound .. 3 = high)
+    25      1     current mode (uint8)
+    26      2     reserved, zero
+    28      16    strip colors, 4 x uint32 0x00RRGGBB
+
+Run this file directly for a loopback check of sender and decoder.
+"""
+import socket
+import struct
+import threading
+import time
+
+MAGIC = b'GL'
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 7777
+FLAG_BEAT_DROP = 0x01
+
+PACKET = struct.Struct('<2sBBIQffbBH4I')
+
+
+def encode_packet(sequence, timestamp, bpm, volume, energy_level, is_beat_drop, mode, colors):
+    flags = FLAG_BEAT_DROP if is_beat_drop else 0
+    return PACKET.pack(
+        MAGIC, PROTOCOL_VERSION, flags, sequence & 0xFFFFFFFF, int(timestamp * 1e6),
+        bpm, volume, energy_level, mode & 0xFF, 0, *colors[:4],
+    )
+
+
+def decode_packet(data):
+    """Reference decoder. Raises ValueError for anything that isn't a valid packet."""
+    if len(data) != PACKET.size:
+        raise ValueError(f"Bad packet length {len(data)}, expected {PACKET.size}")
+    magic, version, flags, sequence, timestamp_us, bpm, volume, energy, mode, _, *colors = PACKET.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f"Bad magic {magic!r}")
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version {version}")
+    return {
+        'sequence': sequence,
+        'timestamp': timestamp_us / 1e6,
+        'bpm': bpm,
+        'volume_level': volume,
+        'energy_level': energy,
+        'is_beat_drop': flags & FLAG_BEAT_DROP,
+        'current_mode': mode,
+        'colors': colors,
+    }
+
+
+class UdpTelemetrySender:
+    """Sends one packet per analysis frame to a list of unicast/broadcast targets.
+
+    With a registry (discovery.FixtureRegistry) the packet is also sent to
+    every discovered fixture: it is encoded once and the same socket sends
+    it to each target in turn.
+    """
+
+    def __init__(self, targets, broadcast=False, registry=None):
+        self.targets = list(targets)
+        self.registry = registry
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if broadcast:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.setblocking(False)
+
+    def send(self, **fields):
+        packet = encode_packet(self.sequence, **fields)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        targets = self.targets
+        if self.registry is not None:
+            targets = targets + list(self.registry.targets())
+        for target in targets:
+            try:
+                self.sock.sendto(packet, target)
+                self.sent += 1
+            except OSError:  # Including BlockingIOError
+                # Never stall the sender on one slow or unreachable target
+                self.dropped += 1
+        return packet
+
+    def close(self):
+        self.sock.close()
+
+
+def run_udp_telemetry(sender, get_fields, get_version, poll_interval=0.002, stop_event=None):
+    """Send a packet every time get_version() changes (i.e. once per analysis frame)."""
+    last_version = None
+    while stop_event is None or not stop_event.is_set():
+        version = get_version()
+        if version != last_version:
+            last_version = version
+            sender.send(**get_fields())
+        else:
+            time.sleep(poll_interval)
+
+
+# Loopback harness: send synthetic frames to ourselves and check what arrives
+def _loopback_check(frames=2000, rate=200.0):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1.0)
+    sender = UdpTelemetrySender([receiver.getsockname()])
+
+    received = []
+
+    def receive():
+        while len(received) < frames:
+            try:
+                data, _ = receiver.recvfrom(2048)
+            except socket.timeout:
+                return
+            received.append((time.time(), decode_packet(data)))
+
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+
+    start = time.time()
+    for i in range(frames):
+        sender.send(timestamp=time.time(), bpm=128.0, volume=(i % 100) / 100.0, energy_level=i % 5 - 1,
+                    is_beat_drop=i % 50 == 0, mode=i % 14, colors=[i & 0xFFFFFF, 0xFF0000, 0x00FF00, 0x0000FF])
+        time.sleep(max(0.0, start + (i + 1) / rate - time.time()))
+    thread.join()
+
+    sequences = [packet['sequence'] for _, packet in received]
+    latencies = sorted(arrival - packet['timestamp'] for arrival, packet in received)
+    out_of_order = sum(1 for a, b in zip(sequences, sequences[1:]) if b <= a)
+    print(f"Packet size: {PACKET.size} bytes")
+    print(f"Sent {frames}, received {len(received)}, lost {frames - len(received)}, out of order {out_of_order}")
+    if latencies:
+        print(f"Latency median {latencies[len(latencies) // 2] * 1e3:.3f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e3:.3f} ms")
+    sender.close()
+    receiver.close()
+    return len(received) == frames and out_of_order == 0
+
+
+if __name__ == '__main__':
+    ok = _loopback_check()
+    print("Loopback OK" if ok else "Loopback FAILED")